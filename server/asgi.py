@@ -0,0 +1,25 @@
+"""
+ASGI apps of the servers, created by factories so that uvicorn can start them in each worker process:
+
+    SERVER_MODE=production SERVER_WORKERS=4 python -m server.start_copilot_server
+    uvicorn --factory server.asgi:create_copilot_app --workers 4 --port 4001
+
+The servers are imported by their factory only, so that a worker doesn't load the others.
+"""
+import os
+
+
+def create_web_creator_app():
+    from server.web_creator_server import WebCreator
+    return WebCreator().asgi_app()
+
+
+def create_copilot_app():
+    from server.copilot_server import CopilotServer
+    return CopilotServer().asgi_app()
+
+
+def create_playground_app():
+    from server.playground_server import PlaygroundServer
+    # The URL of the proxied website comes from the environment, which the worker processes inherit
+    return PlaygroundServer(os.environ['PLAYGROUND_URL']).asgi_app()
@@ -0,0 +1,46 @@
+import os
+import pickle
+import shutil
+import zlib
+
+from server.shared.cache import MISSING, DiskStore
+
+# Bump when the layout of checkpoints changes so that old ones aren't resumed from
+CHECKPOINT_VERSION = 1
+
+CHECKPOINTS_FOLDER_NAME = 'checkpoints'
+
+
+class CheckpointStore(DiskStore):
+    """
+    The results of the completed steps of a pipeline run, one file per step, so that a failed run can be resumed
+    from them. Results are pickled, which keeps bytes as they are and handles dataclasses, and compressed.
+    """
+
+    def __init__(self, folder):
+        super().__init__(folder, suffix='.pkl.z')
+
+    def _path(self, key):
+        return os.path.join(self.folder, f"{key}{self.suffix}")
+
+    def save(self, step_id, step_type, config, result):
+        self.put(step_id, {"version": CHECKPOINT_VERSION, "type": step_type, "config": config, "result": result})
+
+    def restore(self, step_id, step_type, config):
+        """Return the checkpointed result of the step, or MISSING if there is none for this step type and config."""
+        checkpoint = self.get(step_id)
+        if checkpoint is None or checkpoint.get("version") != CHECKPOINT_VERSION:
+            return MISSING
+        if checkpoint.get("type") != step_type or checkpoint.get("config") != config:
+            return MISSING
+        return checkpoint["result"]
+
+    def load(self, f):
+        return pickle.loads(zlib.decompress(f.read()))
+
+    def dump(self, value, f):
+        # The fastest level: most of the size is in images, which are compressed already
+        f.write(zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 1))
+
+    def clear(self):
+        shutil.rmtree(self.folder, ignore_errors=True)
@@ -1,23 +1,108 @@
+import asyncio
 import base64
 import random
 import string
 import json
 
 import os
+import time
 from datetime import datetime
 
-from flask import Flask, Response, request, jsonify, make_response, send_from_directory
+from aioflask import Flask
+from flask import Response, request, jsonify, make_response, send_from_directory
 
 from flask_cors import CORS
 
-from server.shared.llm import LlmClient, ModelType, parse_markdown_output
+from server.shared.html_compaction import HtmlCompactor
+from server.shared.llm import AsyncLlmClient, ModelType, parse_markdown_output
+from server.shared.rate_limiter import Priority
+from server.shared.serving import AsgiApp, serve
+from server.shared.telemetry import RequestTimings, telemetry_scope
+
+# Open the connections to the LLM deployments when the server starts rather than on the first request
+COPILOT_WARM_UP = os.getenv('COPILOT_WARM_UP', 'true').lower() == 'true'
+# Compact the context HTML before sending it to the LLM; suggestions can also be limited to a number of tokens
+COPILOT_HTML_COMPACTION = os.getenv('COPILOT_HTML_COMPACTION', 'true').lower() == 'true'
+COPILOT_SUGGESTIONS_MAX_TOKENS = int(os.getenv('COPILOT_SUGGESTIONS_MAX_TOKENS', 0)) or None
+
+# The system prompts are static and sent first, so the upstream prompt cache can reuse them as a common prefix
+COPILOT_SYSTEM_PROMPT = """You are a professional web developer.
+You are given a task to make changes to the provided HTML.
+
+You MUST use inline CSS for any styling changes.Do not use tags or classes.
+You MUST output only the modified version of the HTML.
+
+Do not change image URLs.
+Do not make unnecessary changes.
+
+Use !important in generated inline CSS rules.
+Try to avoid changing the structure of the HTML.
+Keep the <!--hash:...--> comments and hash:// URLs as they are."""
+
+SUGGESTIONS_SYSTEM_PROMPT = """You are a professional web designer expected to output suggestions for improving the provided HTML.
+
+Do not suggest changes that would require changing JavaScript.
+Do not suggest to change URLs or links.
+Do not suggest refactoring or restructuring the HTML or CSS.
+Do not suggest animations or dynamic effects.
+Do not use the same suggestion twice.
+Do not offer suggestions that are too similar to each other.
+Do not offer empty suggestions.
+Do not put commas at the end of suggestions.
+
+Do not output any bullet points or lists.
+Do not use markdown.
+
+Each suggestion should be up to 12 words.
+Use imperative language.
+Start each sentence with a verb (e.g., "Make the button blue").
+
+You MUST output suggestions in JSON format as follows:
+{
+    "suggestions": [
+        "Suggestion 1",
+        "Suggestion 2",
+        "Suggestion 3"
+    ]
+}"""
+
+AUTOCOMPLETE_SYSTEM_PROMPT = """You are a text completion model.
+Complete the given sentences with a coherent and appropriate continuation.
+Keep the same style and tone as the input.
+Keep the output as short as possible.
+Output only the completion part of the sentence.
+Use web design and linguistic vocabulary and concepts.
+Complete sentences in a way that is relevant to the context.
+
+Example 1:
+Input: "Translate the text into"
+Output: " French."
+
+Example 2:
+Input: "Translate the text into "
+Output: "French."
+
+Example 3:
+Input: "Make the background color of the button"
+Output: " blue.\""""
 
 
 class CopilotServer:
     def __init__(self):
         self.app = Flask(__name__)
         self._register_routes()
-        CORS(self.app)
+        CORS(self.app, expose_headers=['Server-Timing'])
+
+        # The clients are stateless between calls, so one per role serves all requests; the views await them,
+        # so waiting for the LLM doesn't hold a thread
+        self.copilot_llm = AsyncLlmClient(ModelType.GPT_4_OMNI, system_prompt=COPILOT_SYSTEM_PROMPT, priority=Priority.INTERACTIVE)
+        self.suggestions_llm = AsyncLlmClient(ModelType.GPT_4_OMNI, system_prompt=SUGGESTIONS_SYSTEM_PROMPT, priority=Priority.INTERACTIVE, hedge_model=ModelType.GPT_4_MINI)
+        self.autocomplete_llm = AsyncLlmClient(ModelType.GPT_35_TURBO, system_prompt=AUTOCOMPLETE_SYSTEM_PROMPT, priority=Priority.INTERACTIVE, hedge=True)
+
+        # The copilot's output replaces the context, so it must never be truncated
+        self.copilot_compactor = HtmlCompactor() if COPILOT_HTML_COMPACTION else None
+        self.suggestions_compactor = HtmlCompactor(max_tokens=COPILOT_SUGGESTIONS_MAX_TOKENS) if COPILOT_HTML_COMPACTION else None
+        self.warm_up_task = None
 
     def _register_routes(self):
         self.app.add_url_rule('/ok', view_func=self.ok, methods=['GET'])
@@ -33,9 +118,30 @@ class CopilotServer:
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
-    def process_copilot_request(self):
+    @staticmethod
+    def _timed_response(timings, body, status=200):
+        response = make_response(jsonify(body), status)
+        response.headers['Server-Timing'] = timings.header()
+        return response
+
+    @staticmethod
+    def _compact(compactor, html, timings):
+        """Compact the context HTML, reporting the size reduction in the logs and the Server-Timing header."""
+        if compactor is None or not html:
+            return None
+        started_at = time.monotonic()
+        compacted = compactor.compact(html)
+        stats = compacted.stats()
+        timings.add('compaction', time.monotonic() - started_at, f"{stats['reduction']:.0%} smaller")
+        print(f"Compacted the context HTML from {stats['original_size']} to {stats['compacted_size']} characters "
+              f"({stats['reduction']:.0%} smaller, ~{stats['tokens_saved']} tokens saved{', truncated' if stats['truncated'] else ''})")
+        return compacted
+
+    async def process_copilot_request(self):
+        timings = RequestTimings()
         try:
-            data = request.get_json()
+            with timings.measure('parse', 'Parsing the request'):
+                data = request.get_json()
 
             prompt = data.get('prompt')
             context_html = data.get('context')
@@ -47,53 +153,43 @@ class CopilotServer:
             # for selected_html in selected_htmls:
             #     print(f'Selection HTML: {selected_html}')
 
-            # Create the screenshots directory if it doesn't exist
-            screenshots_dir = 'screenshots'
-            if not os.path.exists(screenshots_dir):
-                os.makedirs(screenshots_dir)
+            with timings.measure('screenshot', 'Saving the screenshot'):
+                # Create the screenshots directory if it doesn't exist
+                screenshots_dir = 'screenshots'
+                if not os.path.exists(screenshots_dir):
+                    os.makedirs(screenshots_dir)
 
-            # Decode the base64 image
-            if screenshot_data_url:
-                header, encoded = screenshot_data_url.split(',', 1)
-                screenshot_data = base64.b64decode(encoded)
+                # Decode the base64 image
+                if screenshot_data_url:
+                    header, encoded = screenshot_data_url.split(',', 1)
+                    screenshot_data = base64.b64decode(encoded)
 
-                # Generate a filename with date and time
-                current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
-                random_string = ''.join(random.choices(string.ascii_lowercase + string.digits, k=5))
-                filename = f'screenshot_{current_time}_{random_string}.png'
-                screenshot_path = os.path.join(screenshots_dir, filename)
+                    # Generate a filename with date and time
+                    current_time = datetime.now().strftime('%Y%m%d_%H%M%S')
+                    random_string = ''.join(random.choices(string.ascii_lowercase + string.digits, k=5))
+                    filename = f'screenshot_{current_time}_{random_string}.png'
+                    screenshot_path = os.path.join(screenshots_dir, filename)
 
-                # Save the screenshot to a file
-                with open(screenshot_path, 'wb') as screenshot_file:
-                    screenshot_file.write(screenshot_data)
+                    # Save the screenshot to a file
+                    with open(screenshot_path, 'wb') as screenshot_file:
+                        screenshot_file.write(screenshot_data)
 
-                print(f'Screenshot saved at: {screenshot_path}')
-            else:
-                print('No screenshot data received')
-
-            system_prompt = f"""
-                You are a professional web developer.
-                You are given a task to make changes to the provided HTML.
-                
-                You MUST use inline CSS for any styling changes.Do not use tags or classes.
-                You MUST output only the modified version of the HTML.            
-                
-                Do not change image URLs.
-                Do not make unnecessary changes.
-                
-                Use !important in generated inline CSS rules.
-                Try to avoid changing the structure of the HTML.
-            """
+                    print(f'Screenshot saved at: {screenshot_path}')
+                else:
+                    print('No screenshot data received')
 
-            llm = LlmClient(ModelType.GPT_4_OMNI, system_prompt=system_prompt)
+            compacted_html = self._compact(self.copilot_compactor, context_html, timings)
+            if compacted_html is not None:
+                context_html = compacted_html.html
 
+            # The page comes before the requested changes, so that consecutive changes to a page share the prefix
             prompt = f"""
-                For the provided HTML, make the following changes:
-                
-                {prompt}
-                
                 ```HTML```:
                 {context_html}
+
+                For the provided HTML, make the following changes:
+
+                {prompt}
             """
 
             print(f'Prompt: {prompt}')
@@ -103,116 +199,85 @@ class CopilotServer:
             else:
                 image_list = []
 
-            llm_response = llm.get_completions(prompt, image_list=image_list, temperature=0.0)
+            with telemetry_scope(timings=timings):
+                llm_response = await self.copilot_llm.get_completions(prompt, image_list=image_list, temperature=0.0)
 
-            new_html = parse_markdown_output(llm_response, lang='html')
+            with timings.measure('postprocess', 'Parsing the LLM response'):
+                new_html = parse_markdown_output(llm_response, lang='html')
+                if compacted_html is not None:
+                    new_html = compacted_html.restore(new_html)
 
-            return jsonify({"html": new_html})
+            return self._timed_response(timings, {"html": new_html})
         except Exception as e:
             print(e)
-            return jsonify({"error": str(e)}), 400
+            return self._timed_response(timings, {"error": str(e)}, 400)
 
-    def suggest_prompts(self):
+    async def suggest_prompts(self):
+        timings = RequestTimings()
         try:
-            data = request.get_json()
+            with timings.measure('parse', 'Parsing the request'):
+                data = request.get_json()
             context_html = data.get('context')
 
             print(f'Context HTML: {context_html}')
 
-            system_prompt = """
-                You are a professional web designer expected to output suggestions for improving the provided HTML.
-
-                Do not suggest changes that would require changing JavaScript.
-                Do not suggest to change URLs or links.
-                Do not suggest refactoring or restructuring the HTML or CSS.
-                Do not suggest animations or dynamic effects.
-                Do not use the same suggestion twice.
-                Do not offer suggestions that are too similar to each other.
-                Do not offer empty suggestions.
-                Do not put commas at the end of suggestions.
-
-                Do not output any bullet points or lists.
-                Do not use markdown.
-
-                Each suggestion should be up to 12 words.
-                Use imperative language.
-                Start each sentence with a verb (e.g., "Make the button blue").
-
-                You MUST output suggestions in JSON format as follows:
-                {
-                    "suggestions": [
-                        "Suggestion 1",
-                        "Suggestion 2",
-                        "Suggestion 3"
-                    ]
-                }
-            """
-
-            llm = LlmClient(ModelType.GPT_4_OMNI, system_prompt=system_prompt)
+            compacted_html = self._compact(self.suggestions_compactor, context_html, timings)
+            if compacted_html is not None:
+                context_html = compacted_html.html
 
             prompt = f"""
                 Based on the provided HTML, suggest 3 changes to improve the visual appearance, layout, and styling.
-                
+
                 {context_html}
             """
 
             print(f'Prompt: {prompt}')
 
-            llm_response = llm.get_completions(prompt, json_output=True, max_tokens=512)
-            json_response = json.loads(llm_response)
-            suggestions = json_response.get('suggestions', [])
+            with telemetry_scope(timings=timings):
+                llm_response = await self.suggestions_llm.get_completions(prompt, json_output=True, max_tokens=512)
+
+            with timings.measure('postprocess', 'Parsing the LLM response'):
+                json_response = json.loads(llm_response)
+                suggestions = json_response.get('suggestions', [])
 
-            return jsonify({"suggestions": suggestions})
+            return self._timed_response(timings, {"suggestions": suggestions})
 
         except Exception as e:
             print(e)
-            return jsonify({"error": str(e)}), 400
+            return self._timed_response(timings, {"error": str(e)}, 400)
 
-    def autocomplete(self):
+    async def autocomplete(self):
+        timings = RequestTimings()
         try:
-            data = request.get_json()
+            with timings.measure('parse', 'Parsing the request'):
+                data = request.get_json()
             prompt = data.get('prompt')
             print(f'Prompt: {prompt}')
 
-            system_prompt = """
-                        You are a text completion model.
-                        Complete the given sentences with a coherent and appropriate continuation.
-                        Keep the same style and tone as the input.
-                        Keep the output as short as possible.
-                        Output only the completion part of the sentence.
-                        Use web design and linguistic vocabulary and concepts.
-                        Complete sentences in a way that is relevant to the context.
-                        
-                        Example 1:
-                        Input: "Translate the text into"
-                        Output: " French."
-
-                        Example 2:
-                        Input: "Translate the text into "
-                        Output: "French."
-
-                        Example 3:
-                        Input: "Make the background color of the button"
-                        Output: " blue."
-                    """
-            llm = LlmClient(ModelType.GPT_35_TURBO, system_prompt=system_prompt)
-
             prompt = f"""
                         Complete the following sentence:
-            
+
                         {prompt}
                     """
 
-            llm_response = llm.get_completions(prompt)
+            with telemetry_scope(timings=timings):
+                llm_response = await self.autocomplete_llm.get_completions(prompt)
 
             # Assuming the response is a single completed sentence
             completion = llm_response.strip()
 
             print(f'Completion: {completion}')
-            return jsonify({"suggestion": completion})
+            return self._timed_response(timings, {"suggestion": completion})
         except Exception as e:
-            return jsonify({"error": str(e)}), 400
+            return self._timed_response(timings, {"error": str(e)}, 400)
+
+    async def start(self):
+        if COPILOT_WARM_UP:
+            # Not awaited, so that the server takes requests while the connections open
+            self.warm_up_task = asyncio.gather(*[llm.warm_up() for llm in (self.copilot_llm, self.suggestions_llm, self.autocomplete_llm)])
 
+    def asgi_app(self):
+        return AsgiApp(self.app, on_startup=[self.start])
 
     def run(self, host="0.0.0.0", port=4002):
-        self.app.run(host=host, port=port, debug=True)
+        serve(self.asgi_app(), host=host, port=port, workers=1)
@@ -4,7 +4,8 @@ from typing import Dict, Any
 from dataclasses import dataclass
 
 from server.pipeline_step import PipelineStep
-from server.shared.llm import LlmClient, ModelType, parse_markdown_output
+from server.shared.image import ImageHandle
+from server.shared.llm import AsyncLlmClient, ModelType, parse_markdown_output
 
 
 @dataclass
@@ -13,6 +14,8 @@ class AestheticScoreResult:
 
 
 class ComputeAestheticScoreStep(PipelineStep):
+    circuit_breaker = 'llm'
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
@@ -28,7 +31,7 @@ class ComputeAestheticScoreStep(PipelineStep):
     def get_description() -> str:
         return "Compute the aesthetic score of a website from a screenshot."
 
-    async def process(self, screenshot: bytes, **kwargs) -> AestheticScoreResult:
+    async def process(self, screenshot: ImageHandle, **kwargs) -> AestheticScoreResult:
         self.push_update("Starting aesthetic score computation...")
 
         # Formulate the prompt for LLM
@@ -95,8 +98,8 @@ class ComputeAestheticScoreStep(PipelineStep):
 
         # Call the LLM with the prompt
         self.push_update("Querying LLM for aesthetic score analysis...")
-        llm = LlmClient(model=ModelType.GPT_4_OMNI)
-        llm_response = llm.get_completions(prompt, temperature=0.0, image_list=[screenshot])
+        llm = AsyncLlmClient(model=ModelType.GPT_4_OMNI)
+        llm_response = await llm.get_completions(prompt, temperature=0.0, image_list=[screenshot])
 
         # Parse the JSON output from LLM
         self.push_update("Parsing LLM response...")
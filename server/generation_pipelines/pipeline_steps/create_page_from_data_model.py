@@ -15,6 +15,9 @@ class StepResult:
 
 
 class CreatePageFromDataModelStep(PipelineStep):
+    # Writes the page into the job folder
+    cacheable = False
+
     def __init__(self, job_id: str, job_folder: str, **kwargs):
         super().__init__(**kwargs)
         self.job_id = job_id
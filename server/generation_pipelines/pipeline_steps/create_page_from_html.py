@@ -14,6 +14,9 @@ class CreatedPage:
     url: str
 
 class CreatePageFromHtmlStep(PipelineStep):
+    # Writes the page into the job folder
+    cacheable = False
+
     def __init__(self, job_id: str, job_folder: str, **kwargs: Any):
         super().__init__(**kwargs)
         self.job_id = job_id
@@ -9,6 +9,8 @@ class HtmlResult:
 
 
 class FetchHtmlStep(PipelineStep):
+    circuit_breaker = 'browser'
+
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
@@ -3,14 +3,14 @@ from dataclasses import dataclass
 from bs4 import BeautifulSoup
 
 from server.pipeline_step import PipelineStep
-from server.shared.image import crop_and_downscale_image
-from server.shared.llm import LlmClient, ModelType, parse_markdown_output
+from server.shared.image import ImageHandle, crop_and_downscale_image
+from server.shared.llm import AsyncLlmClient, ModelType, parse_markdown_output
 from server.shared.scraper import WebScraper
 
 
 @dataclass
 class ScreenshotResult:
-    screenshot: bytes
+    screenshot: ImageHandle
 
 
 def get_buttons_and_links_with_essential_attributes(html_content: str) -> list[str]:
@@ -53,6 +53,10 @@ def get_buttons_and_links_with_essential_attributes(html_content: str) -> list[s
 
 
 class FetchScreenshotStep(PipelineStep):
+    # Writes the screenshot into the job folder; the scrape cache already spares reloading an unchanged page
+    cacheable = False
+    circuit_breaker = 'browser'
+
     def __init__(self, job_folder: str, max_width: int = 1024, max_height: int = 1024, **kwargs):
         super().__init__(**kwargs)
         print(f"max_width: {max_width}, max_height: {max_height}")
@@ -78,42 +82,48 @@ class FetchScreenshotStep(PipelineStep):
 
         scraper = WebScraper()
 
-        self.push_update(f"Fetching HTML content from {website_url}...")
-        html_content = await scraper.get_html(website_url)
+        # The browser goes back to the pool before the LLM call, so a slow call doesn't hold one of the pooled browsers
+        async with scraper.snapshot(website_url) as snapshot:
+            self.push_update(f"Fetching HTML content from {website_url}...")
+            html_content = await snapshot.html()
+            original_screenshot = await snapshot.screenshot()
 
         self.push_update("Cleaning HTML content for LLM processing...")
         compressed_html = '\n'.join(get_buttons_and_links_with_essential_attributes(html_content))
 
         self.push_update("Identifying consent button using LLM...")
-        llm = LlmClient(model=ModelType.GPT_4_OMNI)
+        llm = AsyncLlmClient(model=ModelType.GPT_4_OMNI)
 
         prompt = f"""
         Identify the CSS selector for the consent button in the following HTML code.
-        
+    
         The button usually performs actions like:
         - Accepting cookies
         - Agreeing to terms or conditions
         - Closing privacy pop-ups
-        
+    
         It might include text such as:
         - "Accept"
         - "Agree"
         - "Consent"
         - "OK"
         - Similar terms
-        
+    
         **Output**: Provide only the CSS selector as plain text.
-        
+    
         ### HTML Code ###
         {compressed_html}
         """
 
-        llm_response = llm.get_completions(prompt, temperature=0.0)
-        consent_button_selector = parse_markdown_output(llm_response, lang='css')
+        llm_response = await llm.get_completions(prompt, temperature=0.0)
+        consent_button_selector = parse_markdown_output(llm_response, lang='css').strip()
         self.push_update(f"Identified consent button selector: {consent_button_selector}")
 
-        self.push_update("Taking screenshot and cropping the image...")
-        original_screenshot = await scraper.get_screenshot(website_url, consent_popup_button_selector=consent_button_selector)
+        # The page is only loaded again to take the screenshot with the consent popup closed
+        if consent_button_selector:
+            self.push_update("Taking screenshot after clicking the consent button...")
+            async with scraper.snapshot(website_url, consent_popup_button_selector=consent_button_selector) as snapshot:
+                original_screenshot = await snapshot.screenshot()
 
         self.push_update(f"Resizing the image to a maximum of {self.max_width}x{self.max_height}...")
         screenshot = crop_and_downscale_image(original_screenshot, max_width=self.max_width, max_height=self.max_height, crop=True)
@@ -123,4 +133,4 @@ class FetchScreenshotStep(PipelineStep):
             f.write(screenshot)
 
         self.push_update("Screenshot saved and process completed.")
-        return ScreenshotResult(screenshot=screenshot)
+        return ScreenshotResult(screenshot=ImageHandle(screenshot, mime_type="image/png"))
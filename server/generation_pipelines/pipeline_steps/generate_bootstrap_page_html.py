@@ -2,6 +2,7 @@ from dataclasses import dataclass
 from typing import Dict, Any
 
 from server.pipeline_step import PipelineStep
+from server.shared.image import ImageHandle
 from server.shared.llm import LlmClient, ModelType, parse_markdown_output
 
 
@@ -11,6 +12,10 @@ class GeneratedHtml:
 
 
 class GenerateBootstrapPageHtmlStep(PipelineStep):
+    # The generated HTML references images in the job folder
+    cacheable = False
+    circuit_breaker = 'llm'
+
     def __init__(self, job_folder: str, **kwargs: Any):
         super().__init__(**kwargs)
         self.job_folder = job_folder
@@ -32,7 +37,7 @@ class GenerateBootstrapPageHtmlStep(PipelineStep):
             text_content: str,
             images: Dict[str, str],
             captions: Dict[str, str],
-            screenshot: bytes,
+            screenshot: ImageHandle,
             **kwargs: Any
     ) -> GeneratedHtml:
         try:
@@ -82,7 +87,7 @@ class GenerateBootstrapPageHtmlStep(PipelineStep):
 
             # Initialize LLM client and get the HTML response
             client = LlmClient(model=ModelType.GPT_4_OMNI)
-            llm_response = client.get_completions(prompt, temperature=1.0, image_list=[screenshot])
+            llm_response = client.get_completions(prompt, temperature=1.0, image_list=[screenshot], on_progress=self.stream_progress("Generating HTML..."))
 
             # Parse the LLM output for HTML
             html = parse_markdown_output(llm_response, lang='html')
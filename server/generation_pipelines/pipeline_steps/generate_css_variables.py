@@ -3,7 +3,8 @@ from dataclasses import dataclass
 from server.generation_pipelines.pipeline_steps.generate_css_vars import css_variables, generate_css_vars
 from server.pipeline_step import PipelineStep
 import json
-from server.shared.llm import parse_markdown_output, LlmClient, ModelType
+from server.shared.image import ImageHandle
+from server.shared.llm import parse_markdown_output, AsyncLlmClient, ModelType
 
 
 @dataclass
@@ -12,6 +13,8 @@ class StepResult:
 
 
 class GenerateCssVariablesStep(PipelineStep):
+    circuit_breaker = 'llm'
+
     @staticmethod
     def get_type() -> str:
         return "generate_css_variables"
@@ -24,7 +27,7 @@ class GenerateCssVariablesStep(PipelineStep):
     def get_description() -> str:
         return "Infers CSS variables from a screenshot and generates CSS variables based on the inferred values."
 
-    async def process(self, screenshot: bytes, **kwargs) -> StepResult:
+    async def process(self, screenshot: ImageHandle, **kwargs) -> StepResult:
         self.push_update("Inferring CSS variables from screenshot...")
 
         try:
@@ -41,8 +44,8 @@ class GenerateCssVariablesStep(PipelineStep):
 
                 Provide the JSON response with the inferred values.
             """
-            client = LlmClient(model=ModelType.GPT_4_OMNI)
-            inferred_values_response = client.get_completions(infer_values_prompt, temperature=0.0, json_output=True, image_list=[screenshot])
+            client = AsyncLlmClient(model=ModelType.GPT_4_OMNI)
+            inferred_values_response = await client.get_completions(infer_values_prompt, temperature=0.0, json_output=True, image_list=[screenshot])
             inferred_values = json.loads(parse_markdown_output(inferred_values_response, lang='json'))
 
             self.push_update("Generating CSS variables...")
@@ -1,4 +1,3 @@
-from concurrent.futures import ThreadPoolExecutor, as_completed
 from dataclasses import dataclass
 from typing import Dict, Any
 from PIL import Image
@@ -6,7 +5,8 @@ import base64
 import io
 
 from server.pipeline_step import StepResultDict, PipelineStep
-from server.shared.llm import LlmClient, ModelType
+from server.shared.llm import AsyncLlmClient, ModelType
+from server.shared.rate_limiter import Priority
 
 
 def resize_image(image_data: str, max_size=(128, 128)) -> str:
@@ -45,25 +45,14 @@ def resize_image(image_data: str, max_size=(128, 128)) -> str:
         raise e
 
 
-def generate_caption_for_image(image_hash: str, data_url: str, llm) -> Dict[str, str]:
-    print(f"Generating caption for image {image_hash}...")
-
-    resized_image_url = resize_image(data_url)
-
-    prompt = "Please provide a concise caption for the image below:"
-    caption = llm.get_completions(prompt, image_list=[resized_image_url])
-
-    print(f"Generated caption for image {image_hash}: {caption}")
-
-    return {image_hash: caption.strip()}
-
-
 @dataclass
 class ImageCaptions:
     captions: StepResultDict[str]
 
 
 class GenerateImageCaptionsStep(PipelineStep):
+    circuit_breaker = 'llm'
+
     @staticmethod
     def get_type() -> str:
         return "generate_image_captions"
@@ -76,27 +65,33 @@ class GenerateImageCaptionsStep(PipelineStep):
     def get_description() -> str:
         return "Generate captions for the provided images."
 
-    def process(self, images: Dict[str, str]) -> ImageCaptions:
+    async def process(self, images: Dict[str, str]) -> ImageCaptions:
         self.push_update("Starting image caption generation...")
 
         captions = {}
-        llm = LlmClient(model=ModelType.GPT_4_OMNI)
-
-        self.push_update("Submitting tasks to generate captions for each image...")
-
-        with ThreadPoolExecutor() as executor:
-            future_to_image = {
-                executor.submit(generate_caption_for_image, image_hash, data_url, llm): image_hash
-                for image_hash, data_url in images.items()
-            }
-
-            for future in as_completed(future_to_image):
-                try:
-                    result = future.result()
-                    captions.update(result)
-                except Exception as e:
-                    print(f"Error generating caption: {e}")
-                    self.push_update(f"Error generating caption for an image: {e}")
+        llm = AsyncLlmClient(model=ModelType.GPT_4_OMNI, priority=Priority.BATCH)
+
+        self.push_update("Submitting requests to generate captions for each image...")
+
+        prompt = "Please provide a concise caption for the image below:"
+        image_hashes = []
+        requests = []
+        for image_hash, data_url in images.items():
+            try:
+                requests.append({"prompt": prompt, "image_list": [resize_image(data_url)]})
+                image_hashes.append(image_hash)
+            except Exception as e:
+                self.push_update(f"Error generating caption for an image: {e}")
+
+        results = await llm.batch_completions(requests, return_exceptions=True)
+
+        for image_hash, result in zip(image_hashes, results):
+            if isinstance(result, Exception):
+                print(f"Error generating caption: {result}")
+                self.push_update(f"Error generating caption for an image: {result}")
+            else:
+                print(f"Generated caption for image {image_hash}: {result}")
+                captions[image_hash] = result.strip()
 
         self.push_update("Image caption generation completed.")
 
@@ -2,13 +2,15 @@ from dataclasses import dataclass
 
 from server.pipeline_step import PipelineStep
 from typing import List
-from server.shared.llm import LlmClient, ModelType
+from server.shared.llm import AsyncLlmClient, ModelType
 
 @dataclass
 class StepResult:
     page_content: str
 
 class GeneratePageContentStep(PipelineStep):
+    circuit_breaker = 'llm'
+
     @staticmethod
     def get_type() -> str:
         return "generate_page_content"
@@ -42,8 +44,8 @@ class GeneratePageContentStep(PipelineStep):
             
                 Begin your response with the crafted content for the web page.
                 '''
-            client = LlmClient(model=ModelType.GPT_4_OMNI)
-            page_content = client.get_completions(prompt, temperature=0.0)
+            client = AsyncLlmClient(model=ModelType.GPT_4_OMNI)
+            page_content = await client.get_completions(prompt, temperature=0.0)
 
             return StepResult(page_content=page_content)
 
@@ -7,7 +7,8 @@ import json
 from typing import Dict
 from jsonschema.validators import validate
 from server.shared.dalle import DalleClient
-from server.shared.llm import LlmClient, ModelType, parse_markdown_output
+from server.shared.image import ImageHandle
+from server.shared.llm import AsyncLlmClient, ModelType, parse_markdown_output
 
 def generate_dalle_image(dalle, prompt, url_mapping, job_folder):
     data_url = dalle.generate_image(prompt)
@@ -23,6 +24,8 @@ def background_image_generator(dalle, url_mapping, job_folder):
           prompt:
             type: string
             description: The prompt for generating the image.
+        timeout: 90
+        max_concurrency: 2
         returns:
           type: string
           description: The image URL generated based on the prompt.
@@ -36,6 +39,10 @@ class StepResult:
     data_model: str
 
 class GeneratePageDataModelStep(PipelineStep):
+    # The data model references images in the job folder and the generated images are added to the inputs
+    cacheable = False
+    circuit_breaker = 'llm'
+
     def __init__(self, job_folder: str, **kwargs):
         super().__init__(**kwargs)
         self.job_folder = job_folder
@@ -52,7 +59,7 @@ class GeneratePageDataModelStep(PipelineStep):
     def get_description() -> str:
         return "Generates a JSON data model for a web page based on provided inputs."
 
-    async def process(self, page_content: str, screenshot: bytes, images: Dict[str, str], captions: Dict[str, str], **kwargs) -> StepResult:
+    async def process(self, page_content: str, screenshot: ImageHandle, images: Dict[str, str], captions: Dict[str, str], **kwargs) -> StepResult:
         self.push_update("Generating page data model...")
 
         try:
@@ -97,8 +104,8 @@ class GeneratePageDataModelStep(PipelineStep):
                 Output the generated data model only in JSON format.
             '''
 
-            client = LlmClient(model=ModelType.GPT_4_OMNI)
-            llm_response = client.get_completions(full_prompt, temperature=0.2, json_output=True, json_schema=bundled_schema, image_list=[screenshot], tools=[generate_background_image])
+            client = AsyncLlmClient(model=ModelType.GPT_4_OMNI)
+            llm_response = await client.get_completions(full_prompt, temperature=0.2, json_output=True, json_schema=bundled_schema, image_list=[screenshot], tools=[generate_background_image], on_progress=self.stream_progress("Generating data model..."))
             data_model = parse_markdown_output(llm_response, lang='json')
 
             validate(instance=json.loads(data_model), schema=bundled_schema)
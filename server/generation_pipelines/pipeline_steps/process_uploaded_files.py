@@ -31,6 +31,14 @@ def extract_images_from_docx(docx_file_path: str) -> Dict[str, str]:
     return image_hash_map
 
 
+def hash_file(file_path: str) -> str:
+    sha256_hash = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(1024 * 1024), b""):
+            sha256_hash.update(chunk)
+    return sha256_hash.hexdigest()
+
+
 def skip_images(image):
     # This function explicitly skips images
     return {}
@@ -102,6 +110,10 @@ class ProcessUploadedFilesStep(PipelineStep):
     def get_description() -> str:
         return "This step extracts markdown content and images from uploaded DOCX files."
 
+    def get_cache_inputs(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        # Uploads are saved under their original file name, so a path can hold different files over time
+        return {**inputs, "uploaded_files": [hash_file(file_path) for file_path in inputs.get("uploaded_files", [])]}
+
     def process(self, uploaded_files: List[str], **kwargs: Any) -> TextContentAndImages:
         # Update the job status at the start of processing
         self.push_update("Starting extraction of markdown content and images...")
@@ -1,7 +1,7 @@
 import os
 
 from server.generation_strategies.base_strategy import AbstractGenerationStrategy, StrategyCategory
-from server.shared.llm import create_prompt_from_template, parse_markdown_output, parse_css, LlmClient
+from server.shared.llm import create_prompt_from_template, parse_markdown_output, parse_css, AsyncLlmClient
 from server.shared.scraper import WebScraper
 from server.shared.image import image_to_bytes
 
@@ -25,18 +25,17 @@ class AKGenerationStrategy(AbstractGenerationStrategy):
             rectangle), make bold, creative modifications that will significantly enhance the overall design and visual 
             appeal of the website.
         """
-        llm = LlmClient(system_prompt=system_prompt)
+        llm = AsyncLlmClient(system_prompt=system_prompt)
         self.send_progress('Getting the HTML, CSS and screenshot of the original page...')
-        extracted_html = await scraper.get_block_html(url, selector)
+        async with scraper.snapshot(url, bypass_cache=self.bypass_cache) as snapshot:
+            extracted_html = await snapshot.outer_html(selector)
+            block_css, root_css_vars = await snapshot.raw_css(selector)
+            full_page_screenshot = await snapshot.full_page_screenshot(highlight_selector=selector)
 
         # Save the extracted html
         with open('extracted_markup.html', 'w') as f:
             f.write(extracted_html)
 
-        block_css, root_css_vars = await scraper.get_raw_css(url, selector)
-        # full_page_screenshot = await scraper.get_full_page_screenshot(url)
-        full_page_screenshot = await scraper.get_full_page_screenshot_with_highlight(url, selector)
-
         self.send_progress('Running the assessment...')
 
         master_prompt = create_prompt_from_template(
@@ -49,7 +48,7 @@ class AKGenerationStrategy(AbstractGenerationStrategy):
 
         self.send_progress('Generating CSS variation...')
 
-        raw_output = llm.get_completions(master_prompt, [image_to_bytes(full_page_screenshot)])
+        raw_output = await llm.get_completions(master_prompt, [image_to_bytes(full_page_screenshot)])
         generated_css = parse_css(raw_output)[0]
         # print(generated_css)
 
@@ -32,6 +32,8 @@ class AbstractGenerationStrategy(ABC):
         self._status_queue = None
         self._javascript_injections = []
         self._css_injections = []
+        # Set by the playground when the page was edited, so that it is scraped again instead of read from the scrape cache
+        self.bypass_cache = False
 
         # Add CSS for the overlay and spinner
         self.add_css("""
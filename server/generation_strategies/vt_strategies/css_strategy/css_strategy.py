@@ -1,7 +1,7 @@
 import os
 
 from server.generation_strategies.base_strategy import AbstractGenerationStrategy, StrategyCategory
-from server.shared.llm import create_prompt_from_template, parse_markdown_output, LlmClient
+from server.shared.llm import create_prompt_from_template, parse_markdown_output, AsyncLlmClient
 from server.shared.scraper import WebScraper
 
 
@@ -15,10 +15,10 @@ class CssGenerationStrategy(AbstractGenerationStrategy):
     async def generate(self, url, selector, prompt):
 
         scraper = WebScraper()
-        llm = LlmClient()
+        llm = AsyncLlmClient()
 
         self.send_progress('Getting the HTML and screenshot of the original page...')
-        original_html, original_screenshot = await scraper.get_html_and_screenshot(url, selector, with_styles=True)
+        original_html, original_screenshot = await scraper.get_html_and_screenshot(url, selector, with_styles=True, bypass_cache=self.bypass_cache)
 
         self.send_progress('Running the assessment...')
         goals = [
@@ -31,7 +31,7 @@ class CssGenerationStrategy(AbstractGenerationStrategy):
             goals=goals,
             html=original_html.strip()
         )
-        instructions = llm.get_completions(assessment_prompt, [original_screenshot])
+        instructions = await llm.get_completions(assessment_prompt, [original_screenshot])
 
         self.send_progress('Generating CSS variation...')
         generation_prompt = create_prompt_from_template(
@@ -39,7 +39,7 @@ class CssGenerationStrategy(AbstractGenerationStrategy):
             instructions=instructions,
             html=original_html.strip()
         )
-        raw_output = llm.get_completions(generation_prompt, [original_screenshot])
+        raw_output = await llm.get_completions(generation_prompt, [original_screenshot])
         generated_css = parse_markdown_output(raw_output, lang='css')
 
         self.add_css(generated_css)
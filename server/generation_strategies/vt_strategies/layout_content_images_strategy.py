@@ -6,7 +6,7 @@ import os
 from server.shared.dalle import DalleClient
 from server.generation_strategies.base_strategy import AbstractGenerationStrategy, StrategyCategory
 from server.shared.html_utils import convert_hashes_to_urls
-from server.shared.llm import LlmClient, ModelType, parse_markdown_output
+from server.shared.llm import AsyncLlmClient, ModelType, parse_markdown_output
 from server.shared.scraper import WebScraper
 
 
@@ -18,6 +18,8 @@ def make_image_generator(dalle, url_mapping):
           prompt:
             type: string
             description: The prompt for generating the image.
+        timeout: 90
+        max_concurrency: 2
         returns:
           type: string
           description: THe image URL generated based on the prompt.
@@ -56,7 +58,7 @@ class LayoutAndContentEnhancementStrategy(AbstractGenerationStrategy):
         scraper = WebScraper()
 
         self.send_progress(f"Fetching HTML content from {url}...")
-        html, screenshot = await scraper.get_html_and_screenshot(url, selector, with_styles=False)
+        html, screenshot = await scraper.get_html_and_screenshot(url, selector, with_styles=False, bypass_cache=self.bypass_cache)
 
         system_prompt = f"""
             You are a professional web developer, designer, or content creator.
@@ -67,7 +69,7 @@ class LayoutAndContentEnhancementStrategy(AbstractGenerationStrategy):
 
         url_mapping = {}
         generate_image = make_image_generator(DalleClient(), url_mapping)
-        llm = LlmClient(ModelType.GPT_4_OMNI, system_prompt=system_prompt)
+        llm = AsyncLlmClient(ModelType.GPT_4_OMNI, system_prompt=system_prompt)
 
         analysis_prompt = f"""
             Analyze the provided HTML content to identify its current layout structure.
@@ -89,7 +91,7 @@ class LayoutAndContentEnhancementStrategy(AbstractGenerationStrategy):
         """
 
         self.send_progress("Analyzing layout and content...")
-        proposed_changes = llm.get_completions(analysis_prompt, [screenshot], temperature=0.0)
+        proposed_changes = await llm.get_completions(analysis_prompt, [screenshot], temperature=0.0)
 
         print(proposed_changes)
 
@@ -115,7 +117,7 @@ class LayoutAndContentEnhancementStrategy(AbstractGenerationStrategy):
         """
 
         self.send_progress("Generating new layout and content...")
-        llm_response = llm.get_completions(prompt, [screenshot], temperature=0.0, tools=[generate_image])
+        llm_response = await llm.get_completions(prompt, [screenshot], temperature=0.0, tools=[generate_image])
 
         print(llm_response)
 
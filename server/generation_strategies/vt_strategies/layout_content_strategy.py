@@ -1,7 +1,7 @@
 import os
 
 from server.generation_strategies.base_strategy import AbstractGenerationStrategy, StrategyCategory
-from server.shared.llm import LlmClient, ModelType, parse_markdown_output
+from server.shared.llm import AsyncLlmClient, ModelType, parse_markdown_output
 from server.shared.scraper import WebScraper
 
 
@@ -19,7 +19,7 @@ class LayoutAndContentEnhancementStrategy(AbstractGenerationStrategy):
         scraper = WebScraper()
 
         self.send_progress(f"Fetching HTML content from {url}...")
-        html, screenshot = await scraper.get_html_and_screenshot(url, selector, with_styles=False)
+        html, screenshot = await scraper.get_html_and_screenshot(url, selector, with_styles=False, bypass_cache=self.bypass_cache)
 
         system_prompt = f"""
             You are a professional web developer, designer, or content creator.
@@ -29,7 +29,7 @@ class LayoutAndContentEnhancementStrategy(AbstractGenerationStrategy):
             You MUST not use gradients for background colors.
         """
 
-        llm = LlmClient(ModelType.GPT_4_OMNI, system_prompt=system_prompt)
+        llm = AsyncLlmClient(ModelType.GPT_4_OMNI, system_prompt=system_prompt)
 
         analysis_prompt = f"""
             Analyze the provided HTML content to identify its current layout structure.
@@ -49,7 +49,7 @@ class LayoutAndContentEnhancementStrategy(AbstractGenerationStrategy):
         """
 
         self.send_progress("Analyzing layout and content...")
-        proposed_changes = llm.get_completions(analysis_prompt, [screenshot], temperature=0.0)
+        proposed_changes = await llm.get_completions(analysis_prompt, [screenshot], temperature=0.0)
 
         prompt = f"""
         You are required to output only the modified HTML content with inline CSS and updated text content.
@@ -71,7 +71,7 @@ class LayoutAndContentEnhancementStrategy(AbstractGenerationStrategy):
         """
 
         self.send_progress("Generating new layout and content...")
-        llm_response = llm.get_completions(prompt, [screenshot], temperature=0.0)
+        llm_response = await llm.get_completions(prompt, [screenshot], temperature=0.0)
 
         print(llm_response)
 
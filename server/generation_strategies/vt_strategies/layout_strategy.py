@@ -1,5 +1,5 @@
 from server.generation_strategies.base_strategy import AbstractGenerationStrategy, StrategyCategory
-from server.shared.llm import LlmClient, ModelType, parse_markdown_output
+from server.shared.llm import AsyncLlmClient, ModelType, parse_markdown_output
 from server.shared.scraper import WebScraper
 
 
@@ -19,7 +19,7 @@ class LayoutEnhancementStrategy(AbstractGenerationStrategy):
         print(f"Prompt: {prompt}")
 
         self.send_progress(f"Fetching HTML content from {url}...")
-        html, screenshot = await scraper.get_html_and_screenshot(url, selector, with_styles=True)
+        html, screenshot = await scraper.get_html_and_screenshot(url, selector, with_styles=True, bypass_cache=self.bypass_cache)
 
         system_prompt = f"""
             You are a professional web designer.
@@ -28,7 +28,7 @@ class LayoutEnhancementStrategy(AbstractGenerationStrategy):
             You must think in steps.
         """
 
-        llm = LlmClient(ModelType.GPT_4_OMNI, system_prompt=system_prompt)
+        llm = AsyncLlmClient(ModelType.GPT_4_OMNI, system_prompt=system_prompt)
 
         analysis_prompt = f"""
             Analyze the following HTML content and identify the type of layout it uses.
@@ -40,7 +40,7 @@ class LayoutEnhancementStrategy(AbstractGenerationStrategy):
         """
 
         self.send_progress("Analyzing layout...")
-        proposed_changes = llm.get_completions(analysis_prompt, [screenshot])
+        proposed_changes = await llm.get_completions(analysis_prompt, [screenshot])
 
         prompt = f"""
             You must output the modified HTML only.
@@ -54,7 +54,7 @@ class LayoutEnhancementStrategy(AbstractGenerationStrategy):
         """
 
         self.send_progress("Generating new layout...")
-        llm_response = llm.get_completions(prompt, [screenshot])
+        llm_response = await llm.get_completions(prompt, [screenshot])
 
         new_html = parse_markdown_output(llm_response, lang='html')
         self.replace_html(selector, new_html)
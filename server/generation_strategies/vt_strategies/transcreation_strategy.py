@@ -1,7 +1,7 @@
 import asyncio
 
 from server.generation_strategies.base_strategy import AbstractGenerationStrategy, StrategyCategory
-from server.shared.llm import LlmClient, ModelType, parse_markdown_output
+from server.shared.llm import AsyncLlmClient, ModelType, parse_markdown_output
 from server.shared.scraper import WebScraper
 
 
@@ -19,7 +19,7 @@ class TranscreationStrategy(AbstractGenerationStrategy):
         scraper = WebScraper()
 
         self.send_progress(f"Fetching HTML content from {url}...")
-        html, _ = await scraper.get_html_and_screenshot(url, selector, with_styles=False)
+        html, _ = await scraper.get_html_and_screenshot(url, selector, with_styles=False, bypass_cache=self.bypass_cache)
 
         system_prompt = f"""
             You are a professional copywriter and translator.
@@ -27,7 +27,7 @@ class TranscreationStrategy(AbstractGenerationStrategy):
             You must output the modified HTML only.
         """
 
-        llm = LlmClient(ModelType.GPT_4_OMNI, system_prompt=system_prompt)
+        llm = AsyncLlmClient(ModelType.GPT_4_OMNI, system_prompt=system_prompt)
 
         prompt = f"""
             Rewrite the text content in the following HTML to make it more engaging for a {prompt} audience.
@@ -36,7 +36,7 @@ class TranscreationStrategy(AbstractGenerationStrategy):
         """
 
         self.send_progress("Rewriting content...")
-        llm_response = llm.get_completions(prompt)
+        llm_response = await llm.get_completions(prompt)
 
         translated_html = parse_markdown_output(llm_response, lang='html')
 
@@ -1,10 +1,21 @@
 import asyncio
+import concurrent.futures
+import os
+import time
 from abc import ABC, abstractmethod
 from enum import Enum
 import random
 import string
 import threading
 
+from server.job_store import JOB_STORE_MAX_AGE, JobRecord, JobStore, JobStoreWriter
+from server.update_bus import UpdateBus
+
+# Finished jobs stay in memory, with their step artifacts, until there are more than JOB_RETENTION_MAX_JOBS of
+# them or for JOB_RETENTION_TTL seconds; after that their status, updates and result are read from the job store
+JOB_RETENTION_MAX_JOBS = int(os.getenv('JOB_RETENTION_MAX_JOBS', 16))
+JOB_RETENTION_TTL = int(os.getenv('JOB_RETENTION_TTL', 10 * 60))
+
 
 class JobStatus(Enum):
     QUEUED = 'queued'
@@ -14,11 +25,16 @@ class JobStatus(Enum):
 
 
 class Job(ABC):
-    def __init__(self, job_id, **args):
+    def __init__(self, job_id, pipeline_id=None, **args):
         self.job_id = job_id
+        self.pipeline_id = pipeline_id
+        self.queue_position = None
         self.status = JobStatus.QUEUED
-        self.updates = [{"message": "Job queued. Processing will start soon..."}]
+        self.updates = UpdateBus()
+        self.updates.publish({"message": "Job queued. Processing will start soon..."})
         self.result = None  # To store the result of the job
+        self.created_at = time.time()
+        self.finished_at = None
 
     @abstractmethod
     async def run(self):
@@ -34,62 +50,254 @@ class Job(ABC):
         if message:
             update = {'message': message}
             update.update(kwargs)
-            self.updates.append(update)
+            self.updates.publish(update)
         else:
-            self.updates.append({'message': 'Ugh! Something went wrong...'})
+            self.updates.publish({'message': 'Ugh! Something went wrong...'})
 
     def set_result(self, result):
         self.result = result
 
+    def get_params(self):
+        """The parameters the job can be recreated with after a restart; None if it can't be."""
+        return None
+
+    def release(self):
+        """Drop what the finished job keeps in memory besides its status, updates and result."""
+        pass
+
+    @property
+    def finished(self):
+        return self.status in (JobStatus.COMPLETED, JobStatus.ERROR)
+
+
+class StoredJob(Job):
+    """A job that is no longer in memory, as read back from the job store."""
+
+    def __init__(self, record, updates):
+        super().__init__(job_id=record.job_id, pipeline_id=record.pipeline_id)
+        self.status = JobStatus(record.status)
+        self.result = record.result
+        self.created_at = record.created_at
+        self.finished_at = record.finished_at
+        self.updates = UpdateBus(max_size=max(len(updates), 1))
+        for _, update in updates:
+            self.updates.publish(update)
+        self.updates.close()
+
+    async def run(self):
+        raise RuntimeError(f"Job {self.job_id} was restored from the job store and can't be run")
+
 
 class JobManager:
-    def __init__(self):
+    def __init__(self, max_concurrent_jobs=1, pipeline_concurrency=None, store=None, retention_max_jobs=JOB_RETENTION_MAX_JOBS, retention_ttl=JOB_RETENTION_TTL):
         self.job_queue = asyncio.Queue()
+        # The jobs in memory: unfinished ones and the finished ones that are retained
         self.job_status = {}
+        self.job_status_lock = threading.Lock()
         self.worker_thread = None
         self.loop = None
 
+        self.store = store or JobStore()
+        self.store_writer = JobStoreWriter(self.store)
+        self.retention_max_jobs = retention_max_jobs
+        self.retention_ttl = retention_ttl
+
+        # Jobs are admitted by a global semaphore and, optionally, by a semaphore per pipeline ID
+        self.max_concurrent_jobs = max_concurrent_jobs
+        self.pipeline_concurrency = pipeline_concurrency or {}
+        self.job_semaphore = asyncio.Semaphore(max_concurrent_jobs)
+        self.pipeline_semaphores = {}
+        self.waiting_jobs = []
+        self.running_tasks = set()
+        self.accepting_jobs = True
+
     def start_worker_thread(self):
+        # The loop is created here so that jobs can be added as soon as this returns
+        self.loop = asyncio.new_event_loop()
         self.worker_thread = threading.Thread(target=self.run_worker_loop_in_thread, daemon=True)
         self.worker_thread.start()
 
     def run_worker_loop_in_thread(self):
-        self.loop = asyncio.new_event_loop()
         asyncio.set_event_loop(self.loop)
         self.loop.run_until_complete(self.worker_loop())
 
     async def worker_loop(self):
+        print(f"Job worker started: max {self.max_concurrent_jobs} concurrent job(s), per pipeline limits: {self.pipeline_concurrency}")
         while True:
             job = await self.job_queue.get()
-            job.set_status(JobStatus.PROCESSING)
-            job.push_update('Job processing started')
-            try:
-                # Run the job and store its result
-                result = await job.run()
-                print(f"Job {job.job_id} processing completed successfully with result: {result}")
-                job.set_result(result)
-                job.set_status(JobStatus.COMPLETED)
-                job.push_update('Job processing completed successfully')
-            except Exception as e:
-                print(f"Job {job.job_id} processing failed: {e}")
-                job.set_status(JobStatus.ERROR)
-                job.push_update(f'Job processing failed: {e}')
-            finally:
-                print(f"Removing job {job.job_id} from queue")
-                self.job_queue.task_done()
+            self.waiting_jobs.append(job)
+            self.report_queue_positions()
+
+            task = asyncio.create_task(self.run_job(job))
+            self.running_tasks.add(task)
+            task.add_done_callback(self.running_tasks.discard)
+
+    async def run_job(self, job):
+        try:
+            async with self.get_pipeline_semaphore(job.pipeline_id):
+                async with self.job_semaphore:
+                    self.waiting_jobs.remove(job)
+                    job.queue_position = None
+                    self.report_queue_positions()
+                    await self.process_job(job)
+        finally:
+            print(f"Removing job {job.job_id} from queue")
+            self.job_queue.task_done()
+
+    async def process_job(self, job):
+        job.set_status(JobStatus.PROCESSING)
+        # Jobs are saved on the store writer's thread, so that a slow disk doesn't stall the other jobs on the loop
+        self.store_writer.save(self.create_record(job))
+        job.push_update('Job processing started')
+        try:
+            # Run the job and store its result
+            result = await job.run()
+            print(f"Job {job.job_id} processing completed successfully with result: {result}")
+            job.set_result(result)
+            job.set_status(JobStatus.COMPLETED)
+            job.push_update('Job processing completed successfully')
+        except Exception as e:
+            print(f"Job {job.job_id} processing failed: {e}")
+            job.set_status(JobStatus.ERROR)
+            job.push_update(f'Job processing failed: {e}')
+        finally:
+            job.finished_at = time.time()
+            # The job is saved as finished after its updates, and evicted once both are stored, so that a job read back
+            # from the store has them all
+            self.store_writer.save(self.create_record(job))
+            await asyncio.to_thread(self.store_writer.flush)
+            # Let the status streams of the job end once they have sent the last update
+            job.updates.close()
+            self.evict_finished_jobs()
+
+    def get_pipeline_semaphore(self, pipeline_id):
+        if pipeline_id not in self.pipeline_semaphores:
+            limit = self.pipeline_concurrency.get(pipeline_id) or self.max_concurrent_jobs
+            self.pipeline_semaphores[pipeline_id] = asyncio.Semaphore(limit)
+        return self.pipeline_semaphores[pipeline_id]
+
+    def report_queue_positions(self):
+        for position, waiting_job in enumerate(self.waiting_jobs, start=1):
+            if waiting_job.queue_position != position:
+                waiting_job.queue_position = position
+                waiting_job.push_update(f'Job queued at position {position}', queue_position=position)
 
     def add_job(self, job):
-        self.job_status[job.job_id] = job
+        if not self.accepting_jobs:
+            raise RuntimeError("The server is shutting down and doesn't accept new jobs")
+        with self.job_status_lock:
+            self.job_status[job.job_id] = job
+        self.track_job(job)
         # Schedule the job to be put in the queue from the main thread
         if self.loop:
             self.loop.call_soon_threadsafe(self.job_queue.put_nowait, job)
 
+    def drain(self, timeout=None):
+        """Stop accepting jobs and wait for the queued and running ones to finish; returns whether they all did."""
+        self.accepting_jobs = False
+        if not self.loop or self.loop.is_closed():
+            return True
+        future = asyncio.run_coroutine_threadsafe(self.job_queue.join(), self.loop)
+        try:
+            future.result(timeout)
+            return True
+        except concurrent.futures.TimeoutError:
+            future.cancel()
+            unfinished = [job.job_id for job in list(self.job_status.values()) if not job.finished]
+            print(f"{len(unfinished)} job(s) did not finish within {timeout}s: {unfinished}")
+            return False
+
+    def track_job(self, job):
+        """Save the job and its updates to the store, and every update it publishes from now on."""
+        self.save_job(job)
+        try:
+            # A recreated job starts its updates over
+            self.store.clear_updates(job.job_id)
+            for sequence, update in job.updates.since(0):
+                self.store.add_update(job.job_id, sequence, update)
+        except Exception as e:
+            print(f"Failed to store the updates of job {job.job_id}: {e}")
+
+        def store_update(sequence, update):
+            # Streamed partial outputs are superseded by the step results and each one repeats the previous ones
+            if 'partial' not in update:
+                self.store_writer.add_update(job.job_id, sequence, update)
+
+        job.updates.add_listener(store_update)
+
+    @staticmethod
+    def create_record(job):
+        return JobRecord(
+            job_id=job.job_id,
+            pipeline_id=job.pipeline_id,
+            status=job.status.value,
+            params=job.get_params(),
+            result=job.result,
+            created_at=job.created_at,
+            finished_at=job.finished_at
+        )
+
+    def save_job(self, job):
+        try:
+            self.store.save(self.create_record(job))
+        except Exception as e:
+            print(f"Failed to store job {job.job_id}: {e}")
+
+    def evict_finished_jobs(self):
+        """Release the finished jobs beyond the retention limits and leave them to the store."""
+        expired_at = time.time() - self.retention_ttl
+        with self.job_status_lock:
+            finished = sorted((job for job in self.job_status.values() if job.finished), key=lambda job: job.finished_at or 0, reverse=True)
+            evicted = finished[self.retention_max_jobs:] + [job for job in finished[:self.retention_max_jobs] if (job.finished_at or 0) < expired_at]
+            for job in evicted:
+                del self.job_status[job.job_id]
+        for job in evicted:
+            job.release()
+        if evicted:
+            print(f"Evicted {len(evicted)} finished job(s) from memory")
+
+    def recover_jobs(self, create_job):
+        """
+        Queue again the jobs that were queued or running when the server stopped; create_job(record) recreates a
+        job from its JobRecord. Also deletes the jobs that finished more than JOB_STORE_MAX_AGE seconds ago.
+        """
+        deleted = self.store.delete_finished_before(time.time() - JOB_STORE_MAX_AGE)
+        if deleted:
+            print(f"Deleted {deleted} old job(s) from the job store")
+
+        recovered = 0
+        for record in self.store.get_unfinished():
+            try:
+                if record.params is None:
+                    raise ValueError("the job has no parameters to be recreated with")
+                job = create_job(record)
+                job.created_at = record.created_at
+            except Exception as e:
+                print(f"Could not recover job {record.job_id}: {e}")
+                record.status = JobStatus.ERROR.value
+                record.finished_at = time.time()
+                updates = self.store.get_updates(record.job_id)
+                self.store.add_update(record.job_id, updates[-1][0] + 1 if updates else 1, {"message": f"Job processing failed: {e}"})
+                self.store.save(record)
+                continue
+            job.push_update('Job resumed after a server restart')
+            self.add_job(job)
+            recovered += 1
+        if recovered:
+            print(f"Recovered {recovered} unfinished job(s)")
+        return recovered
+
     def get_job_status(self, job_id):
-        return self.job_status.get(job_id)
+        job = self.job_status.get(job_id)
+        if job is None:
+            record = self.store.get(job_id)
+            if record is not None:
+                job = StoredJob(record, self.store.get_updates(job_id))
+        return job
 
     def get_job_result(self, job_id):
         """Retrieve the result of a completed job by its ID."""
-        job = self.job_status.get(job_id)
+        job = self.get_job_status(job_id)
         if job and job.status == JobStatus.COMPLETED:
             return job.result
         return None
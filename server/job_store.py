@@ -0,0 +1,230 @@
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+# 'sqlite' keeps jobs across restarts, 'memory' only for the lifetime of the process
+JOB_STORE = os.getenv('JOB_STORE', 'sqlite')
+JOB_STORE_PATH = os.getenv('JOB_STORE_PATH', 'cache/jobs.sqlite3')
+# Finished jobs are deleted from the store after this many seconds (30 days by default)
+JOB_STORE_MAX_AGE = int(os.getenv('JOB_STORE_MAX_AGE', 30 * 24 * 60 * 60))
+
+FINISHED_STATUSES = ('completed', 'error')
+
+
+class JobRecord:
+    """What is kept of a job: enough to report its status and result, and to recreate it if it didn't finish."""
+
+    def __init__(self, job_id, pipeline_id=None, status='queued', params=None, result=None, created_at=None, finished_at=None):
+        self.job_id = job_id
+        self.pipeline_id = pipeline_id
+        self.status = status
+        self.params = params
+        self.result = result
+        self.created_at = created_at or time.time()
+        self.finished_at = finished_at
+
+    @property
+    def finished(self):
+        return self.status in FINISHED_STATUSES
+
+
+class JobStore:
+    """
+    Keeps job records and their numbered updates in memory. Subclasses persist them; all methods are thread-safe.
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.records = {}
+        self.updates = {}
+
+    def save(self, record):
+        with self.lock:
+            self.records[record.job_id] = record
+
+    def add_update(self, job_id, sequence, update):
+        with self.lock:
+            self.updates.setdefault(job_id, {})[sequence] = update
+
+    def clear_updates(self, job_id):
+        with self.lock:
+            self.updates.pop(job_id, None)
+
+    def get(self, job_id):
+        with self.lock:
+            return self.records.get(job_id)
+
+    def get_updates(self, job_id):
+        """Return the (sequence number, update) pairs of the job in order."""
+        with self.lock:
+            return sorted(self.updates.get(job_id, {}).items())
+
+    def get_unfinished(self):
+        """Return the records of the jobs that were queued or running, oldest first."""
+        with self.lock:
+            return sorted((record for record in self.records.values() if not record.finished), key=lambda record: record.created_at)
+
+    def delete_finished_before(self, timestamp):
+        """Delete the jobs that finished before the timestamp; returns how many were deleted."""
+        with self.lock:
+            job_ids = [job_id for job_id, record in self.records.items() if record.finished and (record.finished_at or 0) < timestamp]
+            for job_id in job_ids:
+                del self.records[job_id]
+                self.updates.pop(job_id, None)
+            return len(job_ids)
+
+
+class SqliteJobStore(JobStore):
+    """A JobStore in a SQLite database; params, results and updates are stored as JSON."""
+
+    def __init__(self, path=JOB_STORE_PATH):
+        super().__init__()
+        self.path = path
+        self.connection = None
+
+    def _connect(self):
+        if self.connection is None:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            # With WAL, commits are durable across crashes of the process; only a power loss can lose the last ones
+            self.connection.execute('PRAGMA synchronous=NORMAL')
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS jobs (
+                    job_id TEXT PRIMARY KEY,
+                    pipeline_id TEXT,
+                    status TEXT NOT NULL,
+                    params TEXT,
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    finished_at REAL
+                )
+            ''')
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS job_updates (
+                    job_id TEXT NOT NULL,
+                    sequence INTEGER NOT NULL,
+                    content TEXT NOT NULL,
+                    PRIMARY KEY (job_id, sequence)
+                )
+            ''')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status)')
+            self.connection.commit()
+        return self.connection
+
+    @staticmethod
+    def _dump(value):
+        return None if value is None else json.dumps(value, default=str)
+
+    @staticmethod
+    def _load(content):
+        return None if content is None else json.loads(content)
+
+    def save(self, record):
+        with self.lock:
+            connection = self._connect()
+            connection.execute(
+                'INSERT OR REPLACE INTO jobs (job_id, pipeline_id, status, params, result, created_at, finished_at) VALUES (?, ?, ?, ?, ?, ?, ?)',
+                (record.job_id, record.pipeline_id, record.status, self._dump(record.params), self._dump(record.result), record.created_at, record.finished_at)
+            )
+            connection.commit()
+
+    def add_update(self, job_id, sequence, update):
+        with self.lock:
+            connection = self._connect()
+            connection.execute('INSERT OR REPLACE INTO job_updates (job_id, sequence, content) VALUES (?, ?, ?)', (job_id, sequence, self._dump(update)))
+            connection.commit()
+
+    def clear_updates(self, job_id):
+        with self.lock:
+            connection = self._connect()
+            connection.execute('DELETE FROM job_updates WHERE job_id = ?', (job_id,))
+            connection.commit()
+
+    def _to_record(self, row):
+        job_id, pipeline_id, status, params, result, created_at, finished_at = row
+        return JobRecord(job_id, pipeline_id, status, self._load(params), self._load(result), created_at, finished_at)
+
+    def get(self, job_id):
+        with self.lock:
+            row = self._connect().execute(
+                'SELECT job_id, pipeline_id, status, params, result, created_at, finished_at FROM jobs WHERE job_id = ?', (job_id,)
+            ).fetchone()
+        return None if row is None else self._to_record(row)
+
+    def get_updates(self, job_id):
+        with self.lock:
+            rows = self._connect().execute('SELECT sequence, content FROM job_updates WHERE job_id = ? ORDER BY sequence', (job_id,)).fetchall()
+        return [(sequence, self._load(content)) for sequence, content in rows]
+
+    def get_unfinished(self):
+        with self.lock:
+            rows = self._connect().execute(
+                'SELECT job_id, pipeline_id, status, params, result, created_at, finished_at FROM jobs WHERE status NOT IN (?, ?) ORDER BY created_at',
+                FINISHED_STATUSES
+            ).fetchall()
+        return [self._to_record(row) for row in rows]
+
+    def delete_finished_before(self, timestamp):
+        with self.lock:
+            connection = self._connect()
+            job_ids = [(job_id,) for job_id, in connection.execute(
+                'SELECT job_id FROM jobs WHERE status IN (?, ?) AND COALESCE(finished_at, 0) < ?', (*FINISHED_STATUSES, timestamp)
+            )]
+            connection.executemany('DELETE FROM job_updates WHERE job_id = ?', job_ids)
+            connection.executemany('DELETE FROM jobs WHERE job_id = ?', job_ids)
+            connection.commit()
+            return len(job_ids)
+
+
+class JobStoreWriter:
+    """
+    Writes job records and updates to a store on a background thread, so that the job loop (shared by all running
+    jobs) and the LLM loop never wait for the disk. The writes are made in the order they were added.
+    """
+
+    def __init__(self, store):
+        self.store = store
+        self.queue = queue.Queue()
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def _put(self, job_id, write, *args):
+        with self.lock:
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, name='job-store-writer', daemon=True)
+                self.thread.start()
+        self.queue.put((job_id, write, args))
+
+    def save(self, record):
+        self._put(record.job_id, self.store.save, record)
+
+    def add_update(self, job_id, sequence, update):
+        self._put(job_id, self.store.add_update, job_id, sequence, update)
+
+    def _run(self):
+        while True:
+            job_id, write, args = self.queue.get()
+            try:
+                write(*args)
+            except Exception as e:
+                print(f"Failed to store job {job_id}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def flush(self):
+        """Block until the updates added so far are written."""
+        self.queue.join()
+
+
+def create_job_store(kind=JOB_STORE, path=JOB_STORE_PATH):
+    if kind == 'memory':
+        return JobStore()
+    if kind == 'sqlite':
+        return SqliteJobStore(path)
+    raise ValueError(f"Unknown job store: {kind}")
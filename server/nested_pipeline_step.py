@@ -5,6 +5,9 @@ from server.pipeline_step import PipelineStep
 
 
 class NestedPipelineStep(PipelineStep):
+    # The steps of the nested pipeline are cached individually
+    cacheable = False
+
     def __init__(self, pipeline: 'Pipeline', definition: Dict[str, Any], **config):
         super().__init__(pipeline, **config)
         self.definition = definition
@@ -1,26 +1,50 @@
+import concurrent.futures
+import contextvars
+import copy
+import functools
 import inspect
 import json
 import os
 import importlib.util
-from concurrent.futures import as_completed
+import time
 from concurrent.futures.thread import ThreadPoolExecutor
+from enum import Enum
 from typing import Dict, List, Any
 import asyncio
 
+from server.checkpoint_store import CheckpointStore
 from server.job_manager import Job
 from server.nested_pipeline_step import NestedPipelineStep
 from server.pipeline_metadata_extractor import PipelineStepsMetadataExtractor
 from server.pipeline_step import PipelineStep
+from server.shared.cache import MISSING
+from server.shared.circuit_breaker import CircuitOpenError
+from server.shared.telemetry import telemetry, telemetry_scope
+from server.step_policy import StepPolicy, StepTimeoutError, ON_ERROR_FAIL, ON_ERROR_SKIP
+from server.step_result_cache import step_result_cache, StepResultCache
+
+
+class ExecutionMode(Enum):
+    # Every step runs on a worker thread; async steps get their own event loop there
+    THREADS = 'threads'
+    # Async steps are awaited on the job's event loop; only sync steps go to the worker threads
+    ASYNCIO = 'asyncio'
 
 
 class Pipeline(Job):
-    def __init__(self, job_id: str, definition: Dict[str, Any], steps_folder: str, pipelines_folder: str, initial_params: Dict[str, Any], pipeline_context: Dict[str, Any] = None):
-        super().__init__(job_id=job_id)
+    def __init__(self, job_id: str, definition: Dict[str, Any], steps_folder: str, pipelines_folder: str, initial_params: Dict[str, Any], pipeline_context: Dict[str, Any] = None, execution_mode: ExecutionMode = None, max_workers: int = None, result_cache: StepResultCache = step_result_cache, checkpoint_folder: str = None):
+        super().__init__(job_id=job_id, pipeline_id=definition.get("id"))
         self.steps_folder = steps_folder
         self.pipelines_folder = pipelines_folder
+        self.execution_mode = execution_mode or ExecutionMode(definition.get("execution_mode", ExecutionMode.THREADS.value))
+        self.max_workers = max_workers or definition.get("max_workers")
+        self.result_cache = result_cache
+        # Step results are checkpointed to the folder as they complete, and a new run resumes from them
+        self.checkpoints = CheckpointStore(checkpoint_folder) if checkpoint_folder else None
 
         self.step_instances: Dict[str, PipelineStep] = {}
         self.step_dependencies: Dict[str, List[str]] = {}
+        self.step_dependents: Dict[str, List[str]] = {}
         self.step_results: Dict[str, Any] = {}
         self.pipeline_context = pipeline_context or {}
         self.global_inputs: Dict[str, Any] = {}
@@ -29,6 +53,11 @@ class Pipeline(Job):
         self.properties: Dict[str, Any] = {}
         self.output_mapping: Dict[str, str] = {}
         self.step_labels: Dict[str, str] = {}
+        self.step_configs: Dict[str, Dict[str, Any]] = {}
+        self.uncached_steps = set()
+        self.step_policies: Dict[str, StepPolicy] = {}
+        # Steps that failed with on_error 'skip', and the steps downstream of them
+        self.skipped_steps = set()
         self.steps_definitions: Dict[str, Dict[str, Any]] = {}
         self.pipeline_definitions: Dict[str, Dict[str, Any]] = {}
 
@@ -108,6 +137,11 @@ class Pipeline(Job):
                 if step_label:
                     self.step_labels[step_id] = step_label
 
+                self.step_configs[step_id] = step_instance_config
+                if not step_config.get("cache", True):
+                    self.uncached_steps.add(step_id)
+                self.step_policies[step_id] = StepPolicy.from_definition(step_config, step_instance.circuit_breaker)
+
                 print(f"Created step instance for step '{step_id}' of type '{step_type}'")
 
                 # Register the step instance using its unique ID
@@ -129,6 +163,7 @@ class Pipeline(Job):
         # Register the step instance with its unique ID
         self.step_instances[step_id] = step
         self.step_dependencies[step_id] = []
+        self.step_dependents[step_id] = []
 
         print(f"Registered step '{step_id}'")
 
@@ -160,6 +195,12 @@ class Pipeline(Job):
 
             self.step_dependencies[step_id] = list(dependencies)
 
+        # Build the reverse index so the scheduler can find the steps unblocked by a completed step
+        for step_id, deps in self.step_dependencies.items():
+            for dep in deps:
+                if dep != 'inputs':
+                    self.step_dependents[dep].append(step_id)
+
     async def run(self):
         if self.initial_params is None:
             raise ValueError("Initial parameters must be provided to run the pipeline.")
@@ -173,64 +214,118 @@ class Pipeline(Job):
             elif self.global_inputs[key] is None:
                 self.global_inputs[key] = self.global_input_defaults.get(key)
 
-        # Dictionary to track completed steps
-        completed_steps = set()
+        self.skipped_steps = set()
+        completed_steps = self.restore_checkpoints()
 
-        # Identify initial steps that have no dependencies or only depend on inputs
-        steps_to_run = self._get_initial_steps()
+        # Number of unfinished dependencies per step; a step is started as soon as its count drops to zero
+        remaining_deps = {
+            step_id: len([dep for dep in deps if dep != 'inputs' and dep not in completed_steps])
+            for step_id, deps in self.step_dependencies.items()
+        }
+
+        print(f"Execution mode: {self.execution_mode.value}")
+        loop = asyncio.get_running_loop()
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers)
+        try:
+            tasks = {}
+
+            def submit(step_id):
+                step_instance = self.step_instances[step_id]
+                step_inputs = self.prepare_input_for_step(step_instance)
+                print(f"Submitting step '{step_id}'")
+                if self.execution_mode == ExecutionMode.ASYNCIO:
+                    task = asyncio.ensure_future(self.run_step_async(step_id, step_inputs, executor))
+                else:
+                    task = loop.run_in_executor(executor, self.run_step, step_id, step_inputs)
+                tasks[task] = step_id
+
+            def complete(step_id):
+                completed_steps.add(step_id)
+                print(f"Step '{step_id}' completed, unblocking dependents: {self.step_dependents[step_id]}")
+
+                for dependent_id in self.step_dependents[step_id]:
+                    remaining_deps[dependent_id] -= 1
+                    if remaining_deps[dependent_id] != 0:
+                        continue
+                    # The inputs of a step downstream of a skipped step are missing, so it is skipped as well
+                    skipped_dependencies = [dep for dep in self.step_dependencies[dependent_id] if dep in self.skipped_steps]
+                    if skipped_dependencies:
+                        self.skipped_steps.add(dependent_id)
+                        self.push_update(f"Step '{self._get_step_label(dependent_id)}' skipped, it depends on skipped step(s): {', '.join(skipped_dependencies)}.", step=dependent_id)
+                        complete(dependent_id)
+                    else:
+                        submit(dependent_id)
 
-        with ThreadPoolExecutor() as executor:
-            while steps_to_run:
-                futures = {}
+            for step_id in self.step_instances:
+                if step_id not in completed_steps and remaining_deps[step_id] == 0:
+                    submit(step_id)
 
-                # Prepare and submit steps for execution
-                for step_id in steps_to_run:
-                    if step_id not in completed_steps:  # Ensure the step hasn't been completed
-                        step_instance = self.step_instances[step_id]
-                        step_inputs = self.prepare_input_for_step(step_instance)
-                        futures[step_id] = executor.submit(self.run_step, step_id, step_inputs)
+            while tasks:
+                done, _ = await asyncio.wait(tasks.keys(), return_when=asyncio.FIRST_COMPLETED)
 
-                # Wait for any step to complete
-                for future in as_completed(futures.values()):
-                    step_id = next(k for k, v in futures.items() if v == future)
+                for task in done:
+                    step_id = tasks.pop(task)
                     try:
-                        future.result()
+                        task.result()
                     except Exception as e:
                         print(f"Exception occurred in step '{step_id}': {e}")
+                        for pending in tasks:
+                            pending.cancel()
+                        await asyncio.gather(*tasks.keys(), return_exceptions=True)
                         raise e
 
-                    # Mark the step as completed after successful execution
-                    completed_steps.add(step_id)
-
-                print(f"Completed steps: {completed_steps}")
+                    complete(step_id)
+        finally:
+            # Other jobs share the loop, so it doesn't wait for sync steps still running after a step failed or timed out
+            executor.shutdown(wait=False, cancel_futures=True)
 
-                # Determine which steps are ready to run next
-                steps_to_run = []
-                print("Checking dependencies for next steps...")
-                for step_id, deps in self.step_dependencies.items():
-                    if step_id not in completed_steps:
-                        # Check if all dependencies for this step have been completed
+        print(f"Completed steps: {completed_steps}")
 
-                        print(f"Checking dependencies for step '{step_id}': {deps}")
-
-                        all_deps_completed = all(
-                            dep in completed_steps or dep == 'inputs' for dep in deps
-                        )
-                        if all_deps_completed:
-                            print(f"Step '{step_id}' is ready to run: all dependencies {deps} are completed or are global inputs.")
-                            steps_to_run.append(step_id)
-                        else:
-                            print(f"Step '{step_id}' is not ready to run: dependencies {deps} are not yet completed.")
-                print(f"Next steps to run: {steps_to_run}")
+        # A completed run has nothing left to resume
+        if self.checkpoints is not None:
+            self.checkpoints.clear()
 
         return self.get_output()
 
+    def restore_checkpoints(self) -> set:
+        """
+        Restore the results of the steps checkpointed by a previous run of the job, along with the results of all the
+        steps they depend on; returns the IDs of the restored steps. The other steps, e.g. a failed step and the
+        steps downstream of it, have to run again.
+        """
+        restored = set()
+        if self.checkpoints is None:
+            return restored
+
+        pending = list(self.step_instances)
+        while pending:
+            # Steps are restored once their dependencies are, so a step never gets ahead of a step it depends on
+            ready = [step_id for step_id in pending if all(dep == 'inputs' or dep in restored for dep in self.step_dependencies[step_id])]
+            pending = [step_id for step_id in pending if step_id not in ready]
+            progress = False
+            for step_id in ready:
+                result = self.checkpoints.restore(step_id, self.step_instances[step_id].get_type(), self.step_configs.get(step_id, {}))
+                if result is MISSING:
+                    continue
+                self.step_results[step_id] = result
+                restored.add(step_id)
+                progress = True
+                self.push_update(f"Step '{self._get_step_label(step_id)}' restored from its checkpoint.", step=step_id)
+            if not progress:
+                break
+        return restored
+
+    def get_params(self):
+        return self.initial_params
+
+    def release(self):
+        # Step results hold the heavy artifacts (screenshots, images...); the output is already in the result
+        self.step_results = {}
+
     def _get_dependent_steps(self, step_id: str) -> List[str]:
         """Find all steps that depend directly on the given step."""
-        return [
-            dependent_id for dependent_id, deps in self.step_dependencies.items()
-            if step_id in deps
-        ]
+        return self.step_dependents.get(step_id, [])
 
     def convert_params_to_types(self, step: PipelineStep, input_data: Dict[str, Any]) -> Dict[str, Any]:
         """
@@ -254,6 +349,9 @@ class Pipeline(Job):
                     elif hasattr(param_type, "__origin__") and param_type.__origin__ in [list, dict, tuple, set]:
                         # For typing.List, typing.Dict, etc., use the origin
                         converted_data[param_name] = param_type.__origin__(param_value)
+                    elif inspect.isclass(param_type) and isinstance(param_value, param_type):
+                        # Already the right type, e.g. an ImageHandle passed on from a previous step
+                        converted_data[param_name] = param_value
                     else:
                         # Attempt to convert to the specified type
                         converted_data[param_name] = param_type(param_value)
@@ -264,27 +362,178 @@ class Pipeline(Job):
 
         return converted_data
 
-    def run_step(self, step_id: str, initial_params: Dict[str, Any] = None):
+    def _prepare_step_call(self, step_id: str, initial_params: Dict[str, Any] = None):
         step = self.step_instances[step_id]
 
         input_data = initial_params if initial_params is not None else self.prepare_input_for_step(step)
 
         self.validate_inputs(step, input_data)
 
+        cache_key = self._get_cache_key(step_id, step, input_data)
+
         # Convert input parameters to the appropriate types
         input_data = self.convert_params_to_types(step, input_data)
 
-        # Use the label for updates if available; otherwise, use the step name
-        step_label = self.step_labels.get(step_id, step.get_name())
+        return step, input_data, cache_key
 
-        if inspect.iscoroutinefunction(step.process):
-            result = asyncio.run(step.process(**input_data))
+    def _get_cache_key(self, step_id: str, step: PipelineStep, input_data: Dict[str, Any]):
+        if self.result_cache is None or not step.cacheable or step_id in self.uncached_steps:
+            return None
+        try:
+            return self.result_cache.make_key(step.get_type(), self.step_configs.get(step_id, {}), step.get_cache_inputs(input_data))
+        except (TypeError, OSError) as e:
+            print(f"Step '{step_id}' result will not be cached: {e}")
+            return None
+
+    def _get_cached_result(self, step_id: str, cache_key: str):
+        if cache_key is None:
+            return MISSING
+
+        result = self.result_cache.get(cache_key)
+        if result is MISSING:
+            self.push_update(f"No cached result for step '{self._get_step_label(step_id)}', running it...", cache='miss', step=step_id)
         else:
-            result = step.process(**input_data)
+            self.push_update(f"Reusing cached result for step '{self._get_step_label(step_id)}'.", cache='hit', step=step_id)
+        return result
 
-        self.push_update(f"Step '{step_label}' completed.")
+    def _get_step_label(self, step_id: str) -> str:
+        # Use the label for updates if available; otherwise, use the step name
+        return self.step_labels.get(step_id, self.step_instances[step_id].get_name())
+
+    def _complete_step(self, step_id: str, result: Any, cache_key: str = None):
+        if cache_key is not None:
+            self.result_cache.put(cache_key, result)
+
+        self.push_update(f"Step '{self._get_step_label(step_id)}' completed.")
         self.step_results[step_id] = result
 
+        if self.checkpoints is not None:
+            try:
+                self.checkpoints.save(step_id, self.step_instances[step_id].get_type(), self.step_configs.get(step_id, {}), result)
+            except Exception as e:
+                print(f"Failed to checkpoint the result of step '{step_id}': {e}")
+
+    def _step_scope(self, step_id: str):
+        return telemetry_scope(job_id=self.job_id, pipeline=self.pipeline_id, step=step_id)
+
+    def run_step(self, step_id: str, initial_params: Dict[str, Any] = None):
+        step, input_data, cache_key = self._prepare_step_call(step_id, initial_params)
+
+        result = self._get_cached_result(step_id, cache_key)
+        if result is not MISSING:
+            self._complete_step(step_id, result)
+            return
+
+        policy = self.step_policies[step_id]
+        with self._step_scope(step_id):
+            attempt = 1
+            while True:
+                try:
+                    started_at = time.monotonic()
+                    with policy.guard():
+                        result = self._call_step(step_id, step, input_data, policy.timeout)
+                    telemetry.record_step(time.monotonic() - started_at)
+                    break
+                except Exception as e:
+                    delay = self._get_retry_delay(step_id, policy, attempt, e)
+                    if delay is None:
+                        if policy.on_error == ON_ERROR_FAIL:
+                            raise
+                        self._handle_step_failure(step_id, policy, e)
+                        return
+                    time.sleep(delay)
+                    attempt += 1
+
+        self._complete_step(step_id, result, cache_key)
+
+    def _call_step(self, step_id: str, step: PipelineStep, input_data: Dict[str, Any], timeout: float = None):
+        if inspect.iscoroutinefunction(step.process):
+            try:
+                return asyncio.run(asyncio.wait_for(step.process(**input_data), timeout))
+            except asyncio.TimeoutError:
+                raise StepTimeoutError(step_id, timeout)
+
+        if timeout is None:
+            return step.process(**input_data)
+
+        # A sync step can't be interrupted: on timeout its thread is abandoned and finishes in the background, and the
+        # step isn't retried until it does
+        executor = ThreadPoolExecutor(max_workers=1)
+        try:
+            future = executor.submit(contextvars.copy_context().run, step.process, **input_data)
+            return future.result(timeout)
+        except concurrent.futures.TimeoutError:
+            raise StepTimeoutError(step_id, timeout, still_running=True)
+        finally:
+            executor.shutdown(wait=False)
+
+    async def run_step_async(self, step_id: str, initial_params: Dict[str, Any] = None, executor: ThreadPoolExecutor = None):
+        step, input_data, cache_key = self._prepare_step_call(step_id, initial_params)
+
+        result = self._get_cached_result(step_id, cache_key)
+        if result is not MISSING:
+            self._complete_step(step_id, result)
+            return
+
+        policy = self.step_policies[step_id]
+        with self._step_scope(step_id):
+            attempt = 1
+            while True:
+                try:
+                    started_at = time.monotonic()
+                    with policy.guard():
+                        if inspect.iscoroutinefunction(step.process):
+                            try:
+                                result = await asyncio.wait_for(step.process(**input_data), policy.timeout)
+                            except asyncio.TimeoutError:
+                                raise StepTimeoutError(step_id, policy.timeout)
+                        else:
+                            loop = asyncio.get_running_loop()
+                            # Executor threads don't inherit context variables, so run the step in a copy of the current context
+                            result = await loop.run_in_executor(executor, functools.partial(contextvars.copy_context().run, self._call_step, step_id, step, input_data, policy.timeout))
+                    telemetry.record_step(time.monotonic() - started_at)
+                    break
+                except Exception as e:
+                    delay = self._get_retry_delay(step_id, policy, attempt, e)
+                    if delay is None:
+                        if policy.on_error == ON_ERROR_FAIL:
+                            raise
+                        self._handle_step_failure(step_id, policy, e)
+                        return
+                    await asyncio.sleep(delay)
+                    attempt += 1
+
+        self._complete_step(step_id, result, cache_key)
+
+    def _get_retry_delay(self, step_id: str, policy: StepPolicy, attempt: int, error: Exception):
+        """Return how long to wait before attempting the failed step again, or None if it must not be retried."""
+        if isinstance(error, CircuitOpenError):
+            # Retrying would only wait for the dependency to recover, which is what the circuit breaker avoids
+            telemetry.record_circuit_breaker_rejection(error.name)
+            return None
+        if attempt >= policy.retry.max_attempts:
+            return None
+        if isinstance(error, StepTimeoutError) and error.still_running:
+            # Another attempt would run next to the abandoned one and compete for the same resources (e.g. browsers)
+            print(f"Step '{step_id}' is not retried while its timed out attempt is still running")
+            return None
+        delay = policy.retry.get_delay(attempt)
+        telemetry.record_step_retry()
+        self.push_update(f"Step '{self._get_step_label(step_id)}' failed ({error}), retrying in {delay:.1f}s (attempt {attempt + 1} of {policy.retry.max_attempts})...", step=step_id)
+        return delay
+
+    def _handle_step_failure(self, step_id: str, policy: StepPolicy, error: Exception):
+        """Apply the on_error policy of a step that failed for good, other than failing the job."""
+        print(f"Step '{step_id}' failed: {error}")
+        telemetry.record_step_failure_handled(ON_ERROR_SKIP if policy.on_error == ON_ERROR_SKIP else 'fallback')
+        if policy.on_error == ON_ERROR_SKIP:
+            self.skipped_steps.add(step_id)
+            self.push_update(f"Step '{self._get_step_label(step_id)}' failed and was skipped: {error}", step=step_id)
+        else:
+            # The fallback is neither cached nor checkpointed, so a later run attempts the step again
+            self.push_update(f"Step '{self._get_step_label(step_id)}' failed, using its fallback result: {error}", step=step_id)
+            self.step_results[step_id] = copy.deepcopy(policy.fallback)
+
     def validate_inputs(self, step: PipelineStep, input_data: Dict[str, Any]):
         step_type = step.get_type()
 
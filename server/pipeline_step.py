@@ -6,6 +6,11 @@ StepResultDict = Dict[str, T]
 
 
 class PipelineStep(ABC):
+    # Steps with side effects (or results that depend on the job) must opt out of result caching
+    cacheable = True
+    # Name of the circuit breaker shared by the steps calling the same external dependency, e.g. 'llm' or 'browser'
+    circuit_breaker = None
+
     def __init__(self, pipeline: 'Pipeline', **config):
         self.pipeline = pipeline
         self.config = config
@@ -34,6 +39,16 @@ class PipelineStep(ABC):
         """Process the data asynchronously and return the result."""
         pass
 
-    def push_update(self, message: str):
+    def get_cache_inputs(self, inputs: Dict[str, Any]) -> Dict[str, Any]:
+        """Return the inputs the result cache key is computed from, e.g. the contents of the files behind paths."""
+        return inputs
+
+    def push_update(self, message: str, **kwargs: Any):
         """Push an update message to the pipeline."""
-        self.pipeline.push_update(message)
+        self.pipeline.push_update(message, **kwargs)
+
+    def stream_progress(self, message: str):
+        """Return an on_progress callback for streamed LLM completions that pushes the partial output as updates."""
+        def on_progress(text: str, tokens: int):
+            self.push_update(f"{message} ({tokens} tokens so far)", partial=text, tokens=tokens)
+        return on_progress
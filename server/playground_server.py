@@ -1,14 +1,19 @@
-from flask import Flask, Response, request, jsonify
+from aioflask import Flask
+from flask import Response, request, jsonify
 import requests
 from flask_cors import CORS
+from greenletio import await_
 import traceback
 import asyncio
 import threading
-import queue
 
 from server.playground_db import PlaygroundDatabase
 from server.generation_strategies.base_strategy import Action, StatusMessage
 from server.playground_strategy_loader import load_generation_strategies
+from server.shared.browser_pool import warm_up_browser_pool
+from server.shared.serving import AsgiApp, serve
+from server.shared.telemetry import telemetry, telemetry_scope
+from server.update_bus import UpdateBus
 
 DASHBOARD_URL = "http://localhost:4010/playground.js"
 
@@ -26,6 +31,7 @@ class PlaygroundServer:
 
     def setup_routes(self):
         self.app.add_url_rule('/ok', view_func=self.ok, methods=['GET'])
+        self.app.add_url_rule('/metrics', view_func=self.metrics, methods=['GET'])
 
         # Toolbox routes
         self.app.add_url_rule('/generate', view_func=self.generate, methods=['GET'])
@@ -43,10 +49,15 @@ class PlaygroundServer:
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
+    @staticmethod
+    def metrics():
+        return Response(telemetry.render(), mimetype='text/plain; version=0.0.4')
+
     def generate(self):
         selector = request.args.get('selector')
         generation_strategy = request.args.get('strategy')
         prompt = request.args.get('prompt')
+        bypass_cache = request.args.get('bypassCache', 'false').lower() == 'true'
 
         print(f"Selector: {selector}")
         print(f"Generation strategy: {generation_strategy}")
@@ -57,10 +68,11 @@ class PlaygroundServer:
         except StopIteration:
             raise ValueError(f"Generation strategy with ID {generation_strategy} not found in the list.")
 
-        status_queue = queue.Queue()
+        status_updates = UpdateBus()
 
         strategy = strategy_cls()
-        strategy.set_status_queue(status_queue)
+        strategy.set_status_queue(status_updates)
+        strategy.bypass_cache = bypass_cache
 
         async def _generate_async():
             try:
@@ -98,26 +110,32 @@ class PlaygroundServer:
                 '''
 
                 variation_id = self.injections.add_injection(script_content)
-                status_queue.put(StatusMessage(Action.DONE, variation_id))
+                status_updates.put(StatusMessage(Action.DONE, variation_id))
 
             except Exception as e:
-                status_queue.put(StatusMessage(Action.ERROR, str(e)))
+                status_updates.put(StatusMessage(Action.ERROR, str(e)))
                 print(e)
                 print(traceback.format_exc())
 
         def _generate():
-            asyncio.run(_generate_async())
+            try:
+                with telemetry_scope(strategy=generation_strategy):
+                    asyncio.run(_generate_async())
+            finally:
+                status_updates.close()
 
+        # Strategies may block, so they run on their own thread rather than on the server's loop
         thread = threading.Thread(target=_generate)
         thread.start()
 
         def status_stream():
-            while True:
-                message = status_queue.get()
-                if message.action == Action.DONE:
+            sequence = 0
+            while not status_updates.is_done(sequence):
+                # Wait for the strategy's messages without holding a thread (the stream runs in a greenlet)
+                for sequence, message in await_(status_updates.wait_async(sequence)):
                     yield f"data: {message.to_json()}\n\n"
-                    break
-                yield f"data: {message.to_json()}\n\n"
+                    if message.action == Action.DONE:
+                        return
 
         return Response(status_stream(), mimetype='text/event-stream')
 
@@ -128,16 +146,18 @@ class PlaygroundServer:
         ]
         return jsonify(strategies)
 
-    def proxy(self, path):
+    async def proxy(self, path):
         variation_id = request.args.get('variationId')
-        return self.handle_request(path, variation_id)
+        return await self.handle_request(path, variation_id)
 
-    def handle_request(self, path, variation_id):
+    async def handle_request(self, path, variation_id):
         url = f"{self.url.rstrip('/')}/{path.lstrip('/')}"
 
         print(f"Proxying request to {url}")
 
-        response = requests.request(
+        # requests blocks, so the upstream request runs on a thread to keep the server's loop free
+        response = await asyncio.to_thread(
+            requests.request,
             method=request.method,
             url=url,
             headers={key: value for key, value in request.headers if key.lower() != 'host'},
@@ -178,5 +198,8 @@ class PlaygroundServer:
         response = Response(content, response.status_code, headers)
         return response
 
+    def asgi_app(self):
+        return AsgiApp(self.app, on_startup=[warm_up_browser_pool])
+
     def run(self, host="0.0.0.0", port=4000):
-        self.app.run(host=host, port=port, debug=True)
+        serve(self.asgi_app(), host=host, port=port, workers=1)
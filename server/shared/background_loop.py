@@ -0,0 +1,43 @@
+import asyncio
+import threading
+
+
+class BackgroundLoop:
+    """An asyncio event loop running forever on a daemon thread, shared by callers running on other threads and loops."""
+
+    def __init__(self, name):
+        self.name = name
+        self.loop = None
+        self.thread = None
+        self.lock = threading.Lock()
+
+    def start(self):
+        with self.lock:
+            if self.loop is None:
+                self.loop = asyncio.new_event_loop()
+                self.thread = threading.Thread(target=self.loop.run_forever, name=self.name, daemon=True)
+                self.thread.start()
+        return self.loop
+
+    def submit(self, coro):
+        """Schedule the coroutine on the background loop and return a concurrent.futures.Future for its result."""
+        return asyncio.run_coroutine_threadsafe(coro, self.start())
+
+    def run(self, coro):
+        """Run the coroutine on the background loop and block the calling thread until it finishes."""
+        return self.submit(coro).result()
+
+    async def run_async(self, coro):
+        """Run the coroutine on the background loop and await its result from the caller's loop."""
+        if asyncio.get_running_loop() is self.loop:
+            return await coro
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def stop(self):
+        with self.lock:
+            if self.loop is not None:
+                self.loop.call_soon_threadsafe(self.loop.stop)
+                self.thread.join()
+                self.loop.close()
+                self.loop = None
+                self.thread = None
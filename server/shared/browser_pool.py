@@ -0,0 +1,170 @@
+import asyncio
+import os
+import threading
+
+from playwright.async_api import async_playwright
+
+from server.shared.background_loop import BackgroundLoop
+
+BROWSER_POOL_SIZE = int(os.getenv('BROWSER_POOL_SIZE', 2))
+BROWSER_MAX_USES = int(os.getenv('BROWSER_MAX_USES', 50))
+
+
+class PooledBrowser:
+    def __init__(self, browser):
+        self.browser = browser
+        self.uses = 0
+
+
+class PageLease:
+    def __init__(self, pooled, context, page):
+        self.pooled = pooled
+        self.context = context
+        self.page = page
+
+
+class BrowserPool:
+    """
+    A bounded pool of long-lived Chromium browsers shared across the process.
+
+    Playwright objects are bound to the event loop they were created on, so the pool runs on its own
+    background loop and callers hand it a coroutine function that receives a fresh page to work with.
+    Every checkout gets a new browser context, so cookies and storage never leak between scrapes.
+    """
+
+    def __init__(self, size=BROWSER_POOL_SIZE, max_uses=BROWSER_MAX_USES, headless=True):
+        self.size = size
+        self.max_uses = max_uses
+        self.headless = headless
+        self.background = BackgroundLoop(name='browser-pool')
+        self.playwright = None
+        self.idle_browsers = []
+        self.semaphore = asyncio.Semaphore(size)
+
+    async def _launch(self):
+        if self.playwright is None:
+            self.playwright = await async_playwright().start()
+        browser = await self.playwright.chromium.launch(headless=self.headless)
+        return PooledBrowser(browser)
+
+    @staticmethod
+    async def _close(pooled):
+        try:
+            await pooled.browser.close()
+        except Exception as e:
+            print(f"Failed to close browser: {e}")
+
+    async def _checkout(self):
+        await self.semaphore.acquire()
+        try:
+            while self.idle_browsers:
+                pooled = self.idle_browsers.pop()
+                # Health check: the browser process may have crashed or been closed since it was returned
+                if pooled.browser.is_connected():
+                    return pooled
+                print("Discarding disconnected browser")
+                await self._close(pooled)
+            print("Launching a new browser")
+            return await self._launch()
+        except BaseException:
+            self.semaphore.release()
+            raise
+
+    async def _return(self, pooled):
+        pooled.uses += 1
+        if not pooled.browser.is_connected() or pooled.uses >= self.max_uses:
+            print(f"Recycling browser after {pooled.uses} use(s)")
+            await self._close(pooled)
+        else:
+            self.idle_browsers.append(pooled)
+        self.semaphore.release()
+
+    async def _open_page(self, viewport=None):
+        pooled = await self._checkout()
+        try:
+            context = await pooled.browser.new_context(viewport=viewport) if viewport else await pooled.browser.new_context()
+            page = await context.new_page()
+            return PageLease(pooled, context, page)
+        except BaseException:
+            await self._return(pooled)
+            raise
+
+    async def _close_page(self, lease):
+        try:
+            await lease.context.close()
+        except Exception as e:
+            print(f"Failed to close browser context: {e}")
+        await self._return(lease.pooled)
+
+    async def _run(self, scrape):
+        lease = await self._open_page()
+        try:
+            return await scrape(lease.page)
+        finally:
+            await self._close_page(lease)
+
+    async def run(self, scrape):
+        """Check out a browser, call the coroutine function with a new page and return the browser to the pool."""
+        return await self.background.run_async(self._run(scrape))
+
+    async def open_page(self, viewport=None):
+        """Check out a browser and open a new page; the lease must be given back with close_page()."""
+        if asyncio.get_running_loop() is self.background.loop:
+            return await self._open_page(viewport)
+        future = self.background.submit(self._open_page(viewport))
+        try:
+            return await asyncio.shield(asyncio.wrap_future(future))
+        except asyncio.CancelledError:
+            # The caller gave up (e.g. its step timed out) but the page may still open: give it back when it does
+            future.add_done_callback(self._close_abandoned_page)
+            raise
+
+    def _close_abandoned_page(self, future):
+        if not future.cancelled() and future.exception() is None:
+            self.background.submit(self._close_page(future.result()))
+
+    async def close_page(self, lease):
+        # Shielded, so that the browser goes back to the pool even if the caller is cancelled while closing
+        await asyncio.shield(self.background.run_async(self._close_page(lease)))
+
+    async def call(self, coro):
+        """Run a coroutine working with a leased page on the pool's loop."""
+        return await self.background.run_async(coro)
+
+    async def _warm_up(self):
+        while len(self.idle_browsers) < self.size:
+            self.idle_browsers.append(await self._launch())
+
+    def warm_up(self):
+        """Launch the browsers up front so the first requests don't pay the cold-start cost."""
+        print(f"Warming up browser pool with {self.size} browser(s)...")
+        self.background.run(self._warm_up())
+
+    async def _shutdown(self):
+        while self.idle_browsers:
+            await self._close(self.idle_browsers.pop())
+        if self.playwright is not None:
+            await self.playwright.stop()
+            self.playwright = None
+
+    def shutdown(self):
+        self.background.run(self._shutdown())
+        self.background.stop()
+
+
+_browser_pools = {}
+_browser_pools_lock = threading.Lock()
+
+
+def get_browser_pool(headless=True):
+    with _browser_pools_lock:
+        if headless not in _browser_pools:
+            _browser_pools[headless] = BrowserPool(headless=headless)
+        return _browser_pools[headless]
+
+
+def warm_up_browser_pool(headless=True):
+    try:
+        get_browser_pool(headless).warm_up()
+    except Exception as e:
+        print(f"Failed to warm up browser pool: {e}")
@@ -0,0 +1,241 @@
+import dataclasses
+import hashlib
+import os
+import pickle
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+MISSING = object()
+
+# Minimum time (in seconds) between two sweeps of a bounded disk store for expired and excess entries
+DISK_STORE_SWEEP_INTERVAL = int(os.getenv('DISK_STORE_SWEEP_INTERVAL', 60))
+
+
+def stable_hash(value) -> str:
+    """Compute a hash of the value that is stable across processes (unlike the built-in hash())."""
+    sha256_hash = hashlib.sha256()
+    _update_stable_hash(sha256_hash, value)
+    return sha256_hash.hexdigest()
+
+
+def _update_stable_hash(sha256_hash, value):
+    if value is None or isinstance(value, (bool, int, float)):
+        sha256_hash.update(f"{type(value).__name__}:{value!r};".encode('utf-8'))
+    elif isinstance(value, str):
+        encoded = value.encode('utf-8')
+        sha256_hash.update(f"str:{len(encoded)}:".encode('utf-8'))
+        sha256_hash.update(encoded)
+    elif isinstance(value, (bytes, bytearray, memoryview)):
+        sha256_hash.update(f"bytes:{len(value)}:".encode('utf-8'))
+        sha256_hash.update(value)
+    elif isinstance(value, dict):
+        sha256_hash.update(f"dict:{len(value)}:".encode('utf-8'))
+        for key_hash, item in sorted(((stable_hash(key), item) for key, item in value.items()), key=lambda pair: pair[0]):
+            sha256_hash.update(key_hash.encode('utf-8'))
+            _update_stable_hash(sha256_hash, item)
+    elif isinstance(value, (list, tuple)):
+        sha256_hash.update(f"{type(value).__name__}:{len(value)}:".encode('utf-8'))
+        for item in value:
+            _update_stable_hash(sha256_hash, item)
+    elif isinstance(value, (set, frozenset)):
+        sha256_hash.update(f"set:{len(value)}:".encode('utf-8'))
+        for item_hash in sorted(stable_hash(item) for item in value):
+            sha256_hash.update(item_hash.encode('utf-8'))
+    elif dataclasses.is_dataclass(value) and not isinstance(value, type):
+        sha256_hash.update(f"dataclass:{type(value).__qualname__}:".encode('utf-8'))
+        for field in dataclasses.fields(value):
+            sha256_hash.update(field.name.encode('utf-8'))
+            _update_stable_hash(sha256_hash, getattr(value, field.name))
+    elif hasattr(value, '__bytes__'):
+        _update_stable_hash(sha256_hash, bytes(value))
+    else:
+        raise TypeError(f"Cannot compute a stable hash for value of type {type(value).__name__}")
+
+
+class LruCache:
+    """
+    A thread-safe in-memory LRU cache bounded by the number of entries and/or their total size.
+    With a ttl (in seconds), entries older than that are missing.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None, sizeof=None, ttl=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.sizeof = sizeof or (lambda value: 0)
+        self.entries = OrderedDict()
+        self.total_bytes = 0
+        self.lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self.lock:
+            if key not in self.entries:
+                return default
+            value, size, stored_at = self.entries[key]
+            if self.ttl is not None and time.time() - stored_at > self.ttl:
+                del self.entries[key]
+                self.total_bytes -= size
+                return default
+            self.entries.move_to_end(key)
+            return value
+
+    def put(self, key, value):
+        size = self.sizeof(value)
+        if self.max_bytes is not None and size > self.max_bytes:
+            # The value would evict everything else and still not fit
+            return
+
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+            self.entries[key] = (value, size, time.time())
+            self.total_bytes += size
+            self._evict()
+
+    def remove(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.total_bytes -= self.entries.pop(key)[1]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.total_bytes = 0
+
+    def _evict(self):
+        while self.entries and (
+            (self.max_entries is not None and len(self.entries) > self.max_entries) or
+            (self.max_bytes is not None and self.total_bytes > self.max_bytes)
+        ):
+            _, (_, size, _) = self.entries.popitem(last=False)
+            self.total_bytes -= size
+
+    def __len__(self):
+        return len(self.entries)
+
+    def __contains__(self, key):
+        with self.lock:
+            return key in self.entries
+
+
+class DiskStore:
+    """
+    A content-addressed on-disk store of pickled values with an optional time-to-live (in seconds) and total size.
+
+    A bounded store is swept at most every sweep_interval seconds when entries are added: expired entries are
+    deleted, then the oldest ones until the store fits in max_bytes.
+    """
+
+    def __init__(self, folder, ttl=None, suffix='.pkl', max_bytes=None, sweep_interval=DISK_STORE_SWEEP_INTERVAL):
+        self.folder = folder
+        self.ttl = ttl
+        self.suffix = suffix
+        self.max_bytes = max_bytes
+        self.sweep_interval = sweep_interval
+        self.last_sweep = None
+        self.sweep_lock = threading.Lock()
+
+    def _path(self, key):
+        return os.path.join(self.folder, key[:2], f"{key}{self.suffix}")
+
+    def get(self, key, default=None):
+        path = self._path(key)
+        try:
+            if self.ttl is not None and time.time() - os.path.getmtime(path) > self.ttl:
+                os.remove(path)
+                return default
+            with open(path, 'rb') as f:
+                return self.load(f)
+        except FileNotFoundError:
+            return default
+        except Exception as e:
+            print(f"Failed to read cache entry {path}: {e}")
+            return default
+
+    def put(self, key, value):
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Write to a temporary file first so readers never see a partially written entry
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path))
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                self.dump(value, f)
+            os.replace(tmp_path, path)
+        except Exception:
+            os.remove(tmp_path)
+            raise
+        self._maybe_sweep()
+
+    def _maybe_sweep(self):
+        if self.ttl is None and self.max_bytes is None:
+            return
+        now = time.monotonic()
+        if self.last_sweep is not None and now - self.last_sweep < self.sweep_interval:
+            return
+        # A single writer sweeps; the others go on without waiting for it
+        if not self.sweep_lock.acquire(blocking=False):
+            return
+        try:
+            self.last_sweep = now
+            deleted = self.sweep()
+            if deleted:
+                print(f"Deleted {deleted} entries from {self.folder}")
+        except Exception as e:
+            print(f"Failed to sweep {self.folder}: {e}")
+        finally:
+            self.sweep_lock.release()
+
+    def sweep(self):
+        """Delete the expired entries, then the oldest ones until the store fits in max_bytes; returns how many were deleted."""
+        entries = []
+        for dirpath, _, filenames in os.walk(self.folder):
+            for filename in filenames:
+                if filename.endswith(self.suffix):
+                    path = os.path.join(dirpath, filename)
+                    try:
+                        stat = os.stat(path)
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, path))
+
+        entries.sort()
+        total_bytes = sum(size for _, size, _ in entries)
+        now = time.time()
+        deleted = 0
+        for mtime, size, path in entries:
+            expired = self.ttl is not None and now - mtime > self.ttl
+            too_large = self.max_bytes is not None and total_bytes > self.max_bytes
+            if not expired and not too_large:
+                # Entries are sorted from the oldest, so the remaining ones are neither expired nor in excess
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total_bytes -= size
+            deleted += 1
+        return deleted
+
+    def remove(self, key):
+        try:
+            os.remove(self._path(key))
+        except FileNotFoundError:
+            pass
+
+    def load(self, f):
+        return pickle.load(f)
+
+    def dump(self, value, f):
+        pickle.dump(value, f, protocol=pickle.HIGHEST_PROTOCOL)
+
+
+class BytesDiskStore(DiskStore):
+    """A DiskStore that keeps raw bytes values as-is instead of pickling them."""
+
+    def load(self, f):
+        return f.read()
+
+    def dump(self, value, f):
+        f.write(value)
@@ -0,0 +1,124 @@
+import asyncio
+import concurrent.futures
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import openai
+from playwright.async_api import TimeoutError as PlaywrightTimeoutError
+
+# Failures in a row after which calls to a dependency are rejected, and for how long (in seconds)
+CIRCUIT_BREAKER_FAILURE_THRESHOLD = int(os.getenv('CIRCUIT_BREAKER_FAILURE_THRESHOLD', 5))
+CIRCUIT_BREAKER_RECOVERY_TIME = float(os.getenv('CIRCUIT_BREAKER_RECOVERY_TIME', 30))
+
+# Errors showing that a dependency is failing: timeouts, unreachable endpoints and server errors. Other errors,
+# e.g. an output that can't be parsed or a bad input, are the caller's own and leave the circuit as it is
+DEPENDENCY_ERRORS = (
+    TimeoutError,
+    asyncio.TimeoutError,
+    concurrent.futures.TimeoutError,
+    ConnectionError,
+    openai.APIConnectionError,
+    openai.InternalServerError,
+    openai.RateLimitError,
+    PlaywrightTimeoutError,
+)
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose circuit is open."""
+
+    def __init__(self, name, retry_in):
+        super().__init__(f"'{name}' is failing, calls are rejected for the next {retry_in:.0f}s")
+        self.name = name
+        self.retry_in = retry_in
+
+
+class CircuitBreaker:
+    """
+    Fails calls to an external dependency fast while it is failing, instead of letting every caller wait for
+    its own timeouts and retries.
+
+    Only DEPENDENCY_ERRORS count as failures. After failure_threshold failures in a row the circuit opens and
+    calls are rejected with CircuitOpenError for recovery_time seconds. Then a single trial call is let through
+    (half-open): the circuit closes if it succeeds and opens again if it fails. Thread-safe, so it can be shared
+    by all the jobs.
+    """
+
+    def __init__(self, name, failure_threshold=CIRCUIT_BREAKER_FAILURE_THRESHOLD, recovery_time=CIRCUIT_BREAKER_RECOVERY_TIME, failure_errors=DEPENDENCY_ERRORS):
+        self.name = name
+        self.failure_errors = failure_errors
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.trial_in_flight = False
+        self.lock = threading.Lock()
+
+    def before_call(self):
+        """Raise CircuitOpenError if the call must be rejected."""
+        with self.lock:
+            if self.state == OPEN:
+                retry_in = self.opened_at + self.recovery_time - time.monotonic()
+                if retry_in > 0:
+                    raise CircuitOpenError(self.name, retry_in)
+                self.state = HALF_OPEN
+            if self.state == HALF_OPEN:
+                if self.trial_in_flight:
+                    raise CircuitOpenError(self.name, 0)
+                self.trial_in_flight = True
+
+    def record_success(self):
+        with self.lock:
+            if self.state != CLOSED:
+                print(f"Circuit '{self.name}' closed")
+            self.state = CLOSED
+            self.failures = 0
+            self.trial_in_flight = False
+
+    def record_failure(self):
+        with self.lock:
+            self.failures += 1
+            self.trial_in_flight = False
+            if self.state == HALF_OPEN or (self.state == CLOSED and self.failures >= self.failure_threshold):
+                print(f"Circuit '{self.name}' opened after {self.failures} failure(s) in a row")
+                self.state = OPEN
+                self.opened_at = time.monotonic()
+
+    def release(self):
+        """Give up a call that neither succeeded nor failed, e.g. a cancelled one or one failing on its own."""
+        with self.lock:
+            self.trial_in_flight = False
+
+    @contextmanager
+    def call(self):
+        """Guard the block as a call to the dependency: rejected if the circuit is open, and counted otherwise."""
+        self.before_call()
+        try:
+            yield
+        except self.failure_errors:
+            self.record_failure()
+            raise
+        except BaseException:
+            self.release()
+            raise
+        else:
+            self.record_success()
+
+
+_circuit_breakers = {}
+_circuit_breakers_lock = threading.Lock()
+
+
+def get_circuit_breaker(name):
+    """Return the circuit breaker shared by everything that calls the named dependency."""
+    with _circuit_breakers_lock:
+        if name not in _circuit_breakers:
+            _circuit_breakers[name] = CircuitBreaker(name)
+        return _circuit_breakers[name]
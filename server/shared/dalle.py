@@ -1,10 +1,14 @@
+import base64
 import json
 import os
+import threading
+from concurrent.futures import Future
 
 from openai import AzureOpenAI
 from dotenv import load_dotenv
 
-from server.shared.image import load_image, image_to_data_url
+from server.shared.cache import BytesDiskStore, LruCache, stable_hash
+from server.shared.image import load_image, image_to_bytes
 
 load_dotenv()
 
@@ -13,6 +17,12 @@ AZURE_OPENAI_ENDPOINT = os.getenv('AZURE_OPENAI_DALLE_ENDPOINT')
 
 MODEL_NAME = "Dalle3"
 
+DALLE_CACHE_MAX_BYTES = int(os.getenv('DALLE_CACHE_MAX_BYTES', 256 * 1024 * 1024))
+DALLE_CACHE_DIR = os.getenv('DALLE_CACHE_DIR', 'cache/dalle')
+# Bounds of the disk tier: its total size and how long (in seconds) images are kept, 30 days by default
+DALLE_CACHE_DISK_MAX_BYTES = int(os.getenv('DALLE_CACHE_DISK_MAX_BYTES', 1024 * 1024 * 1024))
+DALLE_CACHE_DISK_TTL = int(os.getenv('DALLE_CACHE_DISK_TTL', 30 * 24 * 60 * 60))
+
 
 client = AzureOpenAI(
     api_key=AZURE_OPENAI_API_KEY,
@@ -21,22 +31,94 @@ client = AzureOpenAI(
 )
 
 
-class DalleClient:
-    def __init__(self):
-        self.cache = {}
+class ImageCache:
+    """
+    A process-wide cache of generated images keyed by prompt hash.
+    Keeps raw image bytes in a byte-bounded LRU, spills them to disk and lets concurrent
+    requests for the same prompt share a single generation.
+    """
 
-    def generate_image(self, prompt):
-        if prompt in self.cache:
+    def __init__(self, max_bytes=DALLE_CACHE_MAX_BYTES, folder=DALLE_CACHE_DIR, disk_max_bytes=DALLE_CACHE_DISK_MAX_BYTES, disk_ttl=DALLE_CACHE_DISK_TTL):
+        self.memory = LruCache(max_bytes=max_bytes, sizeof=len)
+        self.disk = BytesDiskStore(folder, ttl=disk_ttl, suffix='.png', max_bytes=disk_max_bytes) if folder else None
+        self.in_flight = {}
+        self.lock = threading.Lock()
+
+    @staticmethod
+    def make_key(prompt):
+        return stable_hash({"model": MODEL_NAME, "prompt": prompt})
+
+    def get(self, key):
+        image = self.memory.get(key)
+        if image is None and self.disk:
+            image = self.disk.get(key)
+            if image is not None:
+                self.memory.put(key, image)
+        return image
+
+    def put(self, key, image):
+        self.memory.put(key, image)
+        if self.disk:
+            try:
+                self.disk.put(key, image)
+            except Exception as e:
+                print(f"Failed to store image on disk: {e}")
+
+    def get_or_generate(self, prompt, generate):
+        key = self.make_key(prompt)
+
+        image = self.get(key)
+        if image is not None:
             print(f"Cache hit for prompt: {prompt}")
-            return self.cache[prompt]
+            return image
+
+        with self.lock:
+            future = self.in_flight.get(key)
+            is_leader = future is None
+            if is_leader:
+                future = Future()
+                self.in_flight[key] = future
+
+        if not is_leader:
+            print(f"Waiting for in-flight generation of prompt: {prompt}")
+            return future.result()
+
+        try:
+            # Another generation of the same prompt may have finished in the meantime
+            image = self.get(key)
+            if image is None:
+                image = generate(prompt)
+                self.put(key, image)
+            future.set_result(image)
+            return image
+        except Exception as e:
+            future.set_exception(e)
+            raise e
+        finally:
+            with self.lock:
+                del self.in_flight[key]
+
+
+image_cache = ImageCache()
+
+
+class DalleClient:
+    def __init__(self, cache=image_cache):
+        self.cache = cache
+
+    @staticmethod
+    def _generate(prompt):
         result = client.images.generate(
             model=MODEL_NAME,
             prompt=prompt,
             n=1
         )
         image_url = json.loads(result.model_dump_json())['data'][0]['url']
-        image = load_image(image_url)
-        data_url = image_to_data_url(image)
-        self.cache[prompt] = data_url
-        return image_to_data_url(image)
+        return image_to_bytes(load_image(image_url))
 
+    def generate_image_bytes(self, prompt):
+        return self.cache.get_or_generate(prompt, self._generate)
+
+    def generate_image(self, prompt):
+        image_encoded_data = base64.b64encode(self.generate_image_bytes(prompt)).decode('utf-8')
+        return f"data:image/png;base64,{image_encoded_data}"
@@ -0,0 +1,173 @@
+import re
+
+from server.shared.html_utils import SourceParser, compute_unique_hash
+
+# Elements that don't render anything; void ones have no end tag
+NON_VISUAL_TAGS = {'script', 'noscript', 'template', 'meta', 'link', 'base'}
+VOID_TAGS = {'meta', 'link', 'base'}
+# Elements whose content is kept out of the prompt but whose start tag (size, class, fill...) stays editable
+OPAQUE_CONTENT_TAGS = {'svg'}
+# Elements in which whitespace is rendered as is
+PREFORMATTED_TAGS = ('pre', 'textarea')
+
+URL_ATTRIBUTES = {'href', 'src', 'srcset', 'poster', 'action', 'data-src', 'data-srcset'}
+# Data URIs with a MIME type, in attribute values and url() of styles (and not, say, "metadata:" in the text)
+DATA_URI_PATTERN = re.compile(
+    r'''(?:(?<==["'])|(?<=url\()|(?<=url\(["']))data:[\w.+-]+/[\w.+-]+(?:;[\w.+-]+=[\w.+-]+)*(?:;base64)?,[^\s"'()<>]+''',
+    re.IGNORECASE
+)
+PLACEHOLDER_PATTERN = re.compile(r'<!--hash:[0-9a-f]{12}-->|hash://[0-9a-f]{12}')
+WHITESPACE_PATTERN = re.compile(r'\s{2,}')
+PREFORMATTED_PATTERN = re.compile(r'(<(%s)\b.*?</\2\s*>)' % '|'.join(PREFORMATTED_TAGS), re.IGNORECASE | re.DOTALL)
+
+# Rough number of characters per token, as for rate limiting
+CHARACTERS_PER_TOKEN = 4
+
+
+class CompactedHtml:
+    """HTML compacted for a prompt, with what was replaced by placeholders to restore it in the model's output."""
+
+    def __init__(self, html, replacements, original_size, truncated=False):
+        self.html = html
+        self.replacements = replacements
+        self.original_size = original_size
+        self.truncated = truncated
+
+    def restore(self, html):
+        """Put back what the placeholders in the HTML (the compacted HTML or the model's edit of it) stand for."""
+        restored = PLACEHOLDER_PATTERN.sub(lambda match: self.replacements.get(match.group(0), match.group(0)), html)
+        missing = [placeholder for placeholder in self.replacements if placeholder not in html]
+        if missing:
+            print(f"{len(missing)} placeholders are missing from the HTML and could not be restored")
+        return restored
+
+    def stats(self):
+        compacted_size = len(self.html)
+        return {
+            "original_size": self.original_size,
+            "compacted_size": compacted_size,
+            "reduction": 1 - compacted_size / self.original_size if self.original_size else 0.0,
+            "tokens_saved": (self.original_size - compacted_size) // CHARACTERS_PER_TOKEN,
+            "placeholders": len(self.replacements),
+            "truncated": self.truncated,
+        }
+
+
+class _CompactingParser(SourceParser):
+    """Replaces what the compactor drops with placeholders, keeping everything else byte for byte."""
+
+    def __init__(self, compactor, source):
+        super().__init__(source)
+        self.compactor = compactor
+        self.replacements = {}
+        # The element being dropped or emptied: (tag, offset to replace from, nesting depth)
+        self.skipping = None
+
+    def placeholder(self, text, kind):
+        digest = compute_unique_hash(text)[:12]
+        key = f'hash://{digest}' if kind == 'url' else f'<!--hash:{digest}-->'
+        self.replacements[key] = text
+        return key
+
+    def replace(self, start, end, kind):
+        self.edits.append((start, end, self.placeholder(self.source[start:end], kind)))
+
+    def _start(self, tag, self_closing):
+        start = self.source_offset()
+        raw = self.get_starttag_text()
+        if self.skipping is not None:
+            if tag == self.skipping[0] and not self_closing:
+                self.skipping = (tag, self.skipping[1], self.skipping[2] + 1)
+            return
+
+        if self.compactor.strip_non_visual and tag in NON_VISUAL_TAGS:
+            if tag in VOID_TAGS or self_closing:
+                self.replace(start, start + len(raw), 'node')
+            else:
+                self.skipping = (tag, start, 1)
+            return
+
+        if self.compactor.hash_urls:
+            for name, value, value_start, value_end in self.attribute_values():
+                if name in URL_ATTRIBUTES and self.compactor.is_long_url(value):
+                    self.replace(value_start, value_end, 'url')
+
+        if tag in OPAQUE_CONTENT_TAGS and not self_closing:
+            self.skipping = (tag, start + len(raw), 1)
+
+    def handle_starttag(self, tag, attrs):
+        self._start(tag, self_closing=False)
+
+    def handle_startendtag(self, tag, attrs):
+        self._start(tag, self_closing=True)
+
+    def handle_endtag(self, tag):
+        if self.skipping is None or tag != self.skipping[0]:
+            return
+        skipped_tag, skip_start, depth = self.skipping
+        if depth > 1:
+            self.skipping = (skipped_tag, skip_start, depth - 1)
+            return
+
+        start = self.source_offset()
+        self.skipping = None
+        if skipped_tag in OPAQUE_CONTENT_TAGS:
+            # Only the content is replaced, the element itself stays
+            if start > skip_start:
+                self.replace(skip_start, start, 'node')
+        else:
+            self.replace(skip_start, self.source.index('>', start) + 1, 'node')
+
+    def handle_comment(self, data):
+        if self.skipping is None and self.compactor.strip_non_visual:
+            start = self.source_offset()
+            self.replace(start, self.source.index('-->', start + 4) + 3, 'node')
+
+
+class HtmlCompactor:
+    """
+    Compacts HTML before it is sent to an LLM: drops non-visual nodes (scripts, comments, meta...), replaces the
+    content of inline SVGs, long URLs and data URIs with short placeholders and collapses whitespace. Everything
+    replaced is restored exactly by CompactedHtml.restore(); with max_tokens the HTML is also cut at a tag
+    boundary, which can't be restored, so only use it when the output isn't HTML.
+    """
+
+    def __init__(self, strip_non_visual=True, hash_urls=True, min_url_length=64, collapse_whitespace=True, max_tokens=None):
+        self.strip_non_visual = strip_non_visual
+        self.hash_urls = hash_urls
+        self.min_url_length = min_url_length
+        self.collapse_whitespace = collapse_whitespace
+        self.max_tokens = max_tokens
+
+    def is_long_url(self, url):
+        return url.startswith('data:') or len(url) >= self.min_url_length
+
+    def compact(self, html):
+        parser = _CompactingParser(self, html).parse()
+        if parser.skipping is not None:
+            # An element left open runs to the end of the HTML
+            parser.replace(parser.skipping[1], len(html), 'node')
+        compacted = parser.rewrite()
+
+        if self.hash_urls:
+            # Data URIs also hide in inline styles and style sheets
+            compacted = DATA_URI_PATTERN.sub(
+                lambda match: parser.placeholder(match.group(0), 'url') if self.is_long_url(match.group(0)) else match.group(0),
+                compacted
+            )
+
+        if self.collapse_whitespace:
+            compacted = ''.join(
+                part if index % 3 == 1 else WHITESPACE_PATTERN.sub(lambda match: match.group(0)[0], part)
+                for index, part in enumerate(PREFORMATTED_PATTERN.split(compacted))
+                if index % 3 != 2
+            )
+
+        truncated = False
+        if self.max_tokens and len(compacted) > self.max_tokens * CHARACTERS_PER_TOKEN:
+            cut = compacted.rfind('>', 0, self.max_tokens * CHARACTERS_PER_TOKEN) + 1
+            compacted = compacted[:cut]
+            truncated = True
+
+        used = set(PLACEHOLDER_PATTERN.findall(compacted))
+        return CompactedHtml(compacted, {key: value for key, value in parser.replacements.items() if key in used}, len(html), truncated)
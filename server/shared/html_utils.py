@@ -1,7 +1,11 @@
 import base64
 import hashlib
+import re
+from html import escape, unescape
+from html.parser import HTMLParser
 
-from bs4 import BeautifulSoup
+URL_ATTRIBUTES = ('href', 'src', 'srcset')
+ATTRIBUTE_PATTERN = re.compile(r'''(\s)([^\s"'>/=]+)(\s*=\s*)("[^"]*"|'[^']*'|[^\s"'=<>`]+)''')
 
 
 def compute_unique_hash(input_string):
@@ -12,45 +16,130 @@ def compute_unique_hash(input_string):
     return hex_digest
 
 
+class SourceParser(HTMLParser):
+    """
+    An html.parser that knows where in the source each event is, so that parts of the source can be rewritten
+    while everything else stays byte for byte; subclasses collect (start, end, replacement) edits.
+    """
+
+    def __init__(self, source):
+        super().__init__(convert_charrefs=False)
+        self.source = source
+        self.line_offsets = [0] + [match.end() for match in re.finditer('\n', source)]
+        self.edits = []
+
+    def source_offset(self):
+        """The offset in the source of the event being handled."""
+        line, column = self.getpos()
+        return self.line_offsets[line - 1] + column
+
+    def attribute_values(self):
+        """Yield the name, raw value and source span of the value of each attribute of the start tag being handled."""
+        start = self.source_offset()
+        for match in ATTRIBUTE_PATTERN.finditer(self.get_starttag_text()):
+            value = match.group(4)
+            quote = 1 if value[0] in '"\'' else 0
+            value_start = start + match.start(4) + quote
+            yield match.group(2).lower(), value[quote:len(value) - quote], value_start, value_start + len(value) - 2 * quote
+
+    def parse(self):
+        self.feed(self.source)
+        self.close()
+        return self
+
+    def rewrite(self, start=0, end=None):
+        """Return the source (or the part of it from start to end) with the edits in it applied."""
+        end = len(self.source) if end is None else end
+        parts = []
+        position = start
+        for edit_start, edit_end, replacement in sorted(self.edits, key=lambda edit: edit[0]):
+            if edit_start < position or edit_end > end:
+                continue
+            parts.append(self.source[position:edit_start])
+            parts.append(replacement)
+            position = edit_end
+        parts.append(self.source[position:end])
+        return ''.join(parts)
+
+
+class UrlMapping(dict):
+    """A hash to URL mapping that also indexes the hash of each URL, for callers that hash many documents."""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__()
+        self.hashes = {}
+        self.update(*args, **kwargs)
+
+    def __setitem__(self, hash_value, url):
+        super().__setitem__(hash_value, url)
+        self.hashes.setdefault(url, hash_value)
+
+    def update(self, *args, **kwargs):
+        for hash_value, url in dict(*args, **kwargs).items():
+            self[hash_value] = url
+
+
+class _UrlHasher(SourceParser):
+    def __init__(self, source, url_mapping, min_length):
+        super().__init__(source)
+        self.url_mapping = url_mapping
+        # Mappings that aren't a UrlMapping are indexed once instead of scanned for every URL
+        self.hashes = url_mapping.hashes if isinstance(url_mapping, UrlMapping) else {url: hash_value for hash_value, url in url_mapping.items()}
+        self.min_length = min_length
+        self.body_start = None
+        self.body_end = None
+
+    def hash_url(self, url):
+        if url not in self.hashes:
+            # compute unique hash value for long almost identical URLs
+            hash_value = f'hash://{compute_unique_hash(url)}'
+            self.url_mapping[hash_value] = url
+            self.hashes[url] = hash_value
+        return self.hashes[url]
+
+    def handle_starttag(self, tag, attrs):
+        if tag == 'body' and self.body_start is None:
+            self.body_start = self.source_offset()
+        for name, value, start, end in self.attribute_values():
+            if name in URL_ATTRIBUTES and len(value) > self.min_length:
+                self.edits.append((start, end, self.hash_url(unescape(value))))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+    def handle_endtag(self, tag):
+        if tag == 'body':
+            self.body_end = self.source.index('>', self.source_offset()) + 1
+
+
+class _HashResolver(SourceParser):
+    def __init__(self, source, url_mapping):
+        super().__init__(source)
+        self.url_mapping = url_mapping
+
+    def handle_starttag(self, tag, attrs):
+        for name, value, start, end in self.attribute_values():
+            if value.startswith('hash://') and value in self.url_mapping:
+                self.edits.append((start, end, escape(self.url_mapping[value])))
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs)
+
+
 def convert_urls_to_hashes(html_string, url_mapping, min_length=0):
-    def hash_url(url):
-        if url in url_mapping.values():
-            return next(k for k, v in url_mapping.items() if v == url)
-        # compute unique hash value for long almost identical URLs
-        hash_value = f'hash://{compute_unique_hash(url)}'
-        url_mapping[hash_value] = url
-        return hash_value
-
-    def traverse_and_hash(node):
-        if node.name is None:
-            return node if node else ''
-        attributes = {}
-        for attr, value in node.attrs.items():
-            if attr in ['href', 'src', 'srcset'] and len(value) > min_length:
-                value = f"{hash_url(value)}"
-            attributes[attr] = value
-        open_tag = f"<{node.name}{' ' + ' '.join([f'{k}=\"{v}\"' for k, v in attributes.items()]) if attributes else ''}>"
-        close_tag = f"</{node.name}>"
-        children = ''.join([traverse_and_hash(child) for child in node.children if child.name or child.string])
-        return f"{open_tag}{children}{close_tag}"
-
-    soup = BeautifulSoup(html_string, 'html.parser')
-    body = soup.body or soup
-    hashed_html = traverse_and_hash(body)
-    return str(BeautifulSoup(hashed_html, 'html.parser')).replace('<!--[document]-->', '').replace('&lt;[document]&gt;', '').strip()
+    """
+    Replace the URLs in the href, src and srcset attributes of the body (or the whole HTML if it has none) with
+    hashes, adding them to url_mapping; the rest of the HTML is kept as is.
+    """
+    hasher = _UrlHasher(html_string, url_mapping, min_length).parse()
+    if hasher.body_start is None:
+        return hasher.rewrite().strip()
+    return hasher.rewrite(hasher.body_start, hasher.body_end).strip()
 
 
 def convert_hashes_to_urls(compressed_html, url_mapping):
-    def reconstruct_url(hash_value):
-        return url_mapping.get(hash_value)
-
-    soup = BeautifulSoup(compressed_html, 'html.parser')
-    for tag in soup.find_all():
-        for attr, value in tag.attrs.items():
-            if isinstance(value, str) and value.startswith('hash://'):
-                original_url = reconstruct_url(value)
-                tag[attr] = original_url
-    return str(soup)
+    """Replace the attribute values that are hashes in url_mapping with their URLs; the rest of the HTML is kept as is."""
+    return _HashResolver(compressed_html, url_mapping).parse().rewrite()
 
 
 def insert_css_into_html(html_string, css_strings):
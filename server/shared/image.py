@@ -1,4 +1,6 @@
 import base64
+import functools
+import hashlib
 import io
 
 from PIL import Image
@@ -77,3 +79,103 @@ def image_to_data_url(image: Image.Image, format: str = 'PNG') -> str:
     image_bytes = image_to_bytes(image, format)
     image_encoded_data = base64.b64encode(image_bytes).decode('utf-8')
     return f"data:image/{format.lower()};base64,{image_encoded_data}"
+
+
+class ImagePolicy:
+    """
+    How images are prepared for a vision model: downscaled to fit max_size with the shortest side at most
+    max_short_side (the model would downscale them anyway), and recompressed as JPEG when that is smaller.
+    """
+
+    def __init__(self, max_size=2048, max_short_side=768, jpeg_quality=85):
+        self.max_size = max_size
+        self.max_short_side = max_short_side
+        self.jpeg_quality = jpeg_quality
+
+    def key(self):
+        return self.max_size, self.max_short_side, self.jpeg_quality
+
+
+class ImageHandle:
+    """
+    Image bytes that lazily compute and remember their digest, dimensions and base64 data URL, as well as
+    the smaller variants prepared for vision models, so that an image passed between pipeline steps and
+    sent with several requests is only encoded once.
+    """
+
+    def __init__(self, data: bytes, mime_type: str = None):
+        self.data = bytes(data)
+        self._mime_type = mime_type
+        self._variants = {}
+
+    @classmethod
+    def from_data_url(cls, data_url: str) -> 'ImageHandle':
+        header, encoded = data_url.split(',', 1)
+        handle = cls(base64.b64decode(encoded), mime_type=header.split(':', 1)[1].split(';', 1)[0])
+        handle.__dict__['data_url'] = data_url
+        return handle
+
+    @classmethod
+    def from_image(cls, image: Image.Image, format: str = 'PNG') -> 'ImageHandle':
+        return cls(image_to_bytes(image, format), mime_type=f"image/{format.lower()}")
+
+    def __bytes__(self):
+        return self.data
+
+    def __len__(self):
+        return len(self.data)
+
+    def __getstate__(self):
+        # Memoized encodings are cheap to recompute and would only bloat pickles and copies
+        return {'data': self.data, '_mime_type': self._mime_type}
+
+    def __setstate__(self, state):
+        self.__init__(state['data'], state['_mime_type'])
+
+    def open(self) -> Image.Image:
+        return Image.open(BytesIO(self.data))
+
+    @functools.cached_property
+    def digest(self) -> str:
+        return hashlib.sha256(self.data).hexdigest()
+
+    @functools.cached_property
+    def _info(self):
+        image = self.open()
+        return image.size, Image.MIME.get(image.format, 'image/png')
+
+    @property
+    def size(self):
+        return self._info[0]
+
+    @property
+    def mime_type(self) -> str:
+        return self._mime_type or self._info[1]
+
+    @functools.cached_property
+    def data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{base64.b64encode(self.data).decode('utf-8')}"
+
+    def prepare(self, policy: ImagePolicy) -> 'ImageHandle':
+        """Return the smallest acceptable variant of the image for the policy (possibly the image itself)."""
+        variant = self._variants.get(policy.key())
+        if variant is None:
+            variant = self._prepare(policy)
+            self._variants[policy.key()] = variant
+        return variant
+
+    def _prepare(self, policy: ImagePolicy) -> 'ImageHandle':
+        image = self.open()
+        width, height = image.size
+        scale = min(1.0, policy.max_size / max(width, height), policy.max_short_side / min(width, height))
+        if scale < 1.0:
+            image = image.resize((max(1, round(width * scale)), max(1, round(height * scale))), Image.Resampling.LANCZOS)
+
+        candidates = [self] if scale == 1.0 else [ImageHandle.from_image(image)]
+        # JPEG has no transparency, so only opaque images are recompressed
+        if image.mode in ('RGB', 'L') or (image.mode in ('RGBA', 'P') and image.convert('RGBA').getextrema()[3][0] == 255):
+            jpeg_buffer = BytesIO()
+            image.convert('RGB').save(jpeg_buffer, format='JPEG', quality=policy.jpeg_quality, optimize=True)
+            candidates.append(ImageHandle(jpeg_buffer.getvalue(), mime_type='image/jpeg'))
+
+        return min(candidates, key=len)
@@ -1,28 +1,47 @@
+import asyncio
 import base64
 import datetime
 import hashlib
 import json
 import os
 import re
+import threading
+import time
 from enum import Enum, auto
 
 import backoff
 import openai
 from dotenv import load_dotenv
 from jsonschema.validators import validate
-from openai import AzureOpenAI, OpenAI
+from openai import AsyncAzureOpenAI, AsyncOpenAI
+from openai.types.chat import ChatCompletionMessage, ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
 from jinja2 import Template
 import yaml
 import inspect
-from concurrent.futures import ThreadPoolExecutor, as_completed
 
 from server.generation_pipelines.pipeline_steps.read_schemas import bundle_schemas
+from server.shared.background_loop import BackgroundLoop
+from server.shared.image import ImageHandle, ImagePolicy
+from server.shared.prompt_cache import LLM_CACHE_ENABLED, prompt_cache
+from server.shared.llm_router import LLM_DEPLOYMENTS, Deployment, DeploymentPool, hedger
+from server.shared.rate_limiter import Priority
+from server.shared.telemetry import current_scope, llm_call, record_llm_retry
 
 load_dotenv()
 
 
 OPENAI_API_TYPE = os.getenv('OPENAI_API_TYPE').lower()
 
+LLM_BATCH_CONCURRENCY = int(os.getenv('LLM_BATCH_CONCURRENCY', 8))
+# Minimum time (in seconds) between two progress reports of a streamed completion
+LLM_STREAM_PROGRESS_INTERVAL = float(os.getenv('LLM_STREAM_PROGRESS_INTERVAL', 0.5))
+# Defaults for tools that don't set a timeout (in seconds) or max_concurrency in their docstring
+LLM_TOOL_TIMEOUT = float(os.getenv('LLM_TOOL_TIMEOUT', 120))
+LLM_TOOL_MAX_CONCURRENCY = int(os.getenv('LLM_TOOL_MAX_CONCURRENCY', 4))
+
+llm_loop = BackgroundLoop(name='llm')
+
 
 class ApiType(Enum):
     OPENAI = "openai"
@@ -50,22 +69,72 @@ OPENAI_AZURE_MODELS = {
     ModelType.GPT_35_TURBO: "gpt-35-turbo"
 }
 
+# Images are sent in high detail, for which the models downscale them to fit 2048x2048 with the shortest side at 768px
+VISION_IMAGE_POLICIES = {
+    ModelType.GPT_4_OMNI: ImagePolicy(max_size=2048, max_short_side=768),
+    ModelType.GPT_4_MINI: ImagePolicy(max_size=2048, max_short_side=768),
+    ModelType.GPT_4_VISION: ImagePolicy(max_size=2048, max_short_side=768),
+}
+
 
-def create_llm_client():
+def create_llm_client(endpoint=None, api_key=None, max_retries=openai.DEFAULT_MAX_RETRIES):
     if OPENAI_API_TYPE == ApiType.AZURE.value:
-        return AzureOpenAI(
-            azure_endpoint=os.getenv('AZURE_OPENAI_ENDPOINT'),
-            api_key=os.getenv('AZURE_OPENAI_API_KEY'),
-            api_version="2024-02-01"
+        return AsyncAzureOpenAI(
+            azure_endpoint=endpoint or os.getenv('AZURE_OPENAI_ENDPOINT'),
+            api_key=api_key or os.getenv('AZURE_OPENAI_API_KEY'),
+            api_version="2024-02-01",
+            max_retries=max_retries
         )
     elif OPENAI_API_TYPE == ApiType.OPENAI.value:
-        return OpenAI(
-            api_key=os.getenv('OPENAI_API_KEY'),
+        return AsyncOpenAI(
+            base_url=endpoint,
+            api_key=api_key or os.getenv('OPENAI_API_KEY'),
+            max_retries=max_retries
         )
     else:
         raise ValueError("Invalid API type. Please set OPENAI_API_TYPE to 'openai' or 'azure' in the .env file.")
 
 
+_async_llm_clients = {}
+_async_llm_clients_lock = threading.Lock()
+
+
+def get_async_llm_client(endpoint=None, api_key=None, max_retries=openai.DEFAULT_MAX_RETRIES):
+    """Return the process-wide client (and with it the HTTP connection pool) for the endpoint."""
+    if endpoint is None and OPENAI_API_TYPE == ApiType.AZURE.value:
+        endpoint = os.getenv('AZURE_OPENAI_ENDPOINT')
+    key = (OPENAI_API_TYPE, endpoint, api_key, max_retries)
+    with _async_llm_clients_lock:
+        if key not in _async_llm_clients:
+            _async_llm_clients[key] = create_llm_client(endpoint, api_key, max_retries)
+        return _async_llm_clients[key]
+
+
+_deployment_pools = {}
+_deployment_pools_lock = threading.Lock()
+
+
+def get_deployment_pool(model_type):
+    """Return the process-wide pool of the deployments configured for the model type in LLM_DEPLOYMENTS."""
+    with _deployment_pools_lock:
+        if model_type not in _deployment_pools:
+            configs = LLM_DEPLOYMENTS.get(model_type.name) or [{}]
+            # With several deployments, failing over is faster than the client retrying the same one
+            max_retries = 0 if len(configs) > 1 else openai.DEFAULT_MAX_RETRIES
+            _deployment_pools[model_type] = DeploymentPool([
+                Deployment(
+                    get_async_llm_client(config.get("endpoint"), config.get("api_key"), max_retries),
+                    config.get("deployment") or get_model_name(model_type),
+                    endpoint=config.get("endpoint"),
+                    weight=config.get("weight", 1.0),
+                    rpm=config.get("rpm"),
+                    tpm=config.get("tpm"),
+                )
+                for config in configs
+            ])
+        return _deployment_pools[model_type]
+
+
 def get_model_name(model_type):
     if OPENAI_API_TYPE == ApiType.AZURE.value:
         return OPENAI_AZURE_MODELS[model_type]
@@ -75,9 +144,9 @@ def get_model_name(model_type):
         raise ValueError("Invalid API type. Please set OPENAI_API_TYPE to 'openai' or 'azure' in the .env file.")
 
 
-@backoff.on_exception(backoff.expo, openai.RateLimitError, max_time=60)
-def completions_with_backoff(client, **kwargs):
-    return client.chat.completions.create(**kwargs)
+@backoff.on_exception(backoff.expo, openai.RateLimitError, max_time=60, on_backoff=record_llm_retry)
+async def async_completions_with_backoff(deployment_pool, priority=Priority.NORMAL, flow=None, exclude=(), tried=None, **kwargs):
+    return await deployment_pool.send(kwargs, priority, flow, exclude, tried)
 
 
 def create_prompt_from_template(file_path, **kwargs):
@@ -129,6 +198,94 @@ def execute_tool(tool, tool_args, allowed_tools):
     return tool_name, result
 
 
+class ToolRunner:
+    """
+    Executes the tool calls of a completion concurrently on the LLM loop.
+
+    Each tool can set `timeout` (in seconds) and `max_concurrency` (across all running completions) in its
+    YAML docstring. The model gets a timeout message as the result of a tool call that misses its deadline,
+    so a single slow tool can't stall the completion indefinitely. Async tools are cancelled; sync tools can't
+    be, so they keep their place in max_concurrency until their thread finishes.
+    """
+
+    def __init__(self, tools):
+        self.tools = {tool.__name__: tool for tool in tools}
+        self.metadata = {name: extract_tool_metadata(tool) for name, tool in self.tools.items()}
+
+    def get_timeout(self, tool_name):
+        return self.metadata[tool_name].get("timeout", LLM_TOOL_TIMEOUT)
+
+    def get_semaphore(self, tool_name):
+        max_concurrency = self.metadata[tool_name].get("max_concurrency", LLM_TOOL_MAX_CONCURRENCY)
+        # Tools are often closures created per call, so the limit is shared by tool name
+        if (tool_name, max_concurrency) not in _tool_semaphores:
+            _tool_semaphores[(tool_name, max_concurrency)] = asyncio.Semaphore(max_concurrency)
+        return _tool_semaphores[(tool_name, max_concurrency)]
+
+    async def _execute_async(self, tool, tool_args):
+        tool_params = inspect.signature(tool).parameters
+        return tool.__name__, await tool(**{param: tool_args[param] for param in tool_params if param in tool_args})
+
+    def _start(self, tool, tool_args):
+        """Start the tool call and return a future for its (tool name, result)."""
+        if inspect.iscoroutinefunction(tool):
+            return asyncio.ensure_future(self._execute_async(tool, tool_args))
+        # A sync tool runs in a thread, which can't be interrupted: once timed out, its result is simply discarded
+        return asyncio.get_running_loop().run_in_executor(None, execute_tool, tool, tool_args, self.tools)
+
+    async def _execute(self, tool, tool_args, timeout):
+        semaphore = self.get_semaphore(tool.__name__)
+        await semaphore.acquire()
+
+        def finished(execution):
+            # The permit is held until the tool actually finishes, so timed out threads count against the limit
+            semaphore.release()
+            if not execution.cancelled():
+                execution.exception()
+
+        execution = self._start(tool, tool_args)
+        execution.add_done_callback(finished)
+        try:
+            return await asyncio.wait_for(asyncio.shield(execution), timeout)
+        finally:
+            if not execution.done() and inspect.iscoroutinefunction(tool):
+                execution.cancel()
+
+    async def _run_tool_call(self, tool_call):
+        tool_name = tool_call.function.name
+        if tool_name not in self.tools:
+            return tool_name, f"Unknown tool: {tool_name}"
+
+        try:
+            tool_args = json.loads(tool_call.function.arguments)
+            timeout = self.get_timeout(tool_name)
+            _, result = await self._execute(self.tools[tool_name], tool_args, timeout)
+        except asyncio.TimeoutError:
+            result = f"Tool {tool_name} timed out after {timeout} seconds"
+        except Exception as exc:
+            result = str(exc)
+
+        print(f"Tool: {tool_name}")
+        print(f"Result: {result}")
+        return tool_name, result
+
+    async def run(self, tool_calls):
+        """Run the tool calls and return the tool messages to send back, in the order of the calls."""
+        results = await asyncio.gather(*[self._run_tool_call(tool_call) for tool_call in tool_calls])
+        return [
+            {
+                "tool_call_id": tool_call.id,
+                "role": "tool",
+                "name": tool_name,
+                "content": str(result),
+            }
+            for tool_call, (tool_name, result) in zip(tool_calls, results)
+        ]
+
+
+_tool_semaphores = {}
+
+
 def parse_markdown_output(output, lang='html'):
     parsed_data = {}
 
@@ -154,15 +311,46 @@ def parse_css(content):
     return css_blocks
 
 
-class LlmClient:
-    def __init__(self, model=ModelType.GPT_4_OMNI, system_prompt=None):
-        self.client = create_llm_client()
+class Completion:
+    def __init__(self, message, finish_reason, usage):
+        self.message = message
+        self.finish_reason = finish_reason
+        self.usage = usage
+
+
+class AsyncLlmClient:
+    """
+    An LLM client that async steps and strategies can await directly.
+
+    Requests run on a background event loop shared by the whole process, so all of them go through the
+    same pooled HTTP client per endpoint, whatever thread or event loop the caller is on. They are spread
+    over the deployments of the model type configured in LLM_DEPLOYMENTS.
+
+    With hedge, a request that is slower than usual is duplicated (to the hedge_model, if given) within the
+    LLM_HEDGE_BUDGET, and the first response is used; streamed completions are never hedged.
+    """
+
+    def __init__(self, model=ModelType.GPT_4_OMNI, system_prompt=None, use_cache=LLM_CACHE_ENABLED, cache=prompt_cache, priority=Priority.NORMAL, hedge=False, hedge_model=None):
+        self.deployment_pool = get_deployment_pool(model)
         self.model = get_model_name(model)
+        self.hedge = hedge or hedge_model is not None
+        self.hedge_pool = get_deployment_pool(hedge_model) if hedge_model is not None else None
+        self.image_policy = VISION_IMAGE_POLICIES.get(model, ImagePolicy())
         self.system_prompt = system_prompt
-
-    def get_completions(self, prompt, image_list=None, max_tokens=4096, temperature=1.0, json_output=False, json_schema=None, tools=None):
+        self.use_cache = use_cache
+        self.cache = cache
+        self.priority = priority
+
+    def _should_use_cache(self, use_cache, temperature, tools):
+        if not self.use_cache:
+            return False
+        if use_cache is not None:
+            return use_cache
+        # Only deterministic calls are cached by default; tools may have side effects that a cached response would skip
+        return temperature == 0 and not tools
+
+    def _create_request(self, prompt, image_list=None, max_tokens=4096, temperature=1.0, json_output=False, json_schema=None, tools=None):
         messages = []
-        allowed_tools = {}
 
         if self.system_prompt:
             messages.append({
@@ -198,19 +386,19 @@ class LlmClient:
                             }
                         }
                     )
-                elif isinstance(image, bytes):
-                    # Image is binary data
-                    image_encoded_data = base64.b64encode(image).decode('utf-8')
+                elif isinstance(image, (bytes, ImageHandle)):
+                    # Image is binary data; send the smallest variant the model accepts, encoded only once per handle
+                    handle = image if isinstance(image, ImageHandle) else ImageHandle(image)
                     user_message["content"].append(
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/png;base64,{image_encoded_data}"
+                                "url": handle.prepare(self.image_policy).data_url
                             }
                         }
                     )
                 else:
-                    raise ValueError("Image must be either a data URL (str) or binary data (bytes)")
+                    raise ValueError("Image must be either a data URL (str), binary data (bytes) or an ImageHandle")
 
         request_params = {
             "model": self.model,
@@ -234,58 +422,223 @@ class LlmClient:
         if tools:
             print("Configuring tools...")
             tool_descriptions = [generate_tool_description(tool) for tool in tools] if tools else []
-            allowed_tools = {tool.__name__: tool for tool in tools} if tools else {}
             request_params["tools"] = tool_descriptions
             request_params["tool_choice"] = "auto"
 
-        response = completions_with_backoff(self.client, **request_params)
+        return request_params
+
+    def _prepare_request(self, use_cache, prompt, image_list=None, max_tokens=4096, temperature=1.0, json_output=False, json_schema=None, tools=None):
+        """Return the request parameters and, when the response is cached, its cache key."""
+        request_params = self._create_request(prompt, image_list, max_tokens, temperature, json_output, json_schema, tools)
+        cache_key = self.cache.make_key(request_params, [self._get_image_key(image) for image in image_list or []]) if use_cache else None
+        return request_params, cache_key
+
+    def _get_image_key(self, image):
+        if isinstance(image, str):
+            # Data URLs are sent as they are
+            return {"digest": ImageHandle.from_data_url(image).digest}
+        handle = image if isinstance(image, ImageHandle) else ImageHandle(image)
+        return {"digest": handle.digest, "policy": list(self.image_policy.key())}
+
+    async def _send(self, request_params, call=None, deployment_pool=None, **extra_params):
+        # Requests are queued fairly between jobs (or playground strategies) sharing the deployment
+        scope = call.scope if call is not None else {}
+        return await async_completions_with_backoff(
+            deployment_pool or self.deployment_pool,
+            priority=self.priority,
+            flow=scope.get('job_id') or scope.get('strategy'),
+            **request_params,
+            **extra_params
+        )
 
-        while response.choices[0].message.tool_calls:
-            print(f"Calling tools...")
-            print(f"Prompt tokens: {response.usage.prompt_tokens}")
+    async def _send_hedged(self, request_params, call=None):
+        """Send the request, and a duplicate if it's slow: to the hedge model, or else preferably to another deployment."""
+        tried = []
 
-            messages.append(response.choices[0].message)
+        async def request():
+            return await self._send(request_params, call, tried=tried)
 
-            with ThreadPoolExecutor() as executor:
-                future_to_tool_call = {
-                    executor.submit(execute_tool, allowed_tools[tool_call.function.name], json.loads(tool_call.function.arguments), allowed_tools): tool_call.id
-                    for tool_call in response.choices[0].message.tool_calls
-                }
+        async def hedge_request():
+            if self.hedge_pool is not None:
+                return await self._send(request_params, call, deployment_pool=self.hedge_pool)
+            return await self._send(request_params, call, exclude=list(tried))
 
-                for future in as_completed(future_to_tool_call):
-                    tool_call_id = future_to_tool_call[future]
-                    try:
-                        tool_name, result = future.result()
-                    except Exception as exc:
-                        result = str(exc)
-                        tool_name = "unknown"
+        return await hedger.run((self.model, request_params["max_tokens"]), request, hedge_request)
 
-                    print(f"Tool: {tool_name}")
-                    print(f"Result: {result}")
+    async def _create_completion(self, request_params, on_progress=None, call=None):
+        if on_progress is None:
+            if self.hedge:
+                response = await self._send_hedged(request_params, call)
+            else:
+                response = await self._send(request_params, call)
+            return Completion(response.choices[0].message, response.choices[0].finish_reason, response.usage)
+        return await self._stream_completion(request_params, on_progress, call)
+
+    async def _stream_completion(self, request_params, on_progress, call=None):
+        """Stream the completion, reporting the text generated so far and assembling the final message from the deltas."""
+        stream_params = {"stream": True}
+        if OPENAI_API_TYPE == ApiType.OPENAI.value:
+            # Azure only reports usage of streamed completions in newer API versions
+            stream_params["stream_options"] = {"include_usage": True}
+
+        stream = await self._send(request_params, call, **stream_params)
+
+        content_parts = []
+        tool_calls = {}
+        finish_reason = None
+        usage = None
+        last_progress_time = None
+
+        async for chunk in stream:
+            if chunk.usage:
+                usage = chunk.usage
+            if not chunk.choices:
+                continue
+
+            choice = chunk.choices[0]
+            if choice.finish_reason:
+                finish_reason = choice.finish_reason
+            if choice.delta is None:
+                continue
+
+            for tool_call_delta in choice.delta.tool_calls or []:
+                tool_call = tool_calls.setdefault(tool_call_delta.index, {"id": None, "name": "", "arguments": ""})
+                if tool_call_delta.id:
+                    tool_call["id"] = tool_call_delta.id
+                if tool_call_delta.function:
+                    tool_call["name"] += tool_call_delta.function.name or ""
+                    tool_call["arguments"] += tool_call_delta.function.arguments or ""
+
+            if choice.delta.content:
+                if call is not None:
+                    call.first_token()
+                content_parts.append(choice.delta.content)
+                # Report the first token right away, then at most once per interval
+                now = time.monotonic()
+                if last_progress_time is None or now - last_progress_time >= LLM_STREAM_PROGRESS_INTERVAL:
+                    last_progress_time = now
+                    on_progress(''.join(content_parts), len(content_parts))
+
+        message = ChatCompletionMessage(
+            role="assistant",
+            content=''.join(content_parts) if content_parts else None,
+            tool_calls=[
+                ChatCompletionMessageToolCall(id=tool_call["id"], type="function", function=Function(name=tool_call["name"], arguments=tool_call["arguments"]))
+                for _, tool_call in sorted(tool_calls.items())
+            ] or None
+        )
+        return Completion(message, finish_reason, usage)
 
-                    messages.append(
-                        {
-                            "tool_call_id": tool_call_id,
-                            "role": "tool",
-                            "name": tool_name,
-                            "content": str(result),
-                        }
-                    )
+    async def _get_completions(self, prompt, image_list=None, max_tokens=4096, temperature=1.0, json_output=False, json_schema=None, tools=None, on_progress=None, use_cache=None, scope=None):
+        with llm_call(self.model, scope) as call:
+            should_use_cache = self._should_use_cache(use_cache, temperature, tools)
+            # Preparing the images and hashing the request are CPU-bound, so they run off the loop shared by all LLM calls
+            request_params, cache_key = await asyncio.to_thread(self._prepare_request, should_use_cache, prompt, image_list, max_tokens, temperature, json_output, json_schema, tools)
+            messages = request_params["messages"]
+            tool_runner = ToolRunner(tools or [])
+
+            if should_use_cache:
+                content = await asyncio.to_thread(self.cache.get, cache_key)
+                if content is not None:
+                    call.cache_hit = True
+                    print(f"LLM cache hit (hit rate: {self.cache.stats()['hit_rate']:.0%})")
+                    return content
+            elif self.use_cache and use_cache is False:
+                self.cache.record_bypass()
+
+            completion = await self._create_completion(request_params, on_progress, call)
+            call.add_usage(completion.usage)
+
+            while completion.message.tool_calls:
+                call.tool_call_rounds += 1
+                print(f"Calling tools...")
+                if completion.usage:
+                    print(f"Prompt tokens: {completion.usage.prompt_tokens}")
+
+                messages.append(completion.message)
+
+                # The API expects the results of all tool calls of a round before the completion can continue
+                messages.extend(await tool_runner.run(completion.message.tool_calls))
+
+                completion = await self._create_completion(request_params, on_progress, call)
+                call.add_usage(completion.usage)
+
+            print(f"Finish reason: {completion.finish_reason}")
+            if completion.usage:
+                print(f"Completion tokens: {completion.usage.completion_tokens}")
+                print(f"Prompt tokens: {completion.usage.prompt_tokens}")
+                print(f"Total tokens: {completion.usage.total_tokens}")
+
+            content = completion.message.content
+
+            if json_output and "json_schema" in request_params["response_format"]:
+                print("Validating JSON schema...")
+                validate(instance=json.loads(content), schema=json_schema)
+
+            # Responses of the cheaper hedge model aren't cached as the model's
+            hedged_by_other_model = self.hedge_pool is not None and call.hedge_wins
+            if cache_key is not None and content is not None and not hedged_by_other_model:
+                await asyncio.to_thread(self.cache.put, cache_key, content)
+
+            return content
+
+    async def _batch_completions(self, requests, max_concurrency, return_exceptions, scope=None, **kwargs):
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def get_completions(request):
+            if isinstance(request, str):
+                request = {"prompt": request}
+            async with semaphore:
+                return await self._get_completions(**{**kwargs, **request}, scope=scope)
+
+        return await asyncio.gather(*[get_completions(request) for request in requests], return_exceptions=return_exceptions)
+
+    async def _warm_up(self):
+        deployments = self.deployment_pool.deployments + (self.hedge_pool.deployments if self.hedge_pool is not None else [])
+
+        async def warm_up(deployment):
+            try:
+                await deployment.client.models.list()
+            except Exception as e:
+                print(f"Could not warm up {deployment.name}: {e}")
+
+        await asyncio.gather(*[warm_up(deployment) for deployment in deployments])
+
+    async def warm_up(self):
+        """Open the connections to the deployments ahead of the first request."""
+        await llm_loop.run_async(self._warm_up())
+
+    async def get_completions(self, prompt, image_list=None, max_tokens=4096, temperature=1.0, json_output=False, json_schema=None, tools=None, on_progress=None, use_cache=None):
+        """
+        Return the completion of the prompt. With on_progress the completion is streamed and the callback is
+        called with the text generated so far and the number of tokens received (from the LLM client's thread).
+
+        When the prompt cache is enabled, deterministic calls (temperature 0, no tools) are answered from it;
+        use_cache=True caches any call and use_cache=False bypasses the cache.
+        """
+        return await llm_loop.run_async(self._get_completions(prompt, image_list, max_tokens, temperature, json_output, json_schema, tools, on_progress, use_cache, current_scope()))
+
+    async def batch_completions(self, requests, max_concurrency=LLM_BATCH_CONCURRENCY, return_exceptions=False, **kwargs):
+        """
+        Run many completions concurrently, at most max_concurrency at a time, and return their results in order.
+        Each request is either a prompt or a dict of get_completions() arguments; kwargs apply to all of them.
+        With return_exceptions, failed requests return their exception instead of failing the whole batch.
+        """
+        return await llm_loop.run_async(self._batch_completions(requests, max_concurrency, return_exceptions, current_scope(), **kwargs))
 
-            response = completions_with_backoff(self.client, **request_params)
 
-        print(f"Finish reason: {response.choices[0].finish_reason}")
-        print(f"Completion tokens: {response.usage.completion_tokens}")
-        print(f"Prompt tokens: {response.usage.prompt_tokens}")
-        print(f"Total tokens: {response.usage.total_tokens}")
+class LlmClient(AsyncLlmClient):
+    """A blocking facade over AsyncLlmClient for synchronous code; it shares the same pooled HTTP clients."""
 
-        content = response.choices[0].message.content
+    def get_completions(self, prompt, image_list=None, max_tokens=4096, temperature=1.0, json_output=False, json_schema=None, tools=None, on_progress=None, use_cache=None):
+        return llm_loop.run(self._get_completions(prompt, image_list, max_tokens, temperature, json_output, json_schema, tools, on_progress, use_cache, current_scope()))
 
-        if json_output and "json_schema" in request_params["response_format"]:
-            print("Validating JSON schema...")
-            validate(instance=json.loads(content), schema=json_schema)
+    def warm_up(self):
+        """Open the connections to the deployments in the background; returns a concurrent.futures.Future."""
+        return llm_loop.submit(self._warm_up())
 
-        return content
+    def batch_completions(self, requests, max_concurrency=LLM_BATCH_CONCURRENCY, return_exceptions=False, **kwargs):
+        return llm_loop.run(self._batch_completions(requests, max_concurrency, return_exceptions, current_scope(), **kwargs))
 
 
 if __name__ == "__main__":
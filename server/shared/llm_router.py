@@ -0,0 +1,227 @@
+import asyncio
+import json
+import os
+import time
+from collections import deque
+
+import openai
+
+from server.shared.rate_limiter import Priority, estimate_request_tokens, get_rate_limiter, get_retry_after
+from server.shared.telemetry import record_llm_failover, record_llm_hedge, record_llm_request
+
+# Deployments per model type, e.g. {"GPT_4_OMNI": [{"endpoint": "https://openai-west-us.openai.azure.com/",
+# "deployment": "gpt-4o", "api_key": "...", "weight": 2, "tpm": 150000}, ...]}; every field is optional and model
+# types without deployments use the AZURE_OPENAI_ENDPOINT (or OpenAI) deployment of the model
+LLM_DEPLOYMENTS = json.loads(os.getenv('LLM_DEPLOYMENTS', '{}'))
+# How long (in seconds) a failing deployment is avoided when the response doesn't say; doubled on every failure in a row
+LLM_DEPLOYMENT_COOLDOWN = float(os.getenv('LLM_DEPLOYMENT_COOLDOWN', 5))
+LLM_DEPLOYMENT_MAX_COOLDOWN = 60
+
+# A hedged request is duplicated when no response arrived within this percentile of the recent latencies,
+# or within LLM_HEDGE_DELAY seconds until enough latencies are known
+LLM_HEDGE_PERCENTILE = float(os.getenv('LLM_HEDGE_PERCENTILE', 95))
+LLM_HEDGE_DELAY = float(os.getenv('LLM_HEDGE_DELAY', 5))
+# Duplicates may add at most this percentage of extra requests to the hedged ones; 0 disables hedging
+LLM_HEDGE_BUDGET = float(os.getenv('LLM_HEDGE_BUDGET', 5))
+HEDGE_MIN_SAMPLES = 20
+HEDGE_MAX_SAMPLES = 200
+
+# Weight of the latest request in the moving average of a deployment's latency
+LATENCY_SMOOTHING = 0.3
+
+# Errors after which a request is sent to another deployment: rate limits, server errors and unreachable endpoints
+FAILOVER_ERRORS = (openai.RateLimitError, openai.InternalServerError, openai.APIConnectionError)
+
+
+class Deployment:
+    """A model deployment on one endpoint, with the latency and health observed from its responses."""
+
+    def __init__(self, client, model, endpoint=None, weight=1.0, rpm=None, tpm=None):
+        self.client = client
+        self.model = model
+        self.endpoint = endpoint
+        self.weight = weight
+        self.rpm = rpm
+        self.tpm = tpm
+        self.latency = None
+        self.in_flight = 0
+        self.failures = 0
+        self.unhealthy_until = 0.0
+
+    @property
+    def name(self):
+        return f"{self.model} ({self.endpoint})" if self.endpoint else self.model
+
+    @property
+    def rate_limiter(self):
+        return get_rate_limiter(self.model, self.endpoint, self.rpm, self.tpm)
+
+    def is_healthy(self):
+        return time.monotonic() >= self.unhealthy_until
+
+    def expected_latency(self, tokens):
+        """Estimate how long a request would take here: its wait for the rate limits plus the latency under the current load."""
+        # Deployments without any response yet are tried first, so that all of them get a latency
+        latency = self.latency or 0.0
+        return (self.rate_limiter.expected_wait(tokens) + latency * (1 + self.in_flight)) / self.weight
+
+    def record_success(self, latency):
+        self.latency = latency if self.latency is None else LATENCY_SMOOTHING * latency + (1 - LATENCY_SMOOTHING) * self.latency
+        self.failures = 0
+
+    def record_failure(self, retry_after=None):
+        self.failures += 1
+        cooldown = retry_after or min(LLM_DEPLOYMENT_COOLDOWN * 2 ** (self.failures - 1), LLM_DEPLOYMENT_MAX_COOLDOWN)
+        self.unhealthy_until = max(self.unhealthy_until, time.monotonic() + cooldown)
+
+    async def send(self, request_params, tokens, priority=Priority.NORMAL, flow=None):
+        # Every attempt, including retries, waits for its turn in the deployment's budget
+        queued_at = time.monotonic()
+        await self.rate_limiter.acquire(tokens, priority, flow)
+        self.in_flight += 1
+        started_at = time.monotonic()
+        try:
+            raw_response = await self.client.chat.completions.with_raw_response.create(**{**request_params, "model": self.model})
+        except openai.RateLimitError as e:
+            self.rate_limiter.pause(e.response.headers)
+            self.record_failure(get_retry_after(e.response.headers))
+            raise
+        except FAILOVER_ERRORS:
+            self.record_failure()
+            raise
+        finally:
+            self.in_flight -= 1
+            record_llm_request(started_at - queued_at, time.monotonic() - started_at)
+        # Streamed responses return once the headers arrive, so for them this is the time to the first byte
+        self.record_success(time.monotonic() - started_at)
+        self.rate_limiter.update(raw_response.headers)
+        return await raw_response.parse()
+
+
+class DeploymentPool:
+    """
+    Spreads the requests of a model type over its deployments.
+
+    Each request goes to the healthy deployment with the lowest expected latency, which accounts for the
+    rate limit budget left, the requests in flight and the moving average of the response times, divided by
+    the deployment's weight. A deployment that responds with a rate limit, a server error or not at all is
+    avoided for a cooldown, and the request fails over to the next best deployment right away.
+    Must only be used from the LLM loop.
+    """
+
+    def __init__(self, deployments):
+        self.deployments = deployments
+
+    def choose(self, tokens, exclude=()):
+        candidates = [deployment for deployment in self.deployments if deployment not in exclude]
+        healthy = [deployment for deployment in candidates if deployment.is_healthy()]
+        if healthy:
+            return min(healthy, key=lambda deployment: deployment.expected_latency(tokens))
+        if exclude:
+            return None
+        # When all deployments are failing, the one that recovers first is the best bet
+        return min(candidates, key=lambda deployment: deployment.unhealthy_until)
+
+    async def send(self, request_params, priority=Priority.NORMAL, flow=None, exclude=(), tried=None):
+        """
+        Send the request to the best deployment, failing over to the others. Deployments in exclude are only
+        used when no other is healthy; the deployments tried are appended to tried.
+        """
+        tokens = estimate_request_tokens(request_params)
+        excluded = list(exclude)
+        # Each call (e.g. each backoff retry) fails over between all the deployments again, whatever was tried before
+        attempted = []
+        while True:
+            deployment = self.choose(tokens, exclude=excluded + attempted)
+            if deployment is None and not attempted:
+                deployment = self.choose(tokens)
+            if deployment is None:
+                raise RuntimeError("No deployment to send the request to")
+            attempted.append(deployment)
+            if tried is not None:
+                tried.append(deployment)
+            try:
+                return await deployment.send(request_params, tokens, priority, flow)
+            except FAILOVER_ERRORS as e:
+                # Once no healthy deployment is left, the error is left to the caller (and its backoff)
+                if self.choose(tokens, exclude=excluded + attempted) is None:
+                    raise
+                print(f"Deployment {deployment.name} failed ({type(e).__name__}), failing over")
+                record_llm_failover()
+
+
+class Hedger:
+    """
+    Hedges requests against slow responses: when a request hasn't completed within a high percentile of the
+    recent latencies, a duplicate is sent, the first response wins and the other request is cancelled.
+
+    Every hedged request earns budget_percent / 100 of a duplicate and every duplicate spends a whole one,
+    so duplicates stay under the budget percentage of the requests, however slow the deployments get.
+    Must only be used from the LLM loop.
+    """
+
+    def __init__(self, percentile=LLM_HEDGE_PERCENTILE, budget_percent=LLM_HEDGE_BUDGET, delay=LLM_HEDGE_DELAY):
+        self.percentile = percentile
+        self.budget_percent = budget_percent
+        self.default_delay = delay
+        self.latencies = {}
+        self.budget = 0.0
+
+    def get_delay(self, key):
+        latencies = sorted(self.latencies.get(key, ()))
+        if len(latencies) < HEDGE_MIN_SAMPLES:
+            return self.default_delay
+        return latencies[min(len(latencies) - 1, int(len(latencies) * self.percentile / 100))]
+
+    def record_latency(self, key, latency):
+        self.latencies.setdefault(key, deque(maxlen=HEDGE_MAX_SAMPLES)).append(latency)
+
+    def _deposit(self):
+        # A burst of duplicates is bounded by the budget earned over the last hundred requests
+        self.budget = min(self.budget + self.budget_percent / 100, max(1.0, self.budget_percent))
+
+    def _withdraw(self):
+        if self.budget < 1:
+            return False
+        self.budget -= 1
+        return True
+
+    async def _timed(self, key, request):
+        started_at = time.monotonic()
+        result = await request()
+        self.record_latency(key, time.monotonic() - started_at)
+        return result
+
+    async def run(self, key, request, hedge_request):
+        """
+        Run request(), and hedge_request() as well if it's slower than usual for the key; both are coroutine
+        functions. Return the first successful result; only if both fail is the error of the first raised.
+        """
+        self._deposit()
+        delay = self.get_delay(key)
+        primary = asyncio.ensure_future(self._timed(key, request))
+        pending = {primary}
+        try:
+            done, _ = await asyncio.wait([primary], timeout=delay)
+            if done or not self._withdraw():
+                return await primary
+
+            print(f"No response after {delay:.1f}s, hedging the request")
+            hedge = asyncio.ensure_future(self._timed(key, hedge_request))
+            record_llm_hedge()
+            pending = {primary, hedge}
+            while True:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in (primary, hedge):
+                    if task in done and task.exception() is None:
+                        if task is hedge:
+                            record_llm_hedge(won=True)
+                        return task.result()
+                if not pending:
+                    return primary.result()
+        finally:
+            for task in pending:
+                task.cancel()
+
+
+hedger = Hedger()
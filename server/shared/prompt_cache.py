@@ -0,0 +1,138 @@
+import os
+import sqlite3
+import threading
+import time
+
+from server.shared.cache import stable_hash
+
+# Bump when the way requests are keyed changes to invalidate old entries
+CACHE_VERSION = 2
+
+LLM_CACHE_ENABLED = os.getenv('LLM_CACHE_ENABLED', 'false').lower() == 'true'
+LLM_CACHE_PATH = os.getenv('LLM_CACHE_PATH', 'cache/llm.sqlite3')
+LLM_CACHE_MAX_BYTES = int(os.getenv('LLM_CACHE_MAX_BYTES', 100 * 1024 * 1024))
+
+
+def without_images(request_params):
+    messages = []
+    for message in request_params.get("messages", []):
+        if isinstance(message, dict) and isinstance(message.get("content"), list):
+            content = [{"type": "image_url"} if part.get("type") == "image_url" else part for part in message["content"]]
+            message = {**message, "content": content}
+        messages.append(message)
+    return {**request_params, "messages": messages}
+
+
+class PromptCache:
+    """
+    A size-bounded SQLite store of LLM responses keyed by everything that determines the response:
+    model, messages (including system prompt and images), sampling parameters, response format and tools.
+    The least recently used responses are evicted once the total size exceeds max_bytes.
+    """
+
+    def __init__(self, path=LLM_CACHE_PATH, max_bytes=LLM_CACHE_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.connection = None
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.bypasses = 0
+
+    @staticmethod
+    def make_key(request_params, image_keys=()):
+        """
+        Images are keyed by image_keys (e.g. their digests and how they were prepared) rather than by their
+        data URLs, which are slow to hash and would tie the cached responses to the output of the encoder.
+        """
+        return stable_hash({"version": CACHE_VERSION, "request": without_images(request_params), "images": list(image_keys)})
+
+    def _connect(self):
+        if self.connection is None:
+            folder = os.path.dirname(self.path)
+            if folder:
+                os.makedirs(folder, exist_ok=True)
+            self.connection = sqlite3.connect(self.path, check_same_thread=False)
+            self.connection.execute('PRAGMA journal_mode=WAL')
+            self.connection.execute('''
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    content TEXT NOT NULL,
+                    size INTEGER NOT NULL,
+                    accessed_at REAL NOT NULL
+                )
+            ''')
+            self.connection.execute('CREATE INDEX IF NOT EXISTS responses_accessed_at ON responses (accessed_at)')
+            self.connection.commit()
+        return self.connection
+
+    def get(self, key):
+        with self.lock:
+            try:
+                connection = self._connect()
+                row = connection.execute('SELECT content FROM responses WHERE key = ?', (key,)).fetchone()
+                if row is not None:
+                    connection.execute('UPDATE responses SET accessed_at = ? WHERE key = ?', (time.time(), key))
+                    connection.commit()
+            except sqlite3.Error as e:
+                print(f"Failed to read LLM cache: {e}")
+                row = None
+
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[0]
+
+    def put(self, key, content):
+        size = len(content.encode('utf-8'))
+        if size > self.max_bytes:
+            return
+
+        with self.lock:
+            try:
+                connection = self._connect()
+                connection.execute(
+                    'INSERT OR REPLACE INTO responses (key, content, size, accessed_at) VALUES (?, ?, ?, ?)',
+                    (key, content, size, time.time())
+                )
+                self._evict(connection)
+                connection.commit()
+            except sqlite3.Error as e:
+                print(f"Failed to write LLM cache: {e}")
+
+    def _evict(self, connection):
+        total_size = connection.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+
+        evicted_keys = []
+        for key, size in connection.execute('SELECT key, size FROM responses ORDER BY accessed_at'):
+            if total_size <= self.max_bytes:
+                break
+            evicted_keys.append((key,))
+            total_size -= size
+        connection.executemany('DELETE FROM responses WHERE key = ?', evicted_keys)
+
+    def record_bypass(self):
+        with self.lock:
+            self.bypasses += 1
+
+    def stats(self):
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bypasses": self.bypasses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
+
+    def clear(self):
+        with self.lock:
+            connection = self._connect()
+            connection.execute('DELETE FROM responses')
+            connection.commit()
+
+
+prompt_cache = PromptCache()
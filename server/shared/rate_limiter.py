@@ -0,0 +1,218 @@
+import asyncio
+import heapq
+import itertools
+import json
+import os
+import time
+from enum import IntEnum
+
+# Per deployment limits, e.g. {"gpt-4o": {"rpm": 300, "tpm": 50000}}; deployments without limits adapt to the
+# x-ratelimit-* headers of the responses
+LLM_RATE_LIMITS = json.loads(os.getenv('LLM_RATE_LIMITS', '{}'))
+
+# Rough size of an image in tokens for rate limiting purposes (a high detail image costs up to ~1100 tokens)
+IMAGE_TOKENS_ESTIMATE = 1000
+
+
+class Priority(IntEnum):
+    INTERACTIVE = 0
+    NORMAL = 1
+    BATCH = 2
+
+
+class TokenBucket:
+    """A bucket refilled continuously at `limit` units per minute; no limit means it is never empty."""
+
+    def __init__(self, limit=None):
+        self.limit = limit
+        self.limit_is_known = bool(limit)
+        self.level = float(limit) if limit else 0.0
+        self.updated_at = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        if self.limit:
+            self.level = min(self.limit, self.level + (now - self.updated_at) * self.limit / 60)
+        self.updated_at = now
+
+    def wait_time(self, amount, queued=0):
+        """Return how long to wait (in seconds) until the amount can be taken from the bucket after what is queued."""
+        if not self.limit:
+            return 0.0
+        self._refill()
+        # Requests larger than the whole bucket only wait for it to be full
+        amount = min(amount, self.limit) + queued
+        return max(0.0, (amount - self.level) * 60 / self.limit)
+
+    def take(self, amount):
+        if self.limit:
+            self._refill()
+            self.level -= min(amount, self.limit)
+
+    def update(self, limit=None, remaining=None):
+        self._refill()
+        if limit:
+            self.limit = limit
+            self.limit_is_known = True
+        elif remaining is not None and not self.limit_is_known:
+            # Azure only reports what remains; the most ever remaining is a conservative estimate of the limit
+            self.limit = max(self.limit or 0, remaining) or None
+        if remaining is not None and self.limit:
+            # The service knows best what is left, including what other processes consumed
+            self.level = min(float(remaining), self.limit)
+
+
+class Waiter:
+    def __init__(self, future, tokens):
+        self.future = future
+        self.tokens = tokens
+
+
+class RateLimiter:
+    """
+    Schedules the requests to a single deployment within its requests-per-minute and tokens-per-minute budgets.
+
+    Waiting requests are served by priority first; within a priority, start-time fair queueing interleaves
+    the requests of different flows (jobs or strategies) so that one large job can't starve the others.
+    A 429 response pauses the whole deployment until its Retry-After, instead of letting every caller retry
+    on its own. Must only be used from a single event loop.
+    """
+
+    def __init__(self, name, rpm=None, tpm=None):
+        self.name = name
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.paused_until = 0.0
+        self.waiters = []
+        self.sequence = itertools.count()
+        self.virtual_time = 0
+        self.flow_tags = {}
+        self.timer = None
+
+    def _wait_time(self, tokens):
+        return max(self.paused_until - time.monotonic(), self.requests.wait_time(1), self.tokens.wait_time(tokens))
+
+    def expected_wait(self, tokens):
+        """Estimate how long a new request would wait for its turn behind the requests already queued."""
+        queued_tokens = sum(min(entry[3].tokens, self.tokens.limit or 0) for entry in self.waiters)
+        return max(
+            self.paused_until - time.monotonic(),
+            self.requests.wait_time(1, queued=len(self.waiters)),
+            self.tokens.wait_time(tokens, queued=queued_tokens),
+        )
+
+    def _take(self, tokens):
+        self.requests.take(1)
+        self.tokens.take(tokens)
+
+    def _next_tag(self, flow):
+        tag = max(self.virtual_time, self.flow_tags.get(flow, 0)) + 1
+        self.flow_tags[flow] = tag
+        return tag
+
+    async def acquire(self, tokens, priority=Priority.NORMAL, flow=None):
+        """Wait until a request with the estimated number of tokens may be sent."""
+        if not self.waiters and self._wait_time(tokens) <= 0:
+            self._take(tokens)
+            return
+
+        future = asyncio.get_running_loop().create_future()
+        heapq.heappush(self.waiters, (int(priority), self._next_tag(flow), next(self.sequence), Waiter(future, tokens)))
+        self._dispatch()
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.cancelled():
+                self.waiters = [entry for entry in self.waiters if entry[3].future is not future]
+                heapq.heapify(self.waiters)
+            raise
+
+    def _dispatch(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+
+        while self.waiters:
+            _, tag, _, waiter = self.waiters[0]
+            if waiter.future.done():
+                heapq.heappop(self.waiters)
+                continue
+
+            wait_time = self._wait_time(waiter.tokens)
+            if wait_time > 0:
+                self.timer = asyncio.get_running_loop().call_later(wait_time, self._dispatch)
+                return
+
+            heapq.heappop(self.waiters)
+            self.virtual_time = max(self.virtual_time, tag)
+            self._take(waiter.tokens)
+            waiter.future.set_result(None)
+
+        # Forget flows that have no requests ahead of the others anymore
+        self.flow_tags = {flow: tag for flow, tag in self.flow_tags.items() if tag > self.virtual_time}
+
+    def update(self, headers):
+        """Adapt the budgets to the x-ratelimit-* headers of a response."""
+        self.requests.update(_int_header(headers, 'x-ratelimit-limit-requests'), _int_header(headers, 'x-ratelimit-remaining-requests'))
+        self.tokens.update(_int_header(headers, 'x-ratelimit-limit-tokens'), _int_header(headers, 'x-ratelimit-remaining-tokens'))
+
+    def pause(self, headers):
+        """Hold back all requests to the deployment until the Retry-After of a 429 response has passed."""
+        retry_after = get_retry_after(headers)
+        if retry_after:
+            print(f"Rate limited on {self.name}, pausing requests for {retry_after:.1f}s")
+            self.paused_until = max(self.paused_until, time.monotonic() + retry_after)
+        self.update(headers)
+        self._dispatch()
+
+
+def _int_header(headers, name):
+    try:
+        return int(headers.get(name))
+    except (TypeError, ValueError):
+        return None
+
+
+def get_retry_after(headers):
+    for name, scale in (('retry-after-ms', 0.001), ('retry-after', 1)):
+        try:
+            return float(headers.get(name)) * scale
+        except (TypeError, ValueError):
+            continue
+    return None
+
+
+def estimate_request_tokens(request_params):
+    """Estimate the tokens a request counts against the budget: the prompt (about 4 characters per token) plus max_tokens."""
+    characters = 0
+    images = 0
+    for message in request_params.get("messages", []):
+        content = message.get("content") if isinstance(message, dict) else getattr(message, "content", None)
+        if isinstance(content, str):
+            characters += len(content)
+        elif isinstance(content, list):
+            for part in content:
+                if part.get("type") == "text":
+                    characters += len(part.get("text", ""))
+                elif part.get("type") == "image_url":
+                    images += 1
+    characters += len(json.dumps(request_params.get("tools", [])))
+    return characters // 4 + images * IMAGE_TOKENS_ESTIMATE + request_params.get("max_tokens", 0)
+
+
+_rate_limiters = {}
+
+
+def get_rate_limiter(deployment, endpoint=None, rpm=None, tpm=None):
+    """
+    Return the process-wide rate limiter of the deployment on the endpoint; only call it from the LLM loop.
+    Limits not given explicitly are looked up by deployment name in LLM_RATE_LIMITS.
+    """
+    if (endpoint, deployment) not in _rate_limiters:
+        limits = LLM_RATE_LIMITS.get(deployment, {})
+        _rate_limiters[(endpoint, deployment)] = RateLimiter(
+            f"{deployment} ({endpoint})" if endpoint else deployment,
+            rpm=rpm or limits.get("rpm"),
+            tpm=tpm or limits.get("tpm"),
+        )
+    return _rate_limiters[(endpoint, deployment)]
@@ -0,0 +1,147 @@
+import os
+import time
+
+import requests
+
+from server.shared.cache import MISSING, DiskStore, LruCache, stable_hash
+
+# Bump when the layout of cached scrape artifacts changes to invalidate old entries
+CACHE_VERSION = 1
+
+SCRAPE_CACHE_ENABLED = os.getenv('SCRAPE_CACHE_ENABLED', 'true').lower() == 'true'
+SCRAPE_CACHE_MAX_BYTES = int(os.getenv('SCRAPE_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+SCRAPE_CACHE_DIR = os.getenv('SCRAPE_CACHE_DIR', 'cache/scrape')
+SCRAPE_CACHE_TTL = int(os.getenv('SCRAPE_CACHE_TTL', 60 * 60))
+# Bounds of the disk tier: its total size and how long (in seconds) entries are kept for revalidation, a day by default
+SCRAPE_CACHE_DISK_MAX_BYTES = int(os.getenv('SCRAPE_CACHE_DISK_MAX_BYTES', 512 * 1024 * 1024))
+SCRAPE_CACHE_DISK_TTL = int(os.getenv('SCRAPE_CACHE_DISK_TTL', 24 * 60 * 60))
+# When enabled, expired entries are revalidated with a conditional request (ETag / Last-Modified)
+# instead of being scraped again, as long as the page reports that it has not changed
+SCRAPE_CACHE_REVALIDATE = os.getenv('SCRAPE_CACHE_REVALIDATE', 'true').lower() == 'true'
+SCRAPE_CACHE_REVALIDATE_TIMEOUT = float(os.getenv('SCRAPE_CACHE_REVALIDATE_TIMEOUT', 5))
+
+
+def sizeof_artifact(value):
+    if isinstance(value, (str, bytes)):
+        return len(value)
+    if isinstance(value, (list, tuple)):
+        return sum(sizeof_artifact(item) for item in value)
+    if isinstance(value, dict):
+        return sum(sizeof_artifact(item) for item in value.values())
+    return 0
+
+
+class CacheEntry:
+    def __init__(self, value, etag=None, last_modified=None, stored_at=None):
+        self.value = value
+        self.etag = etag
+        self.last_modified = last_modified
+        self.stored_at = stored_at if stored_at is not None else time.time()
+
+    def has_validators(self):
+        return bool(self.etag or self.last_modified)
+
+
+class ScrapeCache:
+    """
+    Caches scraped page artifacts (HTML, screenshots, CSS) keyed by the URL and everything that
+    affects what the page looks like: the artifact and its selector, the viewport, the wait time and
+    the elements clicked after loading.
+
+    Entries are fresh for `ttl` seconds. Once expired they are either scraped again or, in revalidation
+    mode, kept if a conditional request with the ETag / Last-Modified of the page returns 304.
+    """
+
+    def __init__(self, max_bytes=SCRAPE_CACHE_MAX_BYTES, folder=SCRAPE_CACHE_DIR, ttl=SCRAPE_CACHE_TTL, revalidate=SCRAPE_CACHE_REVALIDATE, disk_max_bytes=SCRAPE_CACHE_DISK_MAX_BYTES, disk_ttl=SCRAPE_CACHE_DISK_TTL):
+        self.memory = LruCache(max_bytes=max_bytes, sizeof=lambda entry: sizeof_artifact(entry.value))
+        self.disk = DiskStore(folder, ttl=disk_ttl, max_bytes=disk_max_bytes) if folder else None
+        self.ttl = ttl
+        self.revalidate = revalidate
+
+    @staticmethod
+    def make_key(url, artifact, args, viewport=None, wait_time=0, clicks=()):
+        return stable_hash({
+            "version": CACHE_VERSION,
+            "url": url,
+            "artifact": artifact,
+            "args": args,
+            "viewport": viewport,
+            "wait_time": wait_time,
+            "clicks": list(clicks),
+        })
+
+    def get_entry(self, key):
+        entry = self.memory.get(key)
+        if entry is None and self.disk:
+            entry = self.disk.get(key)
+            if entry is not None:
+                self.memory.put(key, entry)
+        return entry
+
+    def put_entry(self, key, entry):
+        self.memory.put(key, entry)
+        if self.disk:
+            try:
+                self.disk.put(key, entry)
+            except Exception as e:
+                print(f"Failed to store scrape artifact on disk: {e}")
+
+    def is_fresh(self, entry):
+        return self.ttl is None or time.time() - entry.stored_at <= self.ttl
+
+    def get(self, key, url, revalidated=None):
+        """
+        Return the cached artifact or MISSING. `revalidated` is an optional dict shared by the caller to
+        remember the outcome of conditional requests, so the same page is revalidated at most once.
+        """
+        entry = self.get_entry(key)
+        if entry is None:
+            return MISSING
+
+        if self.is_fresh(entry):
+            return entry.value
+
+        if not self.revalidate or not entry.has_validators():
+            return MISSING
+
+        validators = (entry.etag, entry.last_modified)
+        if revalidated is not None and validators in revalidated:
+            unchanged = revalidated[validators]
+        else:
+            unchanged = self.is_unchanged(url, entry)
+            if revalidated is not None:
+                revalidated[validators] = unchanged
+
+        if not unchanged:
+            return MISSING
+
+        entry.stored_at = time.time()
+        self.put_entry(key, entry)
+        return entry.value
+
+    def put(self, key, value, headers=None):
+        headers = headers or {}
+        self.put_entry(key, CacheEntry(value, etag=headers.get('etag'), last_modified=headers.get('last-modified')))
+
+    def is_unchanged(self, url, entry):
+        conditional_headers = {}
+        if entry.etag:
+            conditional_headers['If-None-Match'] = entry.etag
+        if entry.last_modified:
+            conditional_headers['If-Modified-Since'] = entry.last_modified
+
+        try:
+            response = requests.get(url, headers=conditional_headers, timeout=SCRAPE_CACHE_REVALIDATE_TIMEOUT, stream=True)
+            response.close()
+        except Exception as e:
+            print(f"Failed to revalidate {url}: {e}")
+            return False
+
+        print(f"Revalidated {url}: {response.status_code}")
+        return response.status_code == 304
+
+    def clear(self):
+        self.memory.clear()
+
+
+scrape_cache = ScrapeCache()
@@ -1,256 +1,307 @@
+import asyncio
+
 from PIL import Image, ImageDraw
 from io import BytesIO
 
-from playwright.async_api import async_playwright
+from server.shared.browser_pool import get_browser_pool
+from server.shared.cache import MISSING
+from server.shared.image import crop_and_downscale_image
+from server.shared.scrape_cache import SCRAPE_CACHE_ENABLED, scrape_cache
+
+INLINE_STYLES_SCRIPT = '''(selector) => {
+
+    const essentialCssProperties = [
+        "color",
+        "background-color",
+        "background-image",
+        "background-size",
+        "font-family",
+        "font-size",
+        "font-weight",
+        "line-height",
+        "text-align",
+        "text-decoration",
+        "text-transform",
+        "display",
+        "position",
+        "top",
+        "right",
+        "bottom",
+        "left",
+        "float",
+        "clear",
+        "margin",
+        "padding",
+        "border",
+        "width",
+        "height",
+        "box-sizing",
+        "flex-direction",
+        "justify-content",
+        "align-items",
+        "flex-wrap",
+        "grid-template-columns",
+        "grid-template-rows",
+        "grid-gap",
+        "transition",
+        "animation",
+        "keyframes",
+        "transform",
+        "translate",
+        "rotate",
+        "scale",
+        "visibility",
+        "opacity",
+        "z-index",
+        "media queries"
+    ];
+
+    function getExplicitlySetStyles(element) {
+        const originalComputedStyle = window.getComputedStyle(element);
+        const explicitlySetStyles = {};
+        for (let property of originalComputedStyle) {
+            if (essentialCssProperties.includes(property)) {
+                explicitlySetStyles[property] = originalComputedStyle.getPropertyValue(property);
+            }
+        }
+        return explicitlySetStyles;
+    }
+
+    function applyInlineStyles(element) {
+        const styles = getExplicitlySetStyles(element);
+        for (let property in styles) {
+            element.style[property] = styles[property];
+        }
+        for (let child of element.children) {
+            applyInlineStyles(child);
+        }
+    }
+
+    const element = document.querySelector(selector);
+    applyInlineStyles(element);
+
+    return element.innerHTML;
+
+}'''
+
+RAW_CSS_SCRIPT = '''(selector) => {
+    const element = document.querySelector(selector);
+    if (!element) return null;
+
+    const blockName = element.dataset.blockName;
+    const stylesheets = Array.from(document.styleSheets);
+    const externalStyles = stylesheets.filter(sheet => sheet.href && sheet.ownerNode.nodeName === 'LINK');
+    const blockStyles = externalStyles.filter(sheet => sheet.href.includes(blockName)).map(sheet => {
+        try {
+            const rules = Array.from(sheet.cssRules).map(rule => rule.cssText);
+            return rules.join('\\n');
+        } catch (e) {
+            // Some stylesheets might be blocked due to CORS policies
+            console.error(`Could not access rules from stylesheet at ${sheet.href}`);
+            return [];
+        }
+    });
+
+    const rootStyles = externalStyles.filter(sheet => sheet.href.endsWith('/styles.css')).map(sheet => {
+        try {
+            const rules = Array.from(sheet.cssRules).map(rule => rule.cssText).filter(style => style.startsWith(':root'));
+            return rules[0];
+        } catch (e) {
+            // Some stylesheets might be blocked due to CORS policies
+            console.error(`Could not access rules from stylesheet at ${sheet.href}`);
+            return [];
+        }
+    });
+    return [blockStyles[0], rootStyles[0]];
+}'''
+
+
+class PageSnapshot:
+    """
+    A page that is loaded once and then queried for several artifacts (HTML, screenshots, styles, CSS).
+    Use it as an async context manager; the browser goes back to the pool when the context exits.
+
+    Artifacts are looked up in the scrape cache first and the page is only loaded when one of them is
+    missing, so repeated scrapes of an unchanged page don't need a browser at all.
+    """
+
+    def __init__(self, pool, url, wait_time=0, consent_popup_button_selector=None, viewport=None, cache=None, bypass_cache=False):
+        self.pool = pool
+        self.url = url
+        self.wait_time = wait_time
+        self.viewport = viewport
+        self.cache = cache
+        self.bypass_cache = bypass_cache
+        # Clicks change what the page looks like, so they are part of the cache key of every artifact
+        self.clicks = [consent_popup_button_selector] if consent_popup_button_selector else []
+        self.response_headers = {}
+        self.revalidated = {}
+        self.lease = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        if self.lease is not None:
+            await self.pool.close_page(self.lease)
+            self.lease = None
+
+    @property
+    def page(self):
+        return self.lease.page
+
+    async def _ensure_loaded(self):
+        if self.lease is not None:
+            return
+        self.lease = await self.pool.open_page(self.viewport)
+        try:
+            await self.pool.call(self._load())
+        except Exception:
+            await self.close()
+            raise
+
+    async def _load(self):
+        response = await self.page.goto(self.url)
+        if response is not None:
+            self.response_headers = await response.all_headers()
+        await self.page.wait_for_load_state('networkidle')
+
+        if self.wait_time > 0:
+            print(f"Waiting for {self.wait_time}ms...")
+            await self.page.wait_for_timeout(self.wait_time)
+
+        for selector in self.clicks:
+            await self._click(selector)
+
+    async def _click(self, selector, timeout=10000):
+        try:
+            await self.page.locator(selector).click(timeout=timeout)
+        except Exception as e:
+            print(f"Element to click not found: {selector}")
+
+    async def _get(self, artifact, args, scrape):
+        """Return the artifact from the cache, or load the page and run the scrape coroutine function."""
+        key = None
+        if self.cache is not None:
+            key = self.cache.make_key(self.url, artifact, args, self.viewport, self.wait_time, self.clicks)
+            # When bypassing the cache the page is scraped anyway, but the fresh artifact still replaces the cached one
+            if not self.bypass_cache:
+                value = await asyncio.to_thread(self.cache.get, key, self.url, self.revalidated)
+                if value is not MISSING:
+                    print(f"Scrape cache hit: {artifact} of {self.url}")
+                    return value
+
+        await self._ensure_loaded()
+        value = await self.pool.call(scrape())
+
+        if self.cache is not None:
+            await asyncio.to_thread(self.cache.put, key, value, self.response_headers)
+        return value
+
+    async def click(self, selector, timeout=10000):
+        """Click an element (e.g. a consent popup button), ignoring it if it can't be found."""
+        self.clicks.append(selector)
+        # If the page isn't loaded yet, the click is replayed when (and if) it is
+        if self.lease is not None:
+            await self.pool.call(self._click(selector, timeout))
+
+    async def html(self, selector="body"):
+        return await self._get('html', [selector], lambda: self.page.locator(selector).inner_html())
+
+    async def outer_html(self, selector):
+        async def get_outer_html():
+            html_element = await self.page.query_selector(selector)
+            return await html_element.evaluate('element => element.outerHTML')
+
+        return await self._get('outer_html', [selector], get_outer_html)
+
+    async def html_with_inline_styles(self, selector):
+        """Return the inner HTML of the element with its essential computed styles inlined."""
+        return await self._get('html_with_inline_styles', [selector], lambda: self.page.evaluate(INLINE_STYLES_SCRIPT, selector))
+
+    async def screenshot(self, selector="body"):
+        return await self._get('screenshot', [selector], lambda: self.page.locator(selector).first.screenshot())
+
+    async def full_page_screenshot(self, highlight_selector=None):
+        """Return a full page screenshot as an image, optionally with a red rectangle around an element."""
+        async def take_screenshot():
+            bbox = None
+            if highlight_selector:
+                element = await self.page.query_selector(highlight_selector)
+                bbox = await element.bounding_box()
+            return await self.page.screenshot(full_page=True), bbox
+
+        screenshot_data, bbox = await self._get('full_page_screenshot', [highlight_selector], take_screenshot)
+        image = Image.open(BytesIO(screenshot_data))
+
+        if bbox:
+            # Draw a red rectangle around the desired section
+            draw = ImageDraw.Draw(image)
+            draw.rectangle(
+                [
+                    (bbox['x'], bbox['y']),
+                    (bbox['x'] + bbox['width'], bbox['y'] + bbox['height'])
+                ],
+                outline='red',
+                width=5
+            )
+
+        return image
 
-from server.shared.image import crop_and_downscale_image, image_to_bytes
+    async def raw_css(self, selector):
+        """Return the CSS of the block containing the element and the :root CSS variables of the page."""
+        return await self._get('raw_css', [selector], lambda: self.page.evaluate(RAW_CSS_SCRIPT, selector))
 
 
 class WebScraper:
-    def __init__(self, headless=True):
+    def __init__(self, headless=True, use_cache=SCRAPE_CACHE_ENABLED, cache=scrape_cache):
         self.headless = headless
+        self.pool = get_browser_pool(headless)
+        self.use_cache = use_cache
+        self.cache = cache
+
+    def snapshot(self, url, wait_time=0, consent_popup_button_selector=None, viewport=None, bypass_cache=False):
+        return PageSnapshot(
+            self.pool,
+            url,
+            wait_time=wait_time,
+            consent_popup_button_selector=consent_popup_button_selector,
+            viewport=viewport,
+            cache=self.cache if self.use_cache else None,
+            bypass_cache=bypass_cache
+        )
 
-    async def get_html(self, url, selector="body", wait_time=0, consent_popup_button_selector=None):
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=self.headless)
-            page = await browser.new_page()
-
-            await page.goto(url)
-            await page.wait_for_load_state('networkidle')
-
-            if wait_time > 0:
-                print(f"Waiting for {wait_time}ms...")
-                await page.wait_for_timeout(wait_time)
-
-            if consent_popup_button_selector:
-                await page.locator(consent_popup_button_selector).click()
-
-            html = await page.locator(selector).inner_html()
-            await browser.close()
-
-            return html
-
-    async def get_screenshot(self, url, selector="body", wait_time=0, consent_popup_button_selector=None):
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=self.headless)
-            page = await browser.new_page()
-
-            await page.goto(url)
-            await page.wait_for_load_state('networkidle')
-
-            if wait_time > 0:
-                print(f"Waiting for {wait_time}ms...")
-                await page.wait_for_timeout(wait_time)
-
-            if consent_popup_button_selector:
-                try:
-                    await page.locator(consent_popup_button_selector).click(timeout=10000)
-                except Exception as e:
-                    print("Consent popup button not found")
-
-            screenshot_data = await page.locator(selector).first.screenshot()
-            screenshot = Image.open(BytesIO(screenshot_data))
-
-            await browser.close()
-
-            return image_to_bytes(screenshot)
-
-    async def get_html_and_screenshot(self, url, selector, with_styles=False, max_width=300, max_height=300, wait_time=0):
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=self.headless)
+    # The get_* methods scrape a single artifact; bypass_cache=True scrapes a page that was just edited
+    async def get_html(self, url, selector="body", wait_time=0, consent_popup_button_selector=None, bypass_cache=False):
+        async with self.snapshot(url, wait_time, consent_popup_button_selector, bypass_cache=bypass_cache) as snapshot:
+            return await snapshot.html(selector)
 
-            page = await browser.new_page()
+    async def get_screenshot(self, url, selector="body", wait_time=0, consent_popup_button_selector=None, bypass_cache=False):
+        async with self.snapshot(url, wait_time, consent_popup_button_selector, bypass_cache=bypass_cache) as snapshot:
+            return await snapshot.screenshot(selector)
 
-            await page.goto(url)
-            await page.wait_for_load_state('networkidle')
+    async def get_html_and_screenshot(self, url, selector, with_styles=False, max_width=300, max_height=300, wait_time=0, bypass_cache=False):
+        async with self.snapshot(url, wait_time, bypass_cache=bypass_cache) as snapshot:
+            screenshot_data = await snapshot.screenshot(selector)
 
-            if wait_time > 0:
-                print(f"Waiting for {wait_time}ms...")
-                await page.wait_for_timeout(wait_time)
+            if not with_styles:
+                return await snapshot.html(selector), screenshot_data
 
-            screenshot_data = await page.locator(selector).first.screenshot()
-            screenshot = crop_and_downscale_image(screenshot_data, max_width, max_height)
+            html_with_styles = await snapshot.html_with_inline_styles(selector)
 
-            if not with_styles:
-                html = await page.locator(selector).inner_html()
-                await browser.close()
-
-                return html, screenshot_data
-
-            html_with_styles = await page.evaluate('''(selector) => {
-            
-                const essentialCssProperties = [
-                    "color",
-                    "background-color",
-                    "background-image",
-                    "background-size",
-                    "font-family",
-                    "font-size",
-                    "font-weight",
-                    "line-height",
-                    "text-align",
-                    "text-decoration",
-                    "text-transform",
-                    "display",
-                    "position",
-                    "top",
-                    "right",
-                    "bottom",
-                    "left",
-                    "float",
-                    "clear",
-                    "margin",
-                    "padding",
-                    "border",
-                    "width",
-                    "height",
-                    "box-sizing",
-                    "flex-direction",
-                    "justify-content",
-                    "align-items",
-                    "flex-wrap",
-                    "grid-template-columns",
-                    "grid-template-rows",
-                    "grid-gap",
-                    "transition",
-                    "animation",
-                    "keyframes",
-                    "transform",
-                    "translate",
-                    "rotate",
-                    "scale",
-                    "visibility",
-                    "opacity",
-                    "z-index",
-                    "media queries"
-                ];
-            
-                function getExplicitlySetStyles(element) {
-                    const originalComputedStyle = window.getComputedStyle(element);
-                    const explicitlySetStyles = {};
-                    for (let property of originalComputedStyle) {
-                        if (essentialCssProperties.includes(property)) {
-                            explicitlySetStyles[property] = originalComputedStyle.getPropertyValue(property);
-                        }
-                    }
-                    return explicitlySetStyles;
-                }
-    
-                function applyInlineStyles(element) {
-                    const styles = getExplicitlySetStyles(element);
-                    for (let property in styles) {
-                        element.style[property] = styles[property];
-                    }
-                    for (let child of element.children) {
-                        applyInlineStyles(child);
-                    }
-                }
-    
-                const element = document.querySelector(selector);
-                applyInlineStyles(element);
-    
-                return element.innerHTML;
-                
-            }''', selector)
-
-            await browser.close()
-
-            return html_with_styles, image_to_bytes(screenshot)
-
-    async def get_full_page_screenshot_with_highlight(self, url, selector):
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=self.headless)
-
-            page = await browser.new_page()
-
-            await page.goto(url)
-            await page.wait_for_load_state('networkidle')
-
-            element = await page.query_selector(selector)
-            bbox = await element.bounding_box()
-
-            await page.screenshot(path='screenshots/screenshot.png', full_page=True)
-            await browser.close()
-
-        # Open the screenshot and create a drawing context
-        image = Image.open('screenshots/screenshot.png')
-        draw = ImageDraw.Draw(image)
-
-        # Draw a red rectangle around the desired section
-        draw.rectangle(
-            [
-                (bbox['x'], bbox['y']),
-                (bbox['x'] + bbox['width'], bbox['y'] + bbox['height'])
-            ],
-            outline='red',
-            width=5
-        )
+        return html_with_styles, crop_and_downscale_image(screenshot_data, max_width, max_height)
 
-        # Save the modified image
-        image.save('screenshots/highlighted_screenshot.png')
+    async def get_full_page_screenshot_with_highlight(self, url, selector, bypass_cache=False):
+        async with self.snapshot(url, bypass_cache=bypass_cache) as snapshot:
+            return await snapshot.full_page_screenshot(highlight_selector=selector)
 
-        return image
+    async def get_block_html(self, url, selector, wait_time=0, bypass_cache=False):
+        async with self.snapshot(url, wait_time, bypass_cache=bypass_cache) as snapshot:
+            return await snapshot.outer_html(selector)
 
-    async def get_block_html(self, url, selector, wait_time=0):
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=self.headless)
-            page = await browser.new_page()
-
-            await page.goto(url)
-            await page.wait_for_load_state('networkidle')
-
-            if wait_time > 0:
-                print(f"Waiting for {wait_time}ms...")
-                await page.wait_for_timeout(wait_time)
-
-            # html = await page.locator(selector).inner_html()
-            # Select the element and get its outer HTML
-            html_element = await page.query_selector(selector)  # Replace 'selector' with your actual selector
-            outer_html = await html_element.evaluate('element => element.outerHTML')
-            await browser.close()
-
-            return outer_html
-
-    async def get_raw_css(self, url, selector):
-        async with async_playwright() as p:
-            browser = await p.chromium.launch(headless=self.headless)
-            page = await browser.new_page()
-            await page.goto(url)
-            await page.wait_for_load_state('networkidle')
-
-            block_css, root_css_vars = await page.evaluate('''
-                (selector) => {
-                    const element = document.querySelector(selector);
-                    if (!element) return null;
-
-                    const blockName = element.dataset.blockName;
-                    const stylesheets = Array.from(document.styleSheets);
-                    const externalStyles = stylesheets.filter(sheet => sheet.href && sheet.ownerNode.nodeName === 'LINK');
-                    const blockStyles = externalStyles.filter(sheet => sheet.href.includes(blockName)).map(sheet => {
-                        try {
-                            const rules = Array.from(sheet.cssRules).map(rule => rule.cssText);
-                            return rules.join('\\n');
-                        } catch (e) {
-                            // Some stylesheets might be blocked due to CORS policies
-                            console.error(`Could not access rules from stylesheet at ${sheet.href}`);
-                            return [];
-                        }
-                    });
-
-                    const rootStyles = externalStyles.filter(sheet => sheet.href.endsWith('/styles.css')).map(sheet => {
-                        try {
-                            const rules = Array.from(sheet.cssRules).map(rule => rule.cssText).filter(style => style.startsWith(':root'));
-                            return rules[0];
-                        } catch (e) {
-                            // Some stylesheets might be blocked due to CORS policies
-                            console.error(`Could not access rules from stylesheet at ${sheet.href}`);
-                            return [];
-                        }
-                    });
-                    return [blockStyles[0], rootStyles[0]];
-                }
-            ''', selector)
-
-            await browser.close()
-
-            return block_css, root_css_vars
+    async def get_raw_css(self, url, selector, bypass_cache=False):
+        async with self.snapshot(url, bypass_cache=bypass_cache) as snapshot:
+            return await snapshot.raw_css(selector)
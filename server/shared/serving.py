@@ -0,0 +1,93 @@
+import asyncio
+import inspect
+import os
+
+import uvicorn
+
+# 'development' reloads the server on code changes; 'production' runs SERVER_WORKERS worker processes
+SERVER_MODE = os.getenv('SERVER_MODE', 'development')
+SERVER_WORKERS = int(os.getenv('SERVER_WORKERS', 1))
+# How long (in seconds) a stopping server waits for open requests and streams, then for in-flight jobs
+SERVER_SHUTDOWN_TIMEOUT = int(os.getenv('SERVER_SHUTDOWN_TIMEOUT', 30))
+
+
+class AsgiApp:
+    """
+    An aioflask app served over ASGI, with callbacks run when a server process starts and when it stops.
+
+    aioflask only handles HTTP, so the lifespan events of the server are handled here: the startup callbacks
+    run before the first request and the shutdown callbacks once the server has stopped accepting connections
+    and the open ones are closed. Callbacks can be functions, which run in a thread, or coroutine functions.
+    """
+
+    def __init__(self, app, on_startup=(), on_shutdown=()):
+        self.app = app
+        self.on_startup = list(on_startup)
+        self.on_shutdown = list(on_shutdown)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'lifespan':
+            return await self.app(scope, receive, send)
+
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                try:
+                    await self._run_callbacks(self.on_startup)
+                except Exception as e:
+                    print(f"Server startup failed: {e}")
+                    await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                    return
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                try:
+                    await self._run_callbacks(self.on_shutdown)
+                except Exception as e:
+                    print(f"Server shutdown failed: {e}")
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+    @staticmethod
+    async def _run_callbacks(callbacks):
+        for callback in callbacks:
+            if inspect.iscoroutinefunction(callback):
+                await callback()
+            else:
+                await asyncio.to_thread(callback)
+
+
+def raise_open_files_limit():
+    """Each open connection is a file descriptor, so allow as many as the system does."""
+    try:
+        import resource
+        soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+        if hard == resource.RLIM_INFINITY or soft < hard:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+    except (ImportError, ValueError, OSError) as e:
+        print(f"Could not raise the open files limit: {e}")
+
+
+def serve(app, host='0.0.0.0', port=8000, workers=None):
+    """
+    Serve an ASGI app with uvicorn. The app is either an app object or the 'module:function' import string of a
+    function that creates one, which is needed to run several worker processes or to reload on code changes.
+    """
+    factory = isinstance(app, str)
+    development = SERVER_MODE == 'development'
+    workers = 1 if development else workers or SERVER_WORKERS
+    if workers > 1 and not factory:
+        print("Several workers need the import string of an app factory, running a single worker")
+        workers = 1
+
+    raise_open_files_limit()
+    print(f"Serving on http://{host}:{port} in {SERVER_MODE} mode with {workers} worker(s)")
+    uvicorn.run(
+        app,
+        host=host,
+        port=port,
+        factory=factory,
+        workers=workers,
+        reload=development and factory,
+        log_level='debug' if development else 'info',
+        timeout_graceful_shutdown=SERVER_SHUTDOWN_TIMEOUT,
+    )
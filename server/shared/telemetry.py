@@ -0,0 +1,277 @@
+import contextvars
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Metrics of the most recent jobs are kept per job; older jobs only remain in the per-step aggregates
+TELEMETRY_MAX_JOBS = int(os.getenv('TELEMETRY_MAX_JOBS', 100))
+
+SCOPE_LABELS = ('job_id', 'pipeline', 'step', 'strategy')
+# Per-job series are exposed under their own metric names, so that summing a metric over its labels doesn't count
+# the requests of recent jobs twice
+PER_JOB_PREFIX = 'job_'
+
+_scope = contextvars.ContextVar('telemetry_scope', default={})
+_llm_call = contextvars.ContextVar('telemetry_llm_call', default=None)
+
+
+@contextmanager
+def telemetry_scope(**labels):
+    """
+    Attribute the metrics recorded inside the block to the given job, pipeline, step and/or strategy.
+    A `timings` entry (a RequestTimings) additionally collects the durations of the LLM calls in the block.
+    """
+    token = _scope.set({**_scope.get(), **{key: value for key, value in labels.items() if value is not None}})
+    try:
+        yield
+    finally:
+        _scope.reset(token)
+
+
+def current_scope():
+    return dict(_scope.get())
+
+
+class LlmCall:
+    """Measurements of a single get_completions() call, including its retries and tool call rounds."""
+
+    def __init__(self, model, scope):
+        self.model = model
+        self.scope = scope
+        self.started_at = time.monotonic()
+        self.time_to_first_token = None
+        self.prompt_tokens = 0
+        self.completion_tokens = 0
+        self.retries = 0
+        self.failovers = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.tool_call_rounds = 0
+        self.cache_hit = False
+        self.error = False
+        self.queue_time = 0.0
+        self.upstream_time = 0.0
+
+    def first_token(self):
+        if self.time_to_first_token is None:
+            self.time_to_first_token = time.monotonic() - self.started_at
+
+    def add_usage(self, usage):
+        if usage:
+            self.prompt_tokens += usage.prompt_tokens
+            self.completion_tokens += usage.completion_tokens
+
+
+@contextmanager
+def llm_call(model, scope=None):
+    """Measure an LLM call; the scope defaults to the caller's and is passed explicitly when crossing event loops."""
+    call = LlmCall(model, current_scope() if scope is None else scope)
+    token = _llm_call.set(call)
+    try:
+        yield call
+    except BaseException:
+        call.error = True
+        raise
+    finally:
+        _llm_call.reset(token)
+        duration = time.monotonic() - call.started_at
+        telemetry.record_llm_call(call, duration)
+        timings = call.scope.get('timings')
+        if timings is not None:
+            timings.add('llm_queue', call.queue_time, 'Waiting for the LLM rate limits')
+            timings.add('llm_upstream', call.upstream_time, 'LLM responses')
+            timings.add('llm', duration, 'LLM calls')
+
+
+def record_llm_retry(details):
+    """A backoff on_backoff handler counting the retries of the current LLM call."""
+    call = _llm_call.get()
+    if call is not None:
+        call.retries += 1
+
+
+def record_llm_request(queue_time, upstream_time):
+    """Add the time a request of the current LLM call waited for the rate limits and for the response."""
+    call = _llm_call.get()
+    if call is not None:
+        call.queue_time += queue_time
+        call.upstream_time += upstream_time
+
+
+def record_llm_failover():
+    """Count a request of the current LLM call that was failed over to another deployment."""
+    call = _llm_call.get()
+    if call is not None:
+        call.failovers += 1
+
+
+def record_llm_hedge(won=False):
+    """Count a duplicate request sent by the current LLM call to hedge a slow one, and whether it won."""
+    call = _llm_call.get()
+    if call is not None:
+        if won:
+            call.hedge_wins += 1
+        else:
+            call.hedges += 1
+
+
+class Telemetry:
+    """A minimal in-process registry of counters, exposed in the Prometheus text format."""
+
+    METRICS = OrderedDict([
+        ('llm_requests_total', ('counter', 'Number of LLM completion calls.')),
+        ('llm_errors_total', ('counter', 'Number of LLM completion calls that failed.')),
+        ('llm_cache_hits_total', ('counter', 'Number of LLM completion calls answered from the prompt cache.')),
+        ('llm_retries_total', ('counter', 'Number of LLM requests retried after rate limiting.')),
+        ('llm_failovers_total', ('counter', 'Number of LLM requests failed over to another deployment.')),
+        ('llm_hedged_requests_total', ('counter', 'Number of duplicate LLM requests sent to hedge slow ones.')),
+        ('llm_hedge_wins_total', ('counter', 'Number of duplicate LLM requests that responded first.')),
+        ('llm_tool_call_rounds_total', ('counter', 'Number of tool call rounds in LLM completion calls.')),
+        ('llm_prompt_tokens_total', ('counter', 'Number of prompt tokens sent to the LLM.')),
+        ('llm_completion_tokens_total', ('counter', 'Number of completion tokens received from the LLM.')),
+        ('llm_request_duration_seconds', ('summary', 'Duration of LLM completion calls.')),
+        ('llm_queue_duration_seconds', ('summary', 'Time LLM completion calls waited for the rate limits.')),
+        ('llm_time_to_first_token_seconds', ('summary', 'Time to the first token of streamed LLM completion calls.')),
+        ('pipeline_step_duration_seconds', ('summary', 'Duration of pipeline steps.')),
+        ('pipeline_step_retries_total', ('counter', 'Number of pipeline step attempts retried after a failure or timeout.')),
+        ('pipeline_step_failures_handled_total', ('counter', 'Number of failed pipeline steps skipped or completed with their fallback.')),
+        ('circuit_breaker_rejections_total', ('counter', 'Number of pipeline step attempts rejected by an open circuit breaker.')),
+    ])
+
+    def __init__(self, max_jobs=TELEMETRY_MAX_JOBS):
+        self.max_jobs = max_jobs
+        self.values = {}
+        self.jobs = OrderedDict()
+        self.lock = threading.Lock()
+
+    def _add(self, name, labels, value):
+        if 'job_id' in labels:
+            name = f"{PER_JOB_PREFIX}{name}"
+        key = (name, tuple(sorted(labels.items())))
+        self.values[key] = self.values.get(key, 0) + value
+
+    def _observe(self, name, labels, value):
+        self._add(f"{name}_sum", labels, value)
+        self._add(f"{name}_count", labels, 1)
+
+    def _record(self, scope, record):
+        """Record the metrics both aggregated over all jobs and, for recent jobs, per job."""
+        labels = {key: str(scope.get(key, '')) for key in SCOPE_LABELS if key != 'job_id'}
+        job_id = scope.get('job_id')
+        with self.lock:
+            record(labels)
+            if job_id:
+                self._track_job(str(job_id))
+                record({**labels, 'job_id': str(job_id)})
+
+    def _track_job(self, job_id):
+        self.jobs[job_id] = True
+        self.jobs.move_to_end(job_id)
+        while len(self.jobs) > self.max_jobs:
+            evicted_job_id, _ = self.jobs.popitem(last=False)
+            self.values = {key: value for key, value in self.values.items() if ('job_id', evicted_job_id) not in key[1]}
+
+    def record_llm_call(self, call, duration):
+        def record(labels):
+            labels = {**labels, 'model': call.model}
+            self._add('llm_requests_total', labels, 1)
+            self._add('llm_errors_total', labels, int(call.error))
+            self._add('llm_cache_hits_total', labels, int(call.cache_hit))
+            self._add('llm_retries_total', labels, call.retries)
+            self._add('llm_failovers_total', labels, call.failovers)
+            self._add('llm_hedged_requests_total', labels, call.hedges)
+            self._add('llm_hedge_wins_total', labels, call.hedge_wins)
+            self._add('llm_tool_call_rounds_total', labels, call.tool_call_rounds)
+            self._add('llm_prompt_tokens_total', labels, call.prompt_tokens)
+            self._add('llm_completion_tokens_total', labels, call.completion_tokens)
+            self._observe('llm_request_duration_seconds', labels, duration)
+            self._observe('llm_queue_duration_seconds', labels, call.queue_time)
+            if call.time_to_first_token is not None:
+                self._observe('llm_time_to_first_token_seconds', labels, call.time_to_first_token)
+
+        self._record(call.scope, record)
+
+    def record_step(self, duration, scope=None):
+        self._record(current_scope() if scope is None else scope, lambda labels: self._observe('pipeline_step_duration_seconds', labels, duration))
+
+    def record_step_retry(self, scope=None):
+        self._record(current_scope() if scope is None else scope, lambda labels: self._add('pipeline_step_retries_total', labels, 1))
+
+    def record_step_failure_handled(self, on_error, scope=None):
+        self._record(current_scope() if scope is None else scope, lambda labels: self._add('pipeline_step_failures_handled_total', {**labels, 'on_error': on_error}, 1))
+
+    def record_circuit_breaker_rejection(self, circuit_breaker, scope=None):
+        self._record(current_scope() if scope is None else scope, lambda labels: self._add('circuit_breaker_rejections_total', {**labels, 'circuit_breaker': circuit_breaker}, 1))
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format."""
+        with self.lock:
+            values = dict(self.values)
+
+        lines = []
+        for name, (metric_type, description) in self.METRICS.items():
+            for metric_name, metric_description in ((name, description), (f"{PER_JOB_PREFIX}{name}", f"{description} Per job, for recent jobs only.")):
+                samples = sorted(
+                    (key, value) for key, value in values.items()
+                    if key[0] == metric_name or key[0] in (f"{metric_name}_sum", f"{metric_name}_count")
+                )
+                if not samples:
+                    continue
+                lines.append(f"# HELP {metric_name} {metric_description}")
+                lines.append(f"# TYPE {metric_name} {metric_type}")
+                for (sample_name, labels), value in samples:
+                    label_text = ','.join(f'{key}="{escape_label_value(label)}"' for key, label in labels)
+                    lines.append(f"{sample_name}{{{label_text}}} {format_value(value)}")
+        return '\n'.join(lines) + '\n'
+
+    def clear(self):
+        with self.lock:
+            self.values.clear()
+            self.jobs.clear()
+
+
+class RequestTimings:
+    """The durations of the phases of a request, rendered as a Server-Timing header."""
+
+    def __init__(self):
+        self.started_at = time.monotonic()
+        self.durations = OrderedDict()
+        self.descriptions = {}
+        self.lock = threading.Lock()
+
+    def add(self, name, duration, description=None):
+        with self.lock:
+            self.durations[name] = self.durations.get(name, 0.0) + duration
+            if description:
+                self.descriptions[name] = description
+
+    @contextmanager
+    def measure(self, name, description=None):
+        started_at = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, time.monotonic() - started_at, description)
+
+    def header(self):
+        with self.lock:
+            durations = list(self.durations.items()) + [('total', time.monotonic() - self.started_at)]
+            descriptions = dict(self.descriptions)
+        metrics = []
+        for name, duration in durations:
+            description = f';desc="{descriptions[name]}"' if name in descriptions else ''
+            metrics.append(f'{name};dur={duration * 1000:.1f}{description}')
+        return ', '.join(metrics)
+
+
+def format_value(value):
+    return str(int(value)) if float(value).is_integer() else repr(float(value))
+
+
+def escape_label_value(value):
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+telemetry = Telemetry()
@@ -1,10 +1,9 @@
-from server.copilot_server import CopilotServer
+from server.shared.serving import serve
 
 
 def main():
     print("Starting Assistant...")
-    assistant_server = CopilotServer()
-    assistant_server.run(host='0.0.0.0', port=4001)
+    serve('server.asgi:create_copilot_app', host='0.0.0.0', port=4001)
 
 
 if __name__ == "__main__":
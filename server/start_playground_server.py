@@ -1,14 +1,15 @@
 import argparse
+import os
 import time
 
-from server.playground_server import PlaygroundServer
+from server.shared.serving import serve
 
 
 def main(url):
     print("Starting Playground...")
-    playground_server = PlaygroundServer(url)
+    os.environ['PLAYGROUND_URL'] = url
     print(f"Proxying {url} at http://localhost:4000?t={int(time.time())}")
-    playground_server.run(host='0.0.0.0', port=4000)
+    serve('server.asgi:create_playground_app', host='0.0.0.0', port=4000)
 
 
 if __name__ == "__main__":
@@ -1,10 +1,10 @@
-from server.web_creator_server import WebCreator
+from server.shared.serving import serve
 
 
 def main():
     print("Starting Web Creator...")
-    web_creator_server = WebCreator()
-    web_creator_server.run(host='0.0.0.0', port=4003)
+    # Jobs and their status streams live in the server's memory, so it always runs in a single process
+    serve('server.asgi:create_web_creator_app', host='0.0.0.0', port=4003, workers=1)
 
 
 if __name__ == "__main__":
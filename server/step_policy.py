@@ -0,0 +1,84 @@
+import os
+import random
+from contextlib import nullcontext
+from typing import Any, Dict, Optional
+
+from server.shared.circuit_breaker import get_circuit_breaker
+
+# Timeout (in seconds) of the steps that don't set one; by default they can run for as long as they need
+PIPELINE_STEP_TIMEOUT = float(os.getenv('PIPELINE_STEP_TIMEOUT', 0)) or None
+
+ON_ERROR_FAIL = 'fail'
+ON_ERROR_SKIP = 'skip'
+
+
+class StepTimeoutError(TimeoutError):
+    """Raised when an attempt of a step times out; still_running if the attempt couldn't be interrupted."""
+
+    def __init__(self, step_id: str, timeout: float, still_running: bool = False):
+        super().__init__(f"Step '{step_id}' timed out after {timeout}s")
+        self.step_id = step_id
+        self.timeout = timeout
+        self.still_running = still_running
+
+
+class RetryPolicy:
+    """How many times a step is attempted, waiting backoff * multiplier ** n seconds (with jitter) between attempts."""
+
+    def __init__(self, max_attempts: int = 1, backoff: float = 1.0, multiplier: float = 2.0, max_backoff: float = 30.0):
+        if max_attempts < 1:
+            raise ValueError("max_attempts must be at least 1")
+        self.max_attempts = max_attempts
+        self.backoff = backoff
+        self.multiplier = multiplier
+        self.max_backoff = max_backoff
+
+    def get_delay(self, attempt: int) -> float:
+        """The delay before the attempt following the given one (1 for the first attempt)."""
+        delay = min(self.backoff * self.multiplier ** (attempt - 1), self.max_backoff)
+        # Jitter spreads the retries of jobs that failed at the same time
+        return random.uniform(delay / 2, delay)
+
+
+class StepPolicy:
+    """
+    The failure handling of a step, declared in its pipeline definition next to its config:
+
+        "retry": {"max_attempts": 3, "backoff": 2, "multiplier": 2, "max_backoff": 30},
+        "timeout": 120,
+        "on_error": "fail" | "skip" | {"fallback": {"captions": {}}},
+        "circuit_breaker": "llm"
+
+    A timeout applies to each attempt. When the last attempt fails, "fail" fails the job, "skip" skips the step
+    and the steps that depend on it, and a fallback completes the step with the given result. The circuit
+    breaker is shared by all the steps calling the same external dependency; while it's open the step fails
+    right away, without retries. Steps can declare their dependency with a circuit_breaker class attribute.
+    """
+
+    def __init__(self, retry: RetryPolicy = None, timeout: Optional[float] = PIPELINE_STEP_TIMEOUT, on_error: Any = ON_ERROR_FAIL, circuit_breaker: Optional[str] = None):
+        if on_error not in (ON_ERROR_FAIL, ON_ERROR_SKIP) and not (isinstance(on_error, dict) and 'fallback' in on_error):
+            raise ValueError(f"on_error must be '{ON_ERROR_FAIL}', '{ON_ERROR_SKIP}' or {{\"fallback\": ...}}, not {on_error!r}")
+        self.retry = retry or RetryPolicy()
+        self.timeout = timeout
+        self.on_error = on_error
+        self.circuit_breaker = circuit_breaker
+
+    @classmethod
+    def from_definition(cls, step_config: Dict[str, Any], default_circuit_breaker: Optional[str] = None) -> 'StepPolicy':
+        try:
+            return cls(
+                retry=RetryPolicy(**step_config.get("retry", {})),
+                timeout=step_config.get("timeout", PIPELINE_STEP_TIMEOUT),
+                on_error=step_config.get("on_error", ON_ERROR_FAIL),
+                circuit_breaker=step_config.get("circuit_breaker", default_circuit_breaker)
+            )
+        except (TypeError, ValueError) as e:
+            raise ValueError(f"Invalid policy for step '{step_config.get('id')}': {e}")
+
+    @property
+    def fallback(self):
+        return self.on_error.get('fallback') if isinstance(self.on_error, dict) else None
+
+    def guard(self):
+        """A context manager for an attempt: the step's circuit breaker, if it has one."""
+        return get_circuit_breaker(self.circuit_breaker).call() if self.circuit_breaker else nullcontext()
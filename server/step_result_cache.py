@@ -0,0 +1,56 @@
+import copy
+import os
+from typing import Any, Dict, Optional
+
+from server.shared.cache import MISSING, DiskStore, LruCache, stable_hash
+
+# Bump when the layout of cached step results changes to invalidate old entries
+CACHE_VERSION = 1
+
+STEP_CACHE_MAX_ENTRIES = int(os.getenv('STEP_CACHE_MAX_ENTRIES', 128))
+STEP_CACHE_DIR = os.getenv('STEP_CACHE_DIR')
+STEP_CACHE_TTL = int(os.getenv('STEP_CACHE_TTL', 24 * 60 * 60))
+
+
+class StepResultCache:
+    """
+    Memoizes pipeline step results in a bounded in-memory LRU, optionally backed by an on-disk store.
+    Results are kept for ttl seconds in both.
+    """
+
+    def __init__(self, max_entries: int = STEP_CACHE_MAX_ENTRIES, folder: Optional[str] = STEP_CACHE_DIR, ttl: Optional[int] = STEP_CACHE_TTL):
+        self.memory = LruCache(max_entries=max_entries, ttl=ttl)
+        self.disk = DiskStore(folder, ttl=ttl) if folder else None
+
+    @staticmethod
+    def make_key(step_type: str, config: Dict[str, Any], inputs: Dict[str, Any]) -> str:
+        return stable_hash({
+            "version": CACHE_VERSION,
+            "type": step_type,
+            "config": config,
+            "inputs": inputs,
+        })
+
+    def get(self, key: str) -> Any:
+        result = self.memory.get(key, MISSING)
+        if result is MISSING and self.disk:
+            result = self.disk.get(key, MISSING)
+            if result is not MISSING:
+                self.memory.put(key, result)
+        # Hand out copies so that steps mutating their inputs cannot corrupt the cached result
+        return result if result is MISSING else copy.deepcopy(result)
+
+    def put(self, key: str, result: Any):
+        result = copy.deepcopy(result)
+        self.memory.put(key, result)
+        if self.disk:
+            try:
+                self.disk.put(key, result)
+            except Exception as e:
+                print(f"Failed to store step result on disk: {e}")
+
+    def clear(self):
+        self.memory.clear()
+
+
+step_result_cache = StepResultCache()
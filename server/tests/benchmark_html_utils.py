@@ -0,0 +1,101 @@
+"""
+Benchmarks convert_urls_to_hashes and convert_hashes_to_urls against their previous BeautifulSoup implementations
+on generated pages of increasing size:
+
+    python -m server.tests.benchmark_html_utils --sizes 0.25 1 4
+"""
+import argparse
+import time
+
+from bs4 import BeautifulSoup
+
+from server.shared.html_utils import compute_unique_hash, convert_hashes_to_urls, convert_urls_to_hashes
+
+
+def legacy_convert_urls_to_hashes(html_string, url_mapping, min_length=0):
+    def hash_url(url):
+        if url in url_mapping.values():
+            return next(k for k, v in url_mapping.items() if v == url)
+        hash_value = f'hash://{compute_unique_hash(url)}'
+        url_mapping[hash_value] = url
+        return hash_value
+
+    def traverse_and_hash(node):
+        if node.name is None:
+            return node if node else ''
+        attributes = {}
+        for attr, value in node.attrs.items():
+            if attr in ['href', 'src', 'srcset'] and len(value) > min_length:
+                value = f"{hash_url(value)}"
+            attributes[attr] = value
+        open_tag = f"<{node.name}{' ' + ' '.join([f'{k}=\"{v}\"' for k, v in attributes.items()]) if attributes else ''}>"
+        close_tag = f"</{node.name}>"
+        children = ''.join([traverse_and_hash(child) for child in node.children if child.name or child.string])
+        return f"{open_tag}{children}{close_tag}"
+
+    soup = BeautifulSoup(html_string, 'html.parser')
+    body = soup.body or soup
+    hashed_html = traverse_and_hash(body)
+    return str(BeautifulSoup(hashed_html, 'html.parser')).replace('<!--[document]-->', '').replace('&lt;[document]&gt;', '').strip()
+
+
+def legacy_convert_hashes_to_urls(compressed_html, url_mapping):
+    soup = BeautifulSoup(compressed_html, 'html.parser')
+    for tag in soup.find_all():
+        for attr, value in tag.attrs.items():
+            if isinstance(value, str) and value.startswith('hash://'):
+                tag[attr] = url_mapping.get(value)
+    return str(soup)
+
+
+def generate_page(size_mb):
+    """A page of product cards, each with a distinct long image URL, a link and some text."""
+    cards = []
+    size = 0
+    index = 0
+    while size < size_mb * 1024 * 1024:
+        card = (
+            f'<div class="card" id="card-{index}">'
+            f'<a href="https://shop.example.com/products/category/item-{index}?utm_source=newsletter&amp;utm_medium=email">'
+            f'<img src="https://cdn.example.com/images/products/{index}/large.jpg?width=1200&amp;height=800" alt="Product {index}">'
+            f'</a><p>Product {index} is a great product with a long description that goes on for a while.</p></div>\n'
+        )
+        cards.append(card)
+        size += len(card)
+        index += 1
+    return f'<html><head><title>Products</title></head><body>\n{"".join(cards)}</body></html>', index
+
+
+def measure(function, *args):
+    started_at = time.perf_counter()
+    result = function(*args)
+    return result, time.perf_counter() - started_at
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', type=float, nargs='+', default=[0.25, 0.5, 1, 2], help='page sizes in MB')
+    parser.add_argument('--skip-legacy-above', type=float, default=1, help='only run the legacy implementation up to this size in MB')
+    args = parser.parse_args()
+
+    print(f"{'size':>8} {'cards':>7} {'to hashes':>10} {'to URLs':>10} {'legacy to hashes':>17} {'legacy to URLs':>15}")
+    for size_mb in args.sizes:
+        page, cards = generate_page(size_mb)
+
+        url_mapping = {}
+        hashed_html, to_hashes = measure(convert_urls_to_hashes, page, url_mapping)
+        restored_html, to_urls = measure(convert_hashes_to_urls, hashed_html, url_mapping)
+        assert restored_html == page[page.index('<body>'):page.index('</body>') + len('</body>')]
+
+        legacy = ['skipped', 'skipped']
+        if size_mb <= args.skip_legacy_above:
+            legacy_mapping = {}
+            legacy_hashed_html, legacy_to_hashes = measure(legacy_convert_urls_to_hashes, page, legacy_mapping)
+            _, legacy_to_urls = measure(legacy_convert_hashes_to_urls, legacy_hashed_html, legacy_mapping)
+            legacy = [f'{legacy_to_hashes:.2f}s', f'{legacy_to_urls:.2f}s']
+
+        print(f"{size_mb:>6}MB {cards:>7} {to_hashes:>9.2f}s {to_urls:>9.2f}s {legacy[0]:>17} {legacy[1]:>15}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,142 @@
+import asyncio
+import unittest
+
+from server.shared.browser_pool import BrowserPool, PooledBrowser
+
+
+class FakePage:
+    pass
+
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+
+    async def new_page(self):
+        await asyncio.sleep(self.browser.page_delay)
+        return FakePage()
+
+    async def close(self):
+        self.browser.open_contexts -= 1
+
+
+class FakeBrowser:
+    def __init__(self, page_delay=0.0):
+        self.page_delay = page_delay
+        self.open_contexts = 0
+        self.closed = False
+
+    def is_connected(self):
+        return not self.closed
+
+    async def new_context(self, **kwargs):
+        self.open_contexts += 1
+        return FakeContext(self)
+
+    async def close(self):
+        self.closed = True
+
+
+class FakeBrowserPool(BrowserPool):
+    """A browser pool launching fake browsers instead of Chromium."""
+
+    def __init__(self, page_delay=0.0, **kwargs):
+        super().__init__(**kwargs)
+        self.page_delay = page_delay
+        self.browsers = []
+
+    async def _launch(self):
+        browser = FakeBrowser(self.page_delay)
+        self.browsers.append(browser)
+        return PooledBrowser(browser)
+
+
+class TestBrowserPool(unittest.TestCase):
+
+    def setUp(self):
+        self.pool = FakeBrowserPool(size=1, page_delay=0.1)
+
+    def tearDown(self):
+        self.pool.background.stop()
+
+    def test_cancelled_caller_gives_the_page_back(self):
+        async def scenario():
+            with self.assertRaises(asyncio.TimeoutError):
+                await asyncio.wait_for(self.pool.open_page(), 0.01)
+            # The only browser is leased to the abandoned page until it opens and is closed again
+            lease = await asyncio.wait_for(self.pool.open_page(), 1)
+            await self.pool.close_page(lease)
+
+        asyncio.run(scenario())
+        self.assertEqual(len(self.pool.browsers), 1)
+        self.assertEqual(self.pool.browsers[0].open_contexts, 0)
+
+    def test_pages_are_bounded_by_the_pool_size(self):
+        pool = FakeBrowserPool(size=2)
+        running = 0
+        max_running = 0
+
+        async def scrape(page):
+            nonlocal running, max_running
+            running += 1
+            max_running = max(max_running, running)
+            await asyncio.sleep(0.02)
+            running -= 1
+
+        async def scenario():
+            await asyncio.gather(*(pool.run(scrape) for _ in range(6)))
+
+        try:
+            asyncio.run(scenario())
+        finally:
+            pool.background.stop()
+        self.assertEqual(max_running, 2)
+        self.assertEqual(len(pool.browsers), 2)
+
+    def test_closed_page_gives_the_browser_back(self):
+        pool = FakeBrowserPool(size=1, max_uses=2)
+
+        async def scenario():
+            for _ in range(3):
+                lease = await asyncio.wait_for(pool.open_page(), 1)
+                await pool.close_page(lease)
+
+        try:
+            asyncio.run(scenario())
+        finally:
+            pool.background.stop()
+        # The first browser is reused once and recycled after its second use
+        self.assertEqual(len(pool.browsers), 2)
+        self.assertTrue(pool.browsers[0].closed)
+        self.assertEqual(pool.browsers[0].open_contexts, 0)
+        self.assertEqual([pooled.uses for pooled in pool.idle_browsers], [1])
+
+    def test_failed_scrape_gives_the_browser_back(self):
+        async def scrape(page):
+            raise ValueError("Scrape failed")
+
+        async def scenario():
+            with self.assertRaises(ValueError):
+                await self.pool.run(scrape)
+            lease = await asyncio.wait_for(self.pool.open_page(), 1)
+            await self.pool.close_page(lease)
+
+        asyncio.run(scenario())
+        self.assertEqual(len(self.pool.browsers), 1)
+        self.assertEqual(self.pool.browsers[0].open_contexts, 0)
+
+    def test_disconnected_browser_is_replaced(self):
+        async def scenario():
+            lease = await self.pool.open_page()
+            await self.pool.close_page(lease)
+            self.pool.browsers[0].closed = True
+            lease = await self.pool.open_page()
+            await self.pool.close_page(lease)
+
+        asyncio.run(scenario())
+        self.assertEqual(len(self.pool.browsers), 2)
+        self.assertFalse(self.pool.browsers[1].closed)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
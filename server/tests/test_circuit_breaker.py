@@ -0,0 +1,66 @@
+import time
+import unittest
+
+from server.shared.circuit_breaker import CircuitBreaker, CircuitOpenError, CLOSED, OPEN
+
+
+class TestCircuitBreaker(unittest.TestCase):
+
+    def call_failing(self, circuit_breaker):
+        with self.assertRaises(ConnectionError):
+            with circuit_breaker.call():
+                raise ConnectionError("Upstream error")
+
+    def test_circuit_opens_after_failures_in_a_row(self):
+        circuit_breaker = CircuitBreaker("test", failure_threshold=2, recovery_time=60)
+
+        self.call_failing(circuit_breaker)
+        with circuit_breaker.call():
+            pass
+        self.call_failing(circuit_breaker)
+        self.assertEqual(circuit_breaker.state, CLOSED)
+
+        self.call_failing(circuit_breaker)
+        self.assertEqual(circuit_breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            with circuit_breaker.call():
+                pass
+
+    def test_errors_of_the_caller_are_not_failures(self):
+        circuit_breaker = CircuitBreaker("test", failure_threshold=1, recovery_time=60)
+
+        for error in (ValueError("Invalid JSON"), KeyError("captions")):
+            with self.assertRaises(type(error)):
+                with circuit_breaker.call():
+                    raise error
+
+        self.assertEqual((circuit_breaker.state, circuit_breaker.failures), (CLOSED, 0))
+
+    def test_single_trial_call_closes_the_circuit(self):
+        circuit_breaker = CircuitBreaker("test", failure_threshold=1, recovery_time=0.05)
+        self.call_failing(circuit_breaker)
+        time.sleep(0.1)
+
+        with circuit_breaker.call():
+            # Other calls are rejected while the trial call is in flight
+            with self.assertRaises(CircuitOpenError):
+                circuit_breaker.before_call()
+
+        self.assertEqual(circuit_breaker.state, CLOSED)
+        with circuit_breaker.call():
+            pass
+
+    def test_failed_trial_call_opens_the_circuit_again(self):
+        circuit_breaker = CircuitBreaker("test", failure_threshold=1, recovery_time=0.05)
+        self.call_failing(circuit_breaker)
+        time.sleep(0.1)
+
+        self.call_failing(circuit_breaker)
+
+        self.assertEqual(circuit_breaker.state, OPEN)
+        with self.assertRaises(CircuitOpenError):
+            circuit_breaker.before_call()
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
@@ -0,0 +1,69 @@
+import unittest
+
+from server.shared.html_compaction import HtmlCompactor
+
+LONG_URL = 'https://example.com/some/very/long/path/to/an/image/that/goes/on/and/on.jpg?width=1200&amp;height=800'
+DATA_URI = 'data:image/png;base64,' + 'A' * 100
+
+HTML = f'''<div class="hero">
+    <!-- Hero block -->
+    <script>if (a < b) {{ document.write("</div>"); }}</script>
+    <img src="{LONG_URL}" alt="Hero">
+    <a href='/short'>Read   more</a>
+    <svg width="24" height="24"><path d="M0 0L24 24"/><g><path d="M1 1"/></g></svg>
+    <div style="background: url({DATA_URI})"></div>
+    <meta charset="utf-8">
+    <pre>  keep
+      this  </pre>
+</div>'''
+
+
+class TestHtmlCompactor(unittest.TestCase):
+    def test_restores_exactly(self):
+        compacted = HtmlCompactor(collapse_whitespace=False).compact(HTML)
+
+        self.assertNotIn('<script', compacted.html)
+        self.assertNotIn('Hero block', compacted.html)
+        self.assertNotIn(LONG_URL, compacted.html)
+        self.assertNotIn(DATA_URI, compacted.html)
+        self.assertIn('<svg width="24" height="24"><!--hash:', compacted.html)
+        self.assertIn("<a href='/short'>", compacted.html)
+        self.assertEqual(compacted.restore(compacted.html), HTML)
+
+    def test_data_uris_are_only_replaced_in_attributes_and_styles(self):
+        prose = 'metadata:' + 'x' * 100
+        html = f'<p>{prose} and {DATA_URI}</p><img alt="{DATA_URI}"><i style=\'background: url("{DATA_URI}")\'></i>'
+
+        compacted = HtmlCompactor().compact(html)
+
+        self.assertTrue(compacted.html.startswith(f'<p>{prose} and {DATA_URI}</p><img alt="hash://'))
+        self.assertIn('url("hash://', compacted.html)
+        self.assertEqual(compacted.restore(compacted.html), html)
+
+    def test_edits_of_the_model_keep_what_was_replaced(self):
+        compacted = HtmlCompactor().compact(HTML)
+        edited = compacted.html.replace('<div class="hero">', '<div class="hero" style="color: red !important">')
+
+        restored = compacted.restore(edited)
+
+        self.assertIn('<div class="hero" style="color: red !important">', restored)
+        self.assertIn(f'<img src="{LONG_URL}" alt="Hero">', restored)
+        self.assertIn('document.write("</div>")', restored)
+        self.assertIn('<pre>  keep\n      this  </pre>', restored)
+        self.assertIn('Read more', restored)
+
+    def test_reports_the_reduction_and_truncates_to_the_budget(self):
+        stats = HtmlCompactor().compact(HTML).stats()
+        self.assertLess(stats["compacted_size"], stats["original_size"])
+        self.assertEqual(stats["placeholders"], 6)
+        self.assertGreater(stats["tokens_saved"], 0)
+
+        truncated = HtmlCompactor(max_tokens=20).compact(HTML)
+
+        self.assertTrue(truncated.truncated)
+        self.assertLessEqual(len(truncated.html), 80)
+        self.assertTrue(truncated.html.endswith('>'))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,5 +1,5 @@
 import unittest
-from server.shared.html_utils import convert_urls_to_hashes, convert_hashes_to_urls, compute_unique_hash
+from server.shared.html_utils import convert_urls_to_hashes, convert_hashes_to_urls, compute_unique_hash, UrlMapping
 import base64
 
 
@@ -50,6 +50,27 @@ class TestHTMLUtils(unittest.TestCase):
         self.assertIn('https://example.com/some/very/long/path/to/image.jpg', result_html)
         self.assertNotIn('hash://', result_html)
 
+    def test_round_trip_keeps_the_html_as_is(self):
+        html_string = (
+            '<body class="page main"><a href="https://example.com/a?x=1&amp;y=2" data-x=\'1\'>A &amp; B</a>'
+            '<img src=/images/hero.png alt="Hero"/><!-- note --></body>'
+        )
+        url_mapping = UrlMapping()
+
+        hashed_html = convert_urls_to_hashes(html_string, url_mapping)
+
+        self.assertIn('class="page main"', hashed_html)
+        self.assertEqual(url_mapping[f'hash://{compute_unique_hash("https://example.com/a?x=1&y=2")}'], 'https://example.com/a?x=1&y=2')
+        self.assertEqual(convert_hashes_to_urls(hashed_html, url_mapping), html_string)
+
+    def test_existing_hashes_are_reused(self):
+        url_mapping = UrlMapping({'hash://image': 'https://example.com/image.png'})
+
+        hashed_html = convert_urls_to_hashes('<img src="https://example.com/image.png"><img src="https://example.com/image.png">', url_mapping)
+
+        self.assertEqual(hashed_html, '<img src="hash://image"><img src="hash://image">')
+        self.assertEqual(len(url_mapping), 1)
+
 
 if __name__ == '__main__':
     unittest.main(verbosity=0)
@@ -0,0 +1,58 @@
+import pickle
+import random
+import unittest
+
+from PIL import Image
+
+from server.shared.image import ImageHandle, ImagePolicy, image_to_bytes
+
+
+def create_noisy_image(width, height, mode='RGB'):
+    random.seed(0)
+    image = Image.new(mode, (width, height))
+    image.putdata([tuple(random.randrange(256) for _ in mode) for _ in range(width * height)])
+    return image
+
+
+class TestImageHandle(unittest.TestCase):
+    def test_encodings_are_memoized(self):
+        handle = ImageHandle(image_to_bytes(Image.new('RGB', (40, 20), 'red')))
+
+        self.assertEqual(handle.size, (40, 20))
+        self.assertEqual(handle.mime_type, 'image/png')
+        self.assertTrue(handle.data_url.startswith('data:image/png;base64,'))
+        self.assertIs(handle.data_url, handle.data_url)
+        self.assertEqual(ImageHandle.from_data_url(handle.data_url).digest, handle.digest)
+
+    def test_prepare_downscales_and_recompresses(self):
+        handle = ImageHandle.from_image(create_noisy_image(400, 200))
+        policy = ImagePolicy(max_size=2048, max_short_side=100)
+
+        prepared = handle.prepare(policy)
+
+        self.assertEqual(prepared.size, (200, 100))
+        self.assertEqual(prepared.mime_type, 'image/jpeg')
+        self.assertLess(len(prepared), len(handle))
+        self.assertIs(handle.prepare(policy), prepared)
+
+    def test_transparent_images_stay_png(self):
+        image = create_noisy_image(50, 50, mode='RGBA')
+        image.putpixel((0, 0), (0, 0, 0, 0))
+
+        prepared = ImageHandle.from_image(image).prepare(ImagePolicy(max_short_side=25))
+
+        self.assertEqual(prepared.mime_type, 'image/png')
+        self.assertEqual(prepared.size, (25, 25))
+
+    def test_pickles_without_memoized_encodings(self):
+        handle = ImageHandle(image_to_bytes(Image.new('RGB', (10, 10))))
+        handle.data_url
+
+        restored = pickle.loads(pickle.dumps(handle))
+
+        self.assertEqual(restored.data, handle.data)
+        self.assertNotIn('data_url', restored.__dict__)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,107 @@
+import os
+import tempfile
+import threading
+import time
+import unittest
+
+os.environ.setdefault('AZURE_OPENAI_DALLE_API_KEY', 'test')
+os.environ.setdefault('AZURE_OPENAI_DALLE_ENDPOINT', 'http://localhost')
+
+from server.shared.cache import DiskStore, LruCache
+from server.shared.dalle import ImageCache
+
+
+class TestLruCache(unittest.TestCase):
+    def test_least_recently_used_entries_are_evicted_beyond_max_bytes(self):
+        cache = LruCache(max_bytes=10, sizeof=len)
+        cache.put('a', b'aaaa')
+        cache.put('b', b'bbbb')
+        cache.get('a')
+        cache.put('c', b'cccc')
+        cache.put('huge', b'x' * 11)
+
+        self.assertEqual(cache.get('a'), b'aaaa')
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('c'), b'cccc')
+        self.assertIsNone(cache.get('huge'))
+        self.assertEqual(cache.total_bytes, 8)
+
+
+class TestDiskStore(unittest.TestCase):
+    def test_sweep_deletes_expired_then_oldest_entries(self):
+        with tempfile.TemporaryDirectory() as folder:
+            store = DiskStore(folder, ttl=60, max_bytes=250, sweep_interval=3600)
+            for key in ['expired', 'oldest', 'older', 'newest']:
+                store.put(key, b'x' * 100)
+                age = {'expired': 120, 'oldest': 30, 'older': 20, 'newest': 10}[key]
+                os.utime(store._path(key), (time.time() - age, time.time() - age))
+
+            self.assertEqual(store.sweep(), 2)
+            self.assertEqual([store.get(key) for key in ['expired', 'oldest', 'older', 'newest']], [None, None, b'x' * 100, b'x' * 100])
+
+    def test_puts_sweep_at_most_once_per_interval(self):
+        with tempfile.TemporaryDirectory() as folder:
+            store = DiskStore(folder, max_bytes=150, sweep_interval=3600)
+            store.put('first', b'x' * 100)
+            store.put('second', b'x' * 100)
+
+            # The first put swept an empty store, so the second one is over the bound until the next sweep
+            self.assertEqual(sum(len(filenames) for _, _, filenames in os.walk(folder)), 2)
+            self.assertEqual(store.sweep(), 1)
+
+
+class TestImageCache(unittest.TestCase):
+    def test_images_are_stored_on_disk(self):
+        with tempfile.TemporaryDirectory() as folder:
+            ImageCache(folder=folder).get_or_generate('a cat', lambda prompt: b'cat image')
+            cache = ImageCache(folder=folder)
+
+            image = cache.get_or_generate('a cat', lambda prompt: self.fail("The image should be read from disk"))
+
+        self.assertEqual(image, b'cat image')
+
+    def test_concurrent_requests_for_a_prompt_share_one_generation(self):
+        cache = ImageCache(folder=None)
+        generations = []
+        results = []
+
+        def generate(prompt):
+            generations.append(prompt)
+            time.sleep(0.1)
+            return b'dog image'
+
+        threads = [threading.Thread(target=lambda: results.append(cache.get_or_generate('a dog', generate))) for _ in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(generations, ['a dog'])
+        self.assertEqual(results, [b'dog image'] * 4)
+
+    def test_failed_generation_is_raised_to_every_waiter(self):
+        cache = ImageCache(folder=None)
+        errors = []
+
+        def generate(prompt):
+            time.sleep(0.1)
+            raise RuntimeError("Content policy violation")
+
+        def request():
+            try:
+                cache.get_or_generate('a fish', generate)
+            except RuntimeError as e:
+                errors.append(str(e))
+
+        threads = [threading.Thread(target=request) for _ in range(3)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(errors, ["Content policy violation"] * 3)
+        self.assertEqual(cache.in_flight, {})
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
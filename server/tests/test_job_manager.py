@@ -0,0 +1,175 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from server.job_manager import Job, JobManager, JobStatus, StoredJob
+from server.job_store import JobRecord, JobStore
+
+
+class SleepJob(Job):
+    running = 0
+    max_running = {}
+
+    def __init__(self, job_id, pipeline_id=None, delay=0.05):
+        super().__init__(job_id=job_id, pipeline_id=pipeline_id)
+        self.delay = delay
+        self.released = False
+
+    async def run(self):
+        SleepJob.running += 1
+        SleepJob.max_running[self.pipeline_id] = max(SleepJob.max_running.get(self.pipeline_id, 0), SleepJob.running)
+        await asyncio.sleep(self.delay)
+        SleepJob.running -= 1
+        return {"job_id": self.job_id}
+
+    def get_params(self):
+        return {"delay": self.delay}
+
+    def release(self):
+        self.released = True
+
+
+def run_jobs(manager, jobs):
+    async def scenario():
+        manager.loop = asyncio.get_running_loop()
+        worker = asyncio.create_task(manager.worker_loop())
+        for job in jobs:
+            manager.add_job(job)
+        await asyncio.sleep(0)
+        await manager.job_queue.join()
+        worker.cancel()
+
+    asyncio.run(scenario())
+
+
+class TestJobManager(unittest.TestCase):
+
+    def setUp(self):
+        SleepJob.running = 0
+        SleepJob.max_running = {}
+
+    def test_runs_jobs_concurrently_up_to_global_limit(self):
+        manager = JobManager(max_concurrent_jobs=3)
+        jobs = [SleepJob(f"job{i}") for i in range(6)]
+
+        run_jobs(manager, jobs)
+
+        self.assertEqual(SleepJob.max_running[None], 3)
+        self.assertTrue(all(job.status == JobStatus.COMPLETED for job in jobs))
+
+    def test_pipeline_limit_and_queue_positions(self):
+        manager = JobManager(max_concurrent_jobs=4, pipeline_concurrency={"slow_pipeline": 1})
+        jobs = [SleepJob(f"job{i}", pipeline_id="slow_pipeline") for i in range(3)]
+
+        run_jobs(manager, jobs)
+
+        self.assertEqual(SleepJob.max_running["slow_pipeline"], 1)
+        last_job_positions = [update["queue_position"] for update in jobs[2].updates if "queue_position" in update]
+        self.assertEqual(last_job_positions, [3, 2, 1])
+
+    def test_drain_waits_for_jobs_in_flight(self):
+        manager = JobManager(max_concurrent_jobs=1)
+        manager.start_worker_thread()
+        while manager.loop is None or not manager.loop.is_running():
+            time.sleep(0.01)
+        jobs = [SleepJob(f"job{i}", delay=0.1) for i in range(3)]
+        for job in jobs:
+            manager.add_job(job)
+
+        self.assertFalse(manager.drain(timeout=0.01))
+        self.assertTrue(manager.drain(timeout=5))
+
+        self.assertTrue(all(job.status == JobStatus.COMPLETED for job in jobs))
+        with self.assertRaises(RuntimeError):
+            manager.add_job(SleepJob("late_job"))
+
+
+    def test_finished_jobs_are_evicted_to_the_store(self):
+        store = JobStore()
+        manager = JobManager(max_concurrent_jobs=2, store=store, retention_max_jobs=1)
+        jobs = [SleepJob(f"job{i}", delay=0.01 * (i + 1)) for i in range(3)]
+
+        run_jobs(manager, jobs)
+
+        self.assertEqual(list(manager.job_status), ["job2"])
+        self.assertEqual([job.released for job in jobs], [True, True, False])
+        stored_job = manager.get_job_status("job0")
+        self.assertIsInstance(stored_job, StoredJob)
+        self.assertEqual(stored_job.status, JobStatus.COMPLETED)
+        self.assertEqual(stored_job.result, {"job_id": "job0"})
+        self.assertEqual(list(stored_job.updates), list(jobs[0].updates))
+        self.assertTrue(stored_job.updates.is_done(stored_job.updates.last_sequence))
+
+    def test_updates_are_stored_off_the_publishing_thread(self):
+        class ThreadRecordingStore(JobStore):
+            def add_update(self, job_id, sequence, update):
+                writer_threads.add(threading.current_thread().name)
+                super().add_update(job_id, sequence, update)
+
+        writer_threads = set()
+        store = ThreadRecordingStore()
+        manager = JobManager(store=store)
+        job = SleepJob("job")
+        manager.add_job(job)
+        writer_threads.clear()
+
+        job.push_update("Generating...", partial="<html>", tokens=1)
+        job.push_update("Step completed.")
+        manager.store_writer.flush()
+
+        self.assertEqual(writer_threads, {"job-store-writer"})
+        self.assertEqual([update for _, update in store.get_updates("job")][-1], {"message": "Step completed."})
+        self.assertNotIn("partial", str(store.get_updates("job")))
+
+    def test_jobs_are_saved_off_the_job_loop(self):
+        class ThreadRecordingStore(JobStore):
+            def save(self, record):
+                saving_threads.add(threading.current_thread().name)
+                super().save(record)
+
+        saving_threads = set()
+        store = ThreadRecordingStore()
+        manager = JobManager(store=store)
+        job = SleepJob("job")
+        manager.add_job(job)
+        saving_threads.clear()
+
+        async def scenario():
+            manager.loop = asyncio.get_running_loop()
+            worker = asyncio.create_task(manager.worker_loop())
+            await asyncio.sleep(0)
+            manager.job_queue.put_nowait(job)
+            await manager.job_queue.join()
+            worker.cancel()
+
+        asyncio.run(scenario())
+
+        self.assertEqual(saving_threads, {"job-store-writer"})
+        self.assertEqual(store.get("job").status, "completed")
+
+    def test_recovers_unfinished_jobs(self):
+        store = JobStore()
+        store.save(JobRecord("queued", params={"delay": 0.01}))
+        store.save(JobRecord("running", status="processing", params={"delay": 0.01}))
+        store.save(JobRecord("not_recreatable", status="processing"))
+        manager = JobManager(store=store)
+
+        async def scenario():
+            manager.loop = asyncio.get_running_loop()
+            worker = asyncio.create_task(manager.worker_loop())
+            recovered = manager.recover_jobs(lambda record: SleepJob(record.job_id, delay=record.params["delay"]))
+            await asyncio.sleep(0)
+            await manager.job_queue.join()
+            worker.cancel()
+            return recovered
+
+        self.assertEqual(asyncio.run(scenario()), 2)
+        self.assertEqual(store.get("queued").status, "completed")
+        self.assertEqual(store.get("running").status, "completed")
+        self.assertEqual(store.get("not_recreatable").status, "error")
+        self.assertIn({"message": "Job resumed after a server restart"}, [update for _, update in store.get_updates("queued")])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
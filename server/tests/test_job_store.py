@@ -0,0 +1,47 @@
+import os
+import tempfile
+import time
+import unittest
+
+from server.job_store import JobRecord, JobStore, SqliteJobStore
+
+
+class TestJobStore(unittest.TestCase):
+
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.stores = [JobStore(), SqliteJobStore(os.path.join(self.folder.name, 'jobs.sqlite3'))]
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_round_trip(self):
+        for store in self.stores:
+            store.save(JobRecord("job1", "pipeline", params={"url": "https://example.com"}))
+            store.add_update("job1", 2, {"message": "second"})
+            store.add_update("job1", 1, {"message": "first"})
+            store.save(JobRecord("job1", "pipeline", status="completed", result={"url": "/generated/job1"}, finished_at=time.time()))
+
+            record = store.get("job1")
+            self.assertEqual(record.status, "completed")
+            self.assertEqual(record.result, {"url": "/generated/job1"})
+            self.assertEqual(store.get_updates("job1"), [(1, {"message": "first"}), (2, {"message": "second"})])
+            self.assertIsNone(store.get("missing"))
+
+    def test_unfinished_jobs_and_retention(self):
+        for store in self.stores:
+            store.save(JobRecord("queued", params={}, created_at=2))
+            store.save(JobRecord("running", status="processing", params={}, created_at=1))
+            store.save(JobRecord("old", status="completed", finished_at=time.time() - 100))
+            store.save(JobRecord("recent", status="error", finished_at=time.time()))
+            store.add_update("old", 1, {"message": "done"})
+
+            self.assertEqual([record.job_id for record in store.get_unfinished()], ["running", "queued"])
+            self.assertEqual(store.delete_finished_before(time.time() - 10), 1)
+            self.assertIsNone(store.get("old"))
+            self.assertEqual(store.get_updates("old"), [])
+            self.assertIsNotNone(store.get("recent"))
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
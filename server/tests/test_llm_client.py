@@ -0,0 +1,54 @@
+import asyncio
+import os
+import threading
+import unittest
+
+from openai.types.chat import ChatCompletionMessage
+from PIL import Image
+
+os.environ.setdefault('OPENAI_API_TYPE', 'openai')
+os.environ.setdefault('OPENAI_API_KEY', 'test')
+
+from server.shared.image import ImageHandle, ImagePolicy
+from server.shared.llm import AsyncLlmClient, Completion, llm_loop
+
+
+class TestAsyncLlmClient(unittest.TestCase):
+
+    def test_requests_are_prepared_off_the_llm_loop(self):
+        client = AsyncLlmClient(use_cache=False)
+        create_request = client._create_request
+        request_threads = []
+
+        def record_create_request(*args):
+            request_threads.append(threading.current_thread())
+            return create_request(*args)
+
+        async def create_completion(request_params, on_progress=None, call=None):
+            return Completion(ChatCompletionMessage(role="assistant", content="Hi!"), "stop", None)
+
+        client._create_request = record_create_request
+        client._create_completion = create_completion
+
+        self.assertEqual(asyncio.run(client.get_completions("Hello")), "Hi!")
+        self.assertEqual(len(request_threads), 1)
+        self.assertIsNot(request_threads[0], llm_loop.thread)
+
+    def test_cache_key_depends_on_the_image_and_its_policy(self):
+        client = AsyncLlmClient()
+        image = ImageHandle.from_image(Image.new('RGB', (64, 64), 'red'))
+        other_image = ImageHandle.from_image(Image.new('RGB', (64, 64), 'blue'))
+
+        def get_cache_key(images):
+            return client._prepare_request(True, "Describe the image", images, temperature=0.0)[1]
+
+        cache_key = get_cache_key([image])
+        self.assertEqual(get_cache_key([image.data]), cache_key)
+        self.assertNotEqual(get_cache_key([other_image]), cache_key)
+
+        client.image_policy = ImagePolicy(max_size=32)
+        self.assertNotEqual(get_cache_key([image]), cache_key)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
@@ -0,0 +1,153 @@
+import asyncio
+import unittest
+
+import openai
+
+from server.shared.llm_router import Deployment, DeploymentPool, Hedger
+
+
+class FakeRawResponse:
+    def __init__(self, content):
+        self.headers = {}
+        self.content = content
+
+    async def parse(self):
+        return self.content
+
+
+class FakeClient:
+    """Stands in for the chat.completions.with_raw_response API, answering with the given responses in turn."""
+
+    def __init__(self, *responses, delay=0.0):
+        self.responses = list(responses)
+        self.delay = delay
+        self.requests = []
+        self.chat = self
+        self.completions = self
+        self.with_raw_response = self
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        await asyncio.sleep(self.delay)
+        response = self.responses.pop(0)
+        if isinstance(response, Exception):
+            raise response
+        return FakeRawResponse(response)
+
+
+class FakeResponse:
+    def __init__(self, status_code, headers=None):
+        self.status_code = status_code
+        self.headers = headers or {}
+        self.request = None
+
+
+def create_error(error_class, status_code, headers=None):
+    return error_class('error', response=FakeResponse(status_code, headers), body=None)
+
+
+REQUEST = {"messages": [{"role": "user", "content": "Hello"}], "max_tokens": 10}
+
+
+class TestDeploymentPool(unittest.TestCase):
+    def test_rate_limited_requests_fail_over(self):
+        west = Deployment(FakeClient(create_error(openai.RateLimitError, 429, {'retry-after': '30'})), 'gpt-4o', endpoint='west')
+        east = Deployment(FakeClient('east', 'east'), 'gpt-4o-east', endpoint='east')
+        pool = DeploymentPool([west, east])
+
+        async def scenario():
+            return [await pool.send(REQUEST), await pool.send(REQUEST)]
+
+        self.assertEqual(asyncio.run(scenario()), ['east', 'east'])
+        self.assertFalse(west.is_healthy())
+        self.assertEqual(len(west.client.requests), 1)
+        self.assertEqual(east.client.requests[0]["model"], 'gpt-4o-east')
+
+    def test_errors_are_raised_when_no_deployment_is_left(self):
+        north = Deployment(FakeClient(create_error(openai.InternalServerError, 500)), 'gpt-4o', endpoint='north')
+        south = Deployment(FakeClient(create_error(openai.InternalServerError, 503)), 'gpt-4o', endpoint='south')
+        pool = DeploymentPool([north, south])
+
+        with self.assertRaises(openai.InternalServerError):
+            asyncio.run(pool.send(REQUEST))
+        self.assertEqual((north.failures, south.failures), (1, 1))
+
+    def test_rate_limited_request_is_sent_again_when_retried(self):
+        only = Deployment(FakeClient(create_error(openai.RateLimitError, 429), 'ok'), 'gpt-4o', endpoint='only')
+        pool = DeploymentPool([only])
+        tried = []
+
+        async def scenario():
+            with self.assertRaises(openai.RateLimitError):
+                await pool.send(REQUEST, tried=tried)
+            # The backoff retry of the same call shares its list of tried deployments
+            return await pool.send(REQUEST, tried=tried)
+
+        self.assertEqual(asyncio.run(scenario()), 'ok')
+        self.assertEqual(tried, [only, only])
+
+    def test_faster_deployments_get_more_requests(self):
+        slow = Deployment(FakeClient(*['slow'] * 10, delay=0.05), 'gpt-4o', endpoint='slow')
+        fast = Deployment(FakeClient(*['fast'] * 10, delay=0.01), 'gpt-4o', endpoint='fast')
+        pool = DeploymentPool([slow, fast])
+
+        async def scenario():
+            return [await pool.send(REQUEST) for _ in range(6)]
+
+        results = asyncio.run(scenario())
+
+        self.assertEqual(results.count('slow'), 1)
+        self.assertLess(fast.latency, slow.latency)
+
+
+class TestHedger(unittest.TestCase):
+    def test_slow_requests_are_hedged_and_the_loser_cancelled(self):
+        hedger = Hedger(percentile=90, budget_percent=100, delay=0.01)
+        cancelled = []
+
+        async def slow():
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append('slow')
+                raise
+            return 'slow'
+
+        async def fast():
+            return 'fast'
+
+        self.assertEqual(asyncio.run(hedger.run('gpt-4o', slow, fast)), 'fast')
+        self.assertEqual(cancelled, ['slow'])
+
+    def test_hedges_stay_within_the_budget(self):
+        hedger = Hedger(percentile=90, budget_percent=25, delay=0.0)
+        hedges = []
+
+        async def request():
+            await asyncio.sleep(0.001)
+            return 'request'
+
+        async def hedge_request():
+            hedges.append(1)
+            await asyncio.sleep(1)
+
+        async def scenario():
+            for _ in range(8):
+                await hedger.run('gpt-4o', request, hedge_request)
+
+        asyncio.run(scenario())
+
+        self.assertEqual(len(hedges), 2)
+
+    def test_delay_is_a_percentile_of_the_latencies(self):
+        hedger = Hedger(percentile=90, delay=5)
+        self.assertEqual(hedger.get_delay('gpt-4o'), 5)
+
+        for latency in range(100):
+            hedger.record_latency('gpt-4o', latency / 100)
+
+        self.assertEqual(hedger.get_delay('gpt-4o'), 0.9)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,288 @@
+import asyncio
+import functools
+import os
+import tempfile
+import time
+import unittest
+
+from server.generation_pipelines.pipeline_steps.process_uploaded_files import ProcessUploadedFilesStep
+from server.pipeline import Pipeline, ExecutionMode
+from server.shared.circuit_breaker import CircuitOpenError, get_circuit_breaker
+from server.step_result_cache import StepResultCache
+
+STEPS_FOLDER = "server/generation_pipelines/pipeline_steps/internal"
+PIPELINES_FOLDER = "server/generation_pipelines/pipelines/internal"
+
+
+def create_pipeline(definition, initial_params=None, execution_mode=None, result_cache=None, checkpoint_folder=None):
+    return Pipeline(
+        job_id="test",
+        definition=definition,
+        steps_folder=STEPS_FOLDER,
+        pipelines_folder=PIPELINES_FOLDER,
+        initial_params=initial_params or {},
+        execution_mode=execution_mode,
+        result_cache=result_cache or StepResultCache(folder=None),
+        checkpoint_folder=checkpoint_folder
+    )
+
+
+class TestPipeline(unittest.TestCase):
+
+    def setUp(self):
+        self.definition = {
+            "id": "test_pipeline",
+            "inputs": {"a": 10, "b": 5, "c": 2},
+            "outputs": {"product": "multiply.result", "quotient": "slow_division.result"},
+            "steps": [
+                {"id": "slow_division", "type": "division_step", "inputs": {"a": "inputs.a", "b": "inputs.b"}},
+                {"id": "add", "type": "addition_step", "inputs": {"a": "inputs.a", "b": "inputs.b"}},
+                {"id": "multiply", "type": "multiplication_step", "inputs": {"a": "add.result", "b": "inputs.c"}}
+            ]
+        }
+
+    def test_reverse_dependencies(self):
+        pipeline = create_pipeline(self.definition)
+
+        self.assertEqual(pipeline.step_dependents["add"], ["multiply"])
+        self.assertEqual(pipeline.step_dependents["slow_division"], [])
+        self.assertEqual(pipeline.step_dependents["multiply"], [])
+
+    def test_dependent_step_does_not_wait_for_unrelated_slow_step(self):
+        pipeline = create_pipeline(self.definition)
+        completion_order = []
+        run_step = pipeline.run_step
+
+        def run_step_with_delay(step_id, initial_params=None):
+            if step_id == "slow_division":
+                time.sleep(0.3)
+            run_step(step_id, initial_params)
+            completion_order.append(step_id)
+
+        pipeline.run_step = run_step_with_delay
+
+        output = asyncio.run(pipeline.run())
+
+        self.assertEqual(output, {"product": 30, "quotient": 2})
+        self.assertEqual(completion_order, ["add", "multiply", "slow_division"])
+
+    def test_asyncio_mode_awaits_async_steps_on_the_job_loop(self):
+        pipeline = create_pipeline(self.definition, execution_mode=ExecutionMode.ASYNCIO)
+        step_loops = []
+
+        for step in pipeline.step_instances.values():
+            process = step.process
+
+            @functools.wraps(process)
+            async def process_on_loop(*args, _process=process, **kwargs):
+                step_loops.append(asyncio.get_running_loop())
+                return await _process(*args, **kwargs)
+
+            step.process = process_on_loop
+
+        async def run():
+            output = await pipeline.run()
+            return output, asyncio.get_running_loop()
+
+        output, job_loop = asyncio.run(run())
+
+        self.assertEqual(output, {"product": 30, "quotient": 2})
+        self.assertEqual(len(step_loops), 3)
+        self.assertTrue(all(loop is job_loop for loop in step_loops))
+
+    def test_step_results_are_reused_from_cache(self):
+        result_cache = StepResultCache(folder=None)
+        self.definition["steps"][0]["cache"] = False
+
+        asyncio.run(create_pipeline(self.definition, result_cache=result_cache).run())
+        pipeline = create_pipeline(self.definition, result_cache=result_cache)
+        output = asyncio.run(pipeline.run())
+
+        cache_updates = {update["step"]: update["cache"] for update in pipeline.updates if "cache" in update}
+        self.assertEqual(output, {"product": 30, "quotient": 2})
+        self.assertEqual(cache_updates, {"add": "hit", "multiply": "hit"})
+
+    def test_cached_step_results_expire(self):
+        result_cache = StepResultCache(folder=None, ttl=0.05)
+
+        asyncio.run(create_pipeline(self.definition, result_cache=result_cache).run())
+        time.sleep(0.1)
+        pipeline = create_pipeline(self.definition, result_cache=result_cache)
+        asyncio.run(pipeline.run())
+
+        cache_updates = {update["step"]: update["cache"] for update in pipeline.updates if "cache" in update}
+        self.assertEqual(cache_updates["add"], "miss")
+
+    def test_cache_key_depends_on_inputs(self):
+        result_cache = StepResultCache(folder=None)
+
+        asyncio.run(create_pipeline(self.definition, result_cache=result_cache).run())
+        pipeline = create_pipeline(self.definition, initial_params={"c": 3}, result_cache=result_cache)
+        output = asyncio.run(pipeline.run())
+
+        cache_updates = {update["step"]: update["cache"] for update in pipeline.updates if "cache" in update}
+        self.assertEqual(output["product"], 45)
+        self.assertEqual(cache_updates["add"], "hit")
+        self.assertEqual(cache_updates["multiply"], "miss")
+
+    def test_cache_key_of_uploaded_files_depends_on_their_contents(self):
+        pipeline = create_pipeline(self.definition)
+        step = ProcessUploadedFilesStep(pipeline=pipeline)
+
+        with tempfile.TemporaryDirectory() as folder:
+            file_path = os.path.join(folder, "notes.txt")
+            with open(file_path, "w") as file:
+                file.write("First upload")
+            first_key = pipeline._get_cache_key("process_files", step, {"uploaded_files": [file_path]})
+
+            # A new upload with the same name overwrites the file
+            with open(file_path, "w") as file:
+                file.write("Second upload")
+            second_key = pipeline._get_cache_key("process_files", step, {"uploaded_files": [file_path]})
+
+        self.assertIsNotNone(first_key)
+        self.assertNotEqual(first_key, second_key)
+
+    def test_failed_run_resumes_from_checkpoints(self):
+        definition = {
+            "id": "test_pipeline",
+            "inputs": {"a": 10, "b": 5, "c": 2},
+            "outputs": {"product": "multiply.result"},
+            "steps": [
+                {"id": "add", "type": "addition_step", "inputs": {"a": "inputs.a", "b": "inputs.b"}},
+                {"id": "divide", "type": "division_step", "inputs": {"a": "add.result", "b": "inputs.c"}},
+                {"id": "multiply", "type": "multiplication_step", "inputs": {"a": "divide.result", "b": "inputs.c"}}
+            ]
+        }
+
+        with tempfile.TemporaryDirectory() as folder:
+            checkpoint_folder = os.path.join(folder, "checkpoints")
+            with self.assertRaises(ValueError):
+                asyncio.run(create_pipeline(definition, initial_params={"c": 0}, checkpoint_folder=checkpoint_folder).run())
+            self.assertEqual(os.listdir(checkpoint_folder), ["add.pkl.z"])
+
+            pipeline = create_pipeline(definition, initial_params={"c": 5}, checkpoint_folder=checkpoint_folder)
+            output = asyncio.run(pipeline.run())
+
+            messages = [update["message"] for update in pipeline.updates]
+            self.assertEqual(output, {"product": 15})
+            self.assertIn("Step 'Addition' restored from its checkpoint.", messages)
+            self.assertNotIn("Step 'Addition' completed.", messages)
+            self.assertFalse(os.path.exists(checkpoint_folder))
+
+
+    def test_failed_step_is_retried(self):
+        self.definition["steps"][1]["retry"] = {"max_attempts": 3, "backoff": 0}
+        pipeline = create_pipeline(self.definition)
+        step = pipeline.step_instances["add"]
+        process = step.process
+        attempts = []
+
+        @functools.wraps(process)
+        async def flaky_process(*args, **kwargs):
+            attempts.append(1)
+            if len(attempts) < 3:
+                raise ConnectionError("Upstream error")
+            return await process(*args, **kwargs)
+
+        step.process = flaky_process
+        output = asyncio.run(pipeline.run())
+
+        self.assertEqual(output, {"product": 30, "quotient": 2})
+        self.assertEqual(len(attempts), 3)
+
+    def test_step_times_out(self):
+        self.definition["steps"][1]["timeout"] = 0.1
+        pipeline = create_pipeline(self.definition, execution_mode=ExecutionMode.ASYNCIO)
+
+        async def hung_process(a: int, b: int):
+            await asyncio.sleep(10)
+
+        pipeline.step_instances["add"].process = hung_process
+
+        started_at = time.monotonic()
+        with self.assertRaises(TimeoutError):
+            asyncio.run(pipeline.run())
+        self.assertLess(time.monotonic() - started_at, 5)
+
+    def test_sync_step_is_not_retried_while_its_timed_out_attempt_runs(self):
+        self.definition["steps"][1].update({"timeout": 0.1, "retry": {"max_attempts": 3, "backoff": 0}})
+        pipeline = create_pipeline(self.definition)
+        attempts = []
+
+        def hung_process(a: int, b: int):
+            attempts.append(1)
+            time.sleep(0.5)
+
+        pipeline.step_instances["add"].process = hung_process
+
+        with self.assertRaises(TimeoutError):
+            asyncio.run(pipeline.run())
+        self.assertEqual(len(attempts), 1)
+
+    def test_failed_run_does_not_wait_for_running_sync_steps(self):
+        pipeline = create_pipeline(self.definition)
+        run_step = pipeline.run_step
+
+        def run_step_with_failure(step_id, initial_params=None):
+            if step_id == "add":
+                raise ConnectionError("Upstream error")
+            time.sleep(0.5)
+            run_step(step_id, initial_params)
+
+        pipeline.run_step = run_step_with_failure
+
+        async def run():
+            started_at = time.monotonic()
+            with self.assertRaises(ConnectionError):
+                await pipeline.run()
+            return time.monotonic() - started_at
+
+        self.assertLess(asyncio.run(run()), 0.4)
+
+    def test_failed_step_is_skipped_with_its_dependents(self):
+        self.definition["steps"][1]["on_error"] = "skip"
+        pipeline = create_pipeline(self.definition)
+
+        async def failing_process(a: int, b: int):
+            raise ConnectionError("Upstream error")
+
+        pipeline.step_instances["add"].process = failing_process
+        output = asyncio.run(pipeline.run())
+
+        self.assertEqual(output, {"product": None, "quotient": 2})
+        self.assertEqual(pipeline.skipped_steps, {"add", "multiply"})
+
+    def test_failed_step_completes_with_its_fallback(self):
+        self.definition["steps"][2]["on_error"] = {"fallback": {"result": 0}}
+        pipeline = create_pipeline(self.definition)
+
+        async def failing_process(a: int, b: int):
+            raise ConnectionError("Upstream error")
+
+        pipeline.step_instances["multiply"].process = failing_process
+        output = asyncio.run(pipeline.run())
+
+        self.assertEqual(output, {"product": 0, "quotient": 2})
+
+    def test_open_circuit_fails_the_step_without_retries(self):
+        self.definition["steps"][1].update({"circuit_breaker": "test_pipeline_upstream", "retry": {"max_attempts": 3, "backoff": 0}})
+        circuit_breaker = get_circuit_breaker("test_pipeline_upstream")
+        for _ in range(circuit_breaker.failure_threshold):
+            circuit_breaker.record_failure()
+        pipeline = create_pipeline(self.definition)
+
+        with self.assertRaises(CircuitOpenError):
+            asyncio.run(pipeline.run())
+        messages = [update["message"] for update in pipeline.updates]
+        self.assertFalse(any("retrying" in message for message in messages))
+
+    def test_invalid_step_policy_is_rejected(self):
+        self.definition["steps"][1]["on_error"] = "ignore"
+
+        with self.assertRaises(ValueError):
+            create_pipeline(self.definition)
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
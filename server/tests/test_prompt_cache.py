@@ -0,0 +1,50 @@
+import os
+import tempfile
+import unittest
+
+from server.shared.prompt_cache import PromptCache
+
+
+class TestPromptCache(unittest.TestCase):
+    def setUp(self):
+        self.folder = tempfile.TemporaryDirectory()
+        self.path = os.path.join(self.folder.name, 'llm.sqlite3')
+
+    def tearDown(self):
+        self.folder.cleanup()
+
+    def test_hits_and_misses_are_counted(self):
+        cache = PromptCache(path=self.path)
+        key = cache.make_key({"model": "gpt-4o", "messages": [{"role": "user", "content": "Hello"}], "temperature": 0.0})
+
+        self.assertIsNone(cache.get(key))
+        cache.put(key, "Hi!")
+        self.assertEqual(cache.get(key), "Hi!")
+        self.assertEqual(cache.stats(), {"hits": 1, "misses": 1, "bypasses": 0, "hit_rate": 0.5})
+
+    def test_images_are_keyed_by_their_image_keys(self):
+        def make_key(data_url, digest):
+            content = [{"type": "text", "text": "Describe"}, {"type": "image_url", "image_url": {"url": data_url}}]
+            return PromptCache.make_key({"model": "gpt-4o", "messages": [{"role": "user", "content": content}]}, [{"digest": digest}])
+
+        self.assertEqual(make_key("data:image/png;base64,AAAA", "a"), make_key("data:image/jpeg;base64,BBBB", "a"))
+        self.assertNotEqual(make_key("data:image/png;base64,AAAA", "a"), make_key("data:image/png;base64,AAAA", "b"))
+
+    def test_least_recently_used_responses_are_evicted(self):
+        cache = PromptCache(path=self.path, max_bytes=10)
+        cache.put("a", "1234")
+        cache.put("b", "5678")
+        cache.get("a")
+        cache.put("c", "9012")
+
+        self.assertEqual(cache.get("a"), "1234")
+        self.assertIsNone(cache.get("b"))
+        self.assertEqual(cache.get("c"), "9012")
+
+    def test_responses_persist_across_instances(self):
+        PromptCache(path=self.path).put("a", "1234")
+        self.assertEqual(PromptCache(path=self.path).get("a"), "1234")
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,60 @@
+import asyncio
+import time
+import unittest
+
+from server.shared.rate_limiter import Priority, RateLimiter, TokenBucket, estimate_request_tokens
+
+
+class TestRateLimiter(unittest.TestCase):
+    def test_requests_are_queued_by_priority_and_fairly_between_flows(self):
+        order = []
+
+        async def request(limiter, name, flow, priority=Priority.NORMAL):
+            await limiter.acquire(10, priority, flow)
+            order.append(name)
+
+        async def scenario():
+            limiter = RateLimiter('gpt-4o')
+            limiter.paused_until = time.monotonic() + 0.05
+            await asyncio.gather(
+                request(limiter, 'a1', 'job-a'),
+                request(limiter, 'a2', 'job-a'),
+                request(limiter, 'a3', 'job-a'),
+                request(limiter, 'b1', 'job-b'),
+                request(limiter, 'copilot', None, Priority.INTERACTIVE),
+            )
+
+        asyncio.run(scenario())
+
+        self.assertEqual(order, ['copilot', 'a1', 'b1', 'a2', 'a3'])
+
+    def test_budgets_adapt_to_rate_limit_headers(self):
+        limiter = RateLimiter('gpt-4o')
+        self.assertEqual(limiter.tokens.wait_time(1000), 0)
+
+        limiter.update({'x-ratelimit-limit-tokens': '600', 'x-ratelimit-remaining-tokens': '0'})
+
+        self.assertAlmostEqual(limiter.tokens.wait_time(10), 1.0, places=1)
+
+    def test_limit_is_estimated_from_remaining_headers_only(self):
+        bucket = TokenBucket()
+        bucket.update(remaining=120)
+        bucket.update(remaining=60)
+
+        self.assertEqual(bucket.limit, 120)
+        self.assertAlmostEqual(bucket.wait_time(62), 1.0, places=1)
+
+    def test_estimate_includes_images_and_max_tokens(self):
+        request_params = {
+            "messages": [{"role": "user", "content": [
+                {"type": "text", "text": "x" * 400},
+                {"type": "image_url", "image_url": {"url": "data:image/png;base64,"}},
+            ]}],
+            "max_tokens": 500,
+        }
+
+        self.assertEqual(estimate_request_tokens(request_params), 100 + 1000 + 500)
+
+
+if __name__ == '__main__':
+    unittest.main()
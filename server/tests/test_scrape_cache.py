@@ -0,0 +1,128 @@
+import asyncio
+import os
+import tempfile
+import time
+import unittest
+
+from server.shared.cache import MISSING
+from server.shared.scrape_cache import ScrapeCache
+from server.shared.scraper import PageSnapshot, WebScraper
+
+
+class FakePage:
+    def __init__(self, html):
+        self.html = html
+
+    async def goto(self, url):
+        return None
+
+    async def wait_for_load_state(self, state):
+        pass
+
+    def locator(self, selector):
+        return self
+
+    async def inner_html(self):
+        return self.html
+
+
+class FakeLease:
+    def __init__(self, page):
+        self.page = page
+
+
+class FakePool:
+    def __init__(self, html):
+        self.html = html
+        self.pages_opened = 0
+
+    async def open_page(self, viewport=None):
+        self.pages_opened += 1
+        return FakeLease(FakePage(self.html))
+
+    async def close_page(self, lease):
+        pass
+
+    async def call(self, coro):
+        return await coro
+
+
+class RevalidatingScrapeCache(ScrapeCache):
+    def __init__(self, unchanged, **kwargs):
+        super().__init__(folder=None, revalidate=True, **kwargs)
+        self.unchanged = unchanged
+        self.revalidations = 0
+
+    def is_unchanged(self, url, entry):
+        self.revalidations += 1
+        return self.unchanged
+
+
+def get_html(pool, cache, bypass_cache=False):
+    async def scenario():
+        async with PageSnapshot(pool, 'https://example.com', cache=cache, bypass_cache=bypass_cache) as snapshot:
+            return await snapshot.html()
+
+    return asyncio.run(scenario())
+
+
+class TestScrapeCache(unittest.TestCase):
+    def test_cached_artifacts_skip_the_browser(self):
+        pool = FakePool('<p>Hello</p>')
+        cache = ScrapeCache(folder=None)
+
+        self.assertEqual(get_html(pool, cache), '<p>Hello</p>')
+        self.assertEqual(get_html(pool, cache), '<p>Hello</p>')
+        self.assertEqual(pool.pages_opened, 1)
+
+        get_html(pool, cache, bypass_cache=True)
+        self.assertEqual(pool.pages_opened, 2)
+
+    def test_scraper_methods_can_bypass_the_cache(self):
+        scraper = WebScraper(use_cache=True, cache=ScrapeCache(folder=None))
+        scraper.pool = FakePool('<p>Hello</p>')
+
+        asyncio.run(scraper.get_html('https://example.com'))
+        asyncio.run(scraper.get_html('https://example.com'))
+        self.assertEqual(scraper.pool.pages_opened, 1)
+
+        scraper.pool.html = '<p>Edited</p>'
+        self.assertEqual(asyncio.run(scraper.get_html('https://example.com', bypass_cache=True)), '<p>Edited</p>')
+        self.assertEqual(scraper.pool.pages_opened, 2)
+
+    def test_expired_entries_are_revalidated(self):
+        cache = RevalidatingScrapeCache(unchanged=True, ttl=0)
+        key = cache.make_key('https://example.com', 'html', ['body'])
+        cache.put(key, '<p>Hello</p>', {'etag': '"abc"'})
+        cache.get_entry(key).stored_at -= 10
+
+        revalidated = {}
+        self.assertEqual(cache.get(key, 'https://example.com', revalidated), '<p>Hello</p>')
+        self.assertEqual(revalidated, {('"abc"', None): True})
+
+        cache.unchanged = False
+        cache.get_entry(key).stored_at -= 10
+        self.assertIs(cache.get(key, 'https://example.com'), MISSING)
+
+    def test_expired_entries_without_validators_miss(self):
+        cache = RevalidatingScrapeCache(unchanged=True, ttl=0)
+        key = cache.make_key('https://example.com', 'html', ['body'])
+        cache.put(key, '<p>Hello</p>')
+        cache.get_entry(key).stored_at -= 10
+
+        self.assertIs(cache.get(key, 'https://example.com'), MISSING)
+        self.assertEqual(cache.revalidations, 0)
+
+
+    def test_disk_entries_expire(self):
+        with tempfile.TemporaryDirectory() as folder:
+            cache = ScrapeCache(folder=folder, disk_ttl=60)
+            key = cache.make_key('https://example.com', 'html', ['body'])
+            cache.put(key, '<p>Hello</p>')
+            os.utime(cache.disk._path(key), (time.time() - 120, time.time() - 120))
+
+            self.assertIsNone(ScrapeCache(folder=folder, disk_ttl=60).get_entry(key))
+            self.assertFalse(os.path.exists(cache.disk._path(key)))
+
+if __name__ == '__main__':
+    unittest.main()
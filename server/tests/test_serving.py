@@ -0,0 +1,58 @@
+import asyncio
+import unittest
+
+from server.shared.serving import AsgiApp
+
+
+def run_lifespan(app, messages):
+    sent = []
+
+    async def scenario():
+        queue = asyncio.Queue()
+        for message in messages:
+            queue.put_nowait({"type": message})
+
+        async def send(message):
+            sent.append(message["type"])
+
+        await app({"type": "lifespan"}, queue.get, send)
+
+    asyncio.run(scenario())
+    return sent
+
+
+class TestAsgiApp(unittest.TestCase):
+
+    def test_runs_callbacks_on_lifespan_events(self):
+        calls = []
+
+        async def start():
+            calls.append("start")
+
+        app = AsgiApp(None, on_startup=[start], on_shutdown=[lambda: calls.append("stop")])
+        sent = run_lifespan(app, ["lifespan.startup", "lifespan.shutdown"])
+
+        self.assertEqual(calls, ["start", "stop"])
+        self.assertEqual(sent, ["lifespan.startup.complete", "lifespan.shutdown.complete"])
+
+    def test_reports_failed_startup(self):
+        def start():
+            raise RuntimeError("no browser")
+
+        sent = run_lifespan(AsgiApp(None, on_startup=[start]), ["lifespan.startup"])
+
+        self.assertEqual(sent, ["lifespan.startup.failed"])
+
+    def test_passes_requests_to_the_app(self):
+        scopes = []
+
+        async def app(scope, receive, send):
+            scopes.append(scope["type"])
+
+        asyncio.run(AsgiApp(app)({"type": "http"}, None, None))
+
+        self.assertEqual(scopes, ["http"])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
@@ -0,0 +1,65 @@
+import unittest
+
+from server.shared.telemetry import Telemetry, LlmCall, RequestTimings, llm_call, record_llm_request, telemetry_scope, current_scope
+
+
+class Usage:
+    prompt_tokens = 100
+    completion_tokens = 20
+
+
+class TestTelemetry(unittest.TestCase):
+    def test_llm_calls_are_aggregated_per_step_and_job(self):
+        telemetry = Telemetry()
+        with telemetry_scope(job_id='job-1', pipeline='data_model_pipeline'):
+            with telemetry_scope(step='generate_page_data_model'):
+                call = LlmCall('gpt-4o', current_scope())
+        call.add_usage(Usage())
+        call.retries = 2
+
+        telemetry.record_llm_call(call, 1.5)
+        telemetry.record_llm_call(call, 0.5)
+        metrics = telemetry.render()
+
+        labels = 'model="gpt-4o",pipeline="data_model_pipeline",step="generate_page_data_model",strategy=""'
+        self.assertIn('# TYPE llm_requests_total counter', metrics)
+        self.assertIn(f'llm_requests_total{{{labels}}} 2', metrics)
+        self.assertIn(f'llm_prompt_tokens_total{{{labels}}} 200', metrics)
+        self.assertIn(f'llm_retries_total{{{labels}}} 4', metrics)
+        self.assertIn(f'llm_request_duration_seconds_sum{{{labels}}} 2', metrics)
+        self.assertIn(f'llm_request_duration_seconds_count{{{labels}}} 2', metrics)
+        self.assertIn('# TYPE job_llm_requests_total counter', metrics)
+        self.assertIn(f'job_llm_requests_total{{job_id="job-1",{labels}}} 2', metrics)
+        self.assertNotIn('\nllm_requests_total{job_id=', metrics)
+
+    def test_only_recent_jobs_are_kept(self):
+        telemetry = Telemetry(max_jobs=1)
+        telemetry.record_step(1.0, {'job_id': 'job-1', 'step': 'add'})
+        telemetry.record_step(2.0, {'job_id': 'job-2', 'step': 'add'})
+        metrics = telemetry.render()
+
+        self.assertNotIn('job_id="job-1"', metrics)
+        self.assertIn('job_pipeline_step_duration_seconds_sum{job_id="job-2",pipeline="",step="add",strategy=""} 2', metrics)
+        self.assertIn('\npipeline_step_duration_seconds_count{pipeline="",step="add",strategy=""} 2', metrics)
+
+
+class TestRequestTimings(unittest.TestCase):
+    def test_llm_calls_are_added_to_the_request_timings(self):
+        timings = RequestTimings()
+        with timings.measure('parse', 'Parsing the request'):
+            pass
+        with telemetry_scope(timings=timings):
+            with llm_call('gpt-4o'):
+                record_llm_request(0.25, 1.0)
+
+        header = timings.header()
+
+        self.assertTrue(header.startswith('parse;dur='))
+        self.assertIn(';desc="Parsing the request"', header)
+        self.assertIn('llm_queue;dur=250.0;desc="Waiting for the LLM rate limits"', header)
+        self.assertIn('llm_upstream;dur=1000.0;', header)
+        self.assertIn(', total;dur=', header)
+
+
+if __name__ == '__main__':
+    unittest.main()
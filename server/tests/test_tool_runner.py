@@ -0,0 +1,112 @@
+import asyncio
+import os
+import threading
+import time
+import unittest
+
+from openai.types.chat import ChatCompletionMessageToolCall
+from openai.types.chat.chat_completion_message_tool_call import Function
+
+os.environ.setdefault('OPENAI_API_TYPE', 'openai')
+
+from server.shared.llm import ToolRunner
+
+
+def create_tool_call(name, arguments, call_id="call_1"):
+    return ChatCompletionMessageToolCall(id=call_id, type="function", function=Function(name=name, arguments=arguments))
+
+
+class TestToolRunner(unittest.TestCase):
+
+    def test_timed_out_sync_tools_hold_their_concurrency_permit(self):
+        running = []
+        max_running = []
+        lock = threading.Lock()
+
+        def render_image(prompt):
+            """
+            description: Render an image.
+            parameters:
+              prompt:
+                type: string
+                description: The prompt.
+            timeout: 0.05
+            max_concurrency: 1
+            """
+            with lock:
+                running.append(prompt)
+                max_running.append(len(running))
+            time.sleep(0.2)
+            with lock:
+                running.remove(prompt)
+            return prompt
+
+        runner = ToolRunner([render_image])
+        tool_calls = [create_tool_call("render_image", f'{{"prompt": "image {i}"}}', f"call_{i}") for i in range(2)]
+
+        messages = asyncio.run(runner.run(tool_calls))
+        time.sleep(0.25)
+
+        self.assertEqual(max(max_running), 1)
+        self.assertEqual([message["content"] for message in messages], ["Tool render_image timed out after 0.05 seconds"] * 2)
+
+    def test_async_tools_are_cancelled_on_timeout(self):
+        cancelled = []
+
+        async def search(query):
+            """
+            description: Search.
+            parameters:
+              query:
+                type: string
+                description: The query.
+            timeout: 0.05
+            """
+            try:
+                await asyncio.sleep(1)
+            except asyncio.CancelledError:
+                cancelled.append(query)
+                raise
+
+        runner = ToolRunner([search])
+
+        messages = asyncio.run(runner.run([create_tool_call("search", '{"query": "cats"}')]))
+
+        self.assertEqual(messages[0]["content"], "Tool search timed out after 0.05 seconds")
+        self.assertEqual(cancelled, ["cats"])
+
+    def test_unknown_tools_and_malformed_arguments(self):
+        calls = []
+
+        def add_numbers(a, b):
+            """
+            description: Add two numbers.
+            parameters:
+              a:
+                type: number
+                description: The first number.
+              b:
+                type: number
+                description: The second number.
+            """
+            calls.append((a, b))
+            return a + b
+
+        runner = ToolRunner([add_numbers])
+        tool_calls = [
+            create_tool_call("subtract_numbers", '{"a": 1, "b": 2}', "call_1"),
+            create_tool_call("add_numbers", '{"a": 1, "b":', "call_2"),
+            create_tool_call("add_numbers", '{"a": 1, "b": 2}', "call_3"),
+        ]
+
+        messages = asyncio.run(runner.run(tool_calls))
+
+        self.assertEqual([message["tool_call_id"] for message in messages], ["call_1", "call_2", "call_3"])
+        self.assertEqual(messages[0]["content"], "Unknown tool: subtract_numbers")
+        self.assertIn("Expecting value", messages[1]["content"])
+        self.assertEqual(messages[2]["content"], "3")
+        self.assertEqual(calls, [(1, 2)])
+
+
+if __name__ == '__main__':
+    unittest.main(verbosity=0)
@@ -0,0 +1,67 @@
+import asyncio
+import threading
+import time
+import unittest
+
+from server.update_bus import UpdateBus
+
+
+class TestUpdateBus(unittest.TestCase):
+    def test_subscribers_read_independently_and_replay_from_a_sequence_number(self):
+        bus = UpdateBus()
+        for index in range(5):
+            bus.publish({'message': f'update {index}'})
+
+        self.assertEqual([sequence for sequence, _ in bus.since(0)], [1, 2, 3, 4, 5])
+        self.assertEqual(bus.since(3), [(4, {'message': 'update 3'}), (5, {'message': 'update 4'})])
+        self.assertEqual(len(bus.since(0)), 5)
+        self.assertEqual(bus.since(5), [])
+
+    def test_only_the_most_recent_updates_are_kept(self):
+        bus = UpdateBus(max_size=3)
+        for index in range(10):
+            bus.publish({'message': f'update {index}'})
+
+        self.assertEqual([sequence for sequence, _ in bus.since(2)], [8, 9, 10])
+        self.assertEqual([sequence for sequence, _ in bus.since(8)], [9, 10])
+
+    def test_waiting_threads_are_woken_up_by_updates_and_close(self):
+        bus = UpdateBus()
+        received = []
+
+        def subscribe():
+            sequence = 0
+            while not bus.is_done(sequence):
+                entries = bus.wait(sequence, timeout=5)
+                received.extend(update['message'] for _, update in entries)
+                sequence = entries[-1][0] if entries else sequence
+
+        subscribers = [threading.Thread(target=subscribe) for _ in range(2)]
+        for subscriber in subscribers:
+            subscriber.start()
+        bus.publish({'message': 'started'})
+        time.sleep(0.01)
+        bus.publish({'message': 'completed'})
+        bus.close()
+        for subscriber in subscribers:
+            subscriber.join(timeout=1)
+
+        self.assertEqual(sorted(received), ['completed', 'completed', 'started', 'started'])
+
+    def test_waiting_coroutines_are_woken_up_from_other_threads(self):
+        bus = UpdateBus()
+
+        async def scenario():
+            threading.Timer(0.01, bus.publish, args=({'message': 'done'},)).start()
+            return await bus.wait_async(0, timeout=5)
+
+        started_at = time.monotonic()
+        entries = asyncio.run(scenario())
+
+        self.assertEqual(entries, [(1, {'message': 'done'})])
+        self.assertLess(time.monotonic() - started_at, 1)
+        self.assertEqual(bus.async_waiters, set())
+
+
+if __name__ == '__main__':
+    unittest.main()
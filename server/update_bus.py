@@ -0,0 +1,100 @@
+import asyncio
+import itertools
+import os
+import threading
+from collections import deque
+
+# Number of recent updates kept per job for clients that (re)connect late
+JOB_UPDATES_BUFFER_SIZE = int(os.getenv('JOB_UPDATES_BUFFER_SIZE', 1000))
+
+
+class UpdateBus:
+    """
+    The updates of a job, numbered with increasing sequence numbers and kept in a bounded ring buffer.
+
+    Any number of subscribers read the updates after the last sequence number they have seen, so they don't
+    consume each other's updates, and a client that reconnects can resume from its Last-Event-ID. Waiting
+    subscribers are woken up by a condition variable (threads) or an event on their loop (asyncio) when an
+    update is published or the bus is closed, so an idle subscriber costs nothing.
+    """
+
+    def __init__(self, max_size=JOB_UPDATES_BUFFER_SIZE):
+        self.buffer = deque(maxlen=max_size)
+        self.last_sequence = 0
+        self.closed = False
+        self.condition = threading.Condition()
+        self.async_waiters = set()
+        self.listeners = []
+
+    def publish(self, update):
+        """Add an update and wake up the subscribers; returns its sequence number."""
+        with self.condition:
+            self.last_sequence += 1
+            sequence = self.last_sequence
+            self.buffer.append((sequence, update))
+            self._notify()
+        for listener in self.listeners:
+            listener(sequence, update)
+        return sequence
+
+    # Lets the bus stand in for a queue.Queue, e.g. as the status queue of a generation strategy
+    put = publish
+
+    def add_listener(self, listener):
+        """Call listener(sequence, update) for every update published from now on, e.g. to persist them."""
+        self.listeners.append(listener)
+
+    def close(self):
+        """Mark the end of the updates, e.g. when the job has finished."""
+        with self.condition:
+            self.closed = True
+            self._notify()
+
+    def _notify(self):
+        self.condition.notify_all()
+        for loop, event in list(self.async_waiters):
+            loop.call_soon_threadsafe(event.set)
+
+    def since(self, sequence=0):
+        """Return the (sequence number, update) pairs after the sequence number that are still in the buffer."""
+        with self.condition:
+            if sequence >= self.last_sequence:
+                return []
+            # The buffer holds consecutive sequence numbers, so the first update to return is found by its offset
+            skip = max(0, len(self.buffer) - (self.last_sequence - sequence))
+            return list(itertools.islice(self.buffer, skip, None))
+
+    def is_done(self, sequence):
+        """Whether a subscriber that has seen the updates up to the sequence number has seen them all."""
+        with self.condition:
+            return self.closed and sequence >= self.last_sequence
+
+    def wait(self, sequence=0, timeout=None):
+        """Block until there are updates after the sequence number (or the bus is closed) and return them."""
+        with self.condition:
+            self.condition.wait_for(lambda: self.last_sequence > sequence or self.closed, timeout)
+        return self.since(sequence)
+
+    async def wait_async(self, sequence=0, timeout=None):
+        """Like wait(), for subscribers on an event loop."""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self.condition:
+            if self.last_sequence > sequence or self.closed:
+                return self.since(sequence)
+            self.async_waiters.add(waiter)
+        try:
+            await asyncio.wait_for(event.wait(), timeout)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            with self.condition:
+                self.async_waiters.discard(waiter)
+        return self.since(sequence)
+
+    def __iter__(self):
+        return iter([update for _, update in self.since(0)])
+
+    def __len__(self):
+        with self.condition:
+            return len(self.buffer)
@@ -1,18 +1,25 @@
 import faulthandler
 import json
+import shutil
 import signal
 import threading
-import time
 
-from flask import Flask, jsonify, request, Response, Blueprint, send_from_directory
+from aioflask import Flask
+from flask import jsonify, request, Response, Blueprint, send_from_directory
 import os
 
 from flask_cors import CORS
+from greenletio import await_
 
+from server.checkpoint_store import CHECKPOINTS_FOLDER_NAME
 from server.job_manager import JobManager, JobStatus
+from server.job_store import create_job_store
 from server.pipeline import Pipeline
 from server.pipeline_metadata_extractor import PipelineStepsMetadataExtractor
+from server.shared.browser_pool import warm_up_browser_pool
 from server.shared.file_utils import handle_file_upload
+from server.shared.serving import AsgiApp, SERVER_SHUTDOWN_TIMEOUT, serve
+from server.shared.telemetry import telemetry
 
 PIPELINE_FOLDER_PATH = "server/generation_pipelines/pipelines"
 PIPELINE_STEP_FOLDER_PATH = "server/generation_pipelines/pipeline_steps"
@@ -20,6 +27,10 @@ PIPELINE_STEP_FOLDER_PATH = "server/generation_pipelines/pipeline_steps"
 UPLOAD_FOLDER = 'uploads'
 GENERATED_FOLDER = 'generated'
 
+MAX_CONCURRENT_JOBS = int(os.getenv('MAX_CONCURRENT_JOBS', 4))
+# Seconds between keep-alive comments on idle job status streams
+SSE_KEEP_ALIVE_INTERVAL = float(os.getenv('SSE_KEEP_ALIVE_INTERVAL', 15))
+
 
 def load_pipelines_from_folder(folder_path):
     pipelines = {}
@@ -38,11 +49,23 @@ def load_pipelines_from_folder(folder_path):
     return pipelines
 
 
+def load_pipeline_concurrency_limits(folder_path):
+    return {
+        pipeline_id: pipeline["config"]["max_concurrent_jobs"]
+        for pipeline_id, pipeline in load_pipelines_from_folder(folder_path).items()
+        if "max_concurrent_jobs" in pipeline["config"]
+    }
+
+
 class WebCreator:
     def __init__(self):
         self.app = Flask(__name__, static_folder='./generation_pipelines/components', static_url_path='/static')
         self.app.register_blueprint(Blueprint('generated', __name__, static_folder='../generated'))
-        self.job_manager = JobManager()
+        self.job_manager = JobManager(
+            max_concurrent_jobs=MAX_CONCURRENT_JOBS,
+            pipeline_concurrency=load_pipeline_concurrency_limits(PIPELINE_FOLDER_PATH),
+            store=create_job_store()
+        )
         self.register_routes()
 
         CORS(self.app)
@@ -55,8 +78,10 @@ class WebCreator:
 
     def register_routes(self):
         self.app.add_url_rule('/ok', view_func=self.ok, methods=['GET'])
+        self.app.add_url_rule('/metrics', view_func=self.metrics, methods=['GET'])
         self.app.add_url_rule('/generate', view_func=self.generate, methods=['POST'])
         self.app.add_url_rule('/status/<job_id>', view_func=self.job_status_stream, methods=['GET'])
+        self.app.add_url_rule('/resume/<job_id>', view_func=self.resume_job, methods=['POST'])
         self.app.add_url_rule('/pipelines', view_func=self.get_pipelines, methods=['GET'])
         self.app.add_url_rule('/pipeline/<pipeline_id>', view_func=self.get_pipeline_by_id, methods=['GET'])
         self.app.add_url_rule('/pipeline-steps', view_func=self.get_pipeline_steps, methods=['GET'])
@@ -72,6 +97,10 @@ class WebCreator:
         except Exception as e:
             return jsonify({"error": str(e)}), 400
 
+    @staticmethod
+    def metrics():
+        return Response(telemetry.render(), mimetype='text/plain; version=0.0.4')
+
     def create_pipeline(self, pipeline_id, job_id, job_folder, initial_params):
         print(f"Creating pipeline: {pipeline_id}")
         pipelines = load_pipelines_from_folder(PIPELINE_FOLDER_PATH)
@@ -96,7 +125,8 @@ class WebCreator:
             steps_folder=PIPELINE_STEP_FOLDER_PATH,
             pipelines_folder=PIPELINE_FOLDER_PATH,
             initial_params=initial_params,
-            pipeline_context=pipeline_context
+            pipeline_context=pipeline_context,
+            checkpoint_folder=os.path.join(job_folder, CHECKPOINTS_FOLDER_NAME)
         )
 
         print(f"Pipeline created: {pipeline}")
@@ -104,6 +134,8 @@ class WebCreator:
         return pipeline
 
     def generate(self):
+        if not self.job_manager.accepting_jobs:
+            return jsonify({"error": "The server is shutting down"}), 503
         try:
             # Extract pipeline ID
             pipeline_id = request.form.get("pipelineId")
@@ -150,49 +182,74 @@ class WebCreator:
             print(e)
             return jsonify({"error": str(e)}), 400
 
+    def resume_job(self, job_id):
+        """Run a failed job again; the steps it completed are restored from their checkpoints."""
+        if not self.job_manager.accepting_jobs:
+            return jsonify({"error": "The server is shutting down"}), 503
+
+        job = self.job_manager.get_job_status(job_id)
+        if not job:
+            return jsonify({"error": "Job not found"}), 404
+        if job.status != JobStatus.ERROR:
+            return jsonify({"error": f"Only failed jobs can be resumed, the job is {job.status.value}"}), 409
+
+        try:
+            record = self.job_manager.store.get(job_id)
+            if record is None or record.params is None:
+                raise ValueError("The job can't be recreated")
+            job = self.recreate_job(record)
+            job.push_update('Job resumed')
+            self.job_manager.add_job(job)
+            return jsonify({"job_id": job_id}), 200
+        except Exception as e:
+            print(e)
+            return jsonify({"error": str(e)}), 400
+
     def job_status_stream(self, job_id):
         job = self.job_manager.get_job_status(job_id)
         if not job:
             return jsonify({"error": "Job not found"}), 404
 
+        # A reconnecting EventSource sends the ID of the last event it received, so it only gets what it missed
+        try:
+            last_event_id = int(request.headers.get('Last-Event-ID', 0))
+        except ValueError:
+            last_event_id = 0
+        if last_event_id > job.updates.last_sequence:
+            # The ID isn't from this job's stream (e.g. the server was restarted), so start over
+            last_event_id = 0
+
         def generate():
-            while True:
-                job = self.job_manager.get_job_status(job_id)  # Refresh job status every loop
-                updates = []
-
-                # Collect all new updates
-                while job.updates:
-                    update = job.updates.pop(0)
-                    updates.append(update)
-
-                if updates:
-                    # Send the status along with the new updates as an array
-                    data = {
-                        "status": job.status.value,
-                        "updates": updates
-                    }
-                    # If the job is completed, send the result as well
-                    if job.status == JobStatus.COMPLETED:
-                        result = job.result
-                        print(f"Job result: {result}")
-                        if 'url' in job.result:
-                            url = job.result.get('url')
-                            print(f"Sending URL: {url}")
-                            data["result"] = url
-                            data["result_type"] = "url"
-                        else:
-                            print(f"Sending result: {result}")
-                            data["result"] = job.result
-                            data["result_type"] = "json"
-                    print(f"Sending new updates: {data}")
-                    yield f"data: {json.dumps(data)}\n\n"
-
-                # Break the loop if the job is completed or errored
-                if job.status in [JobStatus.COMPLETED, JobStatus.ERROR]:
-                    time.sleep(1)
-                    break
-
-                time.sleep(0.3)  # Adjust sleep time as necessary
+            sequence = last_event_id
+            while not job.updates.is_done(sequence):
+                # Wait for the job to publish updates without holding a thread (the stream runs in a greenlet on
+                # the server's loop); the timeout only sends a keep-alive to detect closed connections
+                entries = await_(job.updates.wait_async(sequence, timeout=SSE_KEEP_ALIVE_INTERVAL))
+                if not entries:
+                    yield ": keep-alive\n\n"
+                    continue
+
+                sequence = entries[-1][0]
+                # Send the status along with the new updates as an array
+                data = {
+                    "status": job.status.value,
+                    "updates": [update for _, update in entries]
+                }
+                # If the job is completed, send the result as well
+                if job.status == JobStatus.COMPLETED:
+                    result = job.result
+                    print(f"Job result: {result}")
+                    if 'url' in job.result:
+                        url = job.result.get('url')
+                        print(f"Sending URL: {url}")
+                        data["result"] = url
+                        data["result_type"] = "url"
+                    else:
+                        print(f"Sending result: {result}")
+                        data["result"] = job.result
+                        data["result_type"] = "json"
+                print(f"Sending new updates: {data}")
+                yield f"id: {sequence}\ndata: {json.dumps(data)}\n\n"
 
         return Response(generate(), mimetype='text/event-stream')
 
@@ -242,12 +299,8 @@ class WebCreator:
             if not os.path.exists(folder_path):
                 return jsonify({"error": "Folder not found"}), 404
 
-            for file in os.listdir(folder_path):
-                file_path = os.path.join(folder_path, file)
-                if os.path.isfile(file_path):
-                    os.remove(file_path)
-
-            os.rmdir(folder_path)
+            # The folder also holds the checkpoints of the job's steps
+            shutil.rmtree(folder_path)
             return jsonify({"message": "Folder deleted"}), 200
         except Exception as e:
             print(e)
@@ -268,6 +321,23 @@ class WebCreator:
             print(e)
             return jsonify({"error": str(e)}), 400
 
-    def run(self, host="0.0.0.0", port=4003):
+    def recreate_job(self, record):
+        job_folder = os.path.join(GENERATED_FOLDER, record.job_id)
+        os.makedirs(job_folder, exist_ok=True)
+        return self.create_pipeline(record.pipeline_id, record.job_id, job_folder, record.params)
+
+    def start(self):
+        warm_up_browser_pool()
         self.job_manager.start_worker_thread()
-        self.app.run(host=host, port=port, debug=True)
+        self.job_manager.recover_jobs(self.recreate_job)
+
+    def stop(self):
+        print("Waiting for the jobs in flight to finish...")
+        self.job_manager.drain(timeout=SERVER_SHUTDOWN_TIMEOUT)
+
+    def asgi_app(self):
+        return AsgiApp(self.app, on_startup=[self.start], on_shutdown=[self.stop])
+
+    def run(self, host="0.0.0.0", port=4003):
+        # Jobs and their status streams live in the server's memory, so it always runs in a single process
+        serve(self.asgi_app(), host=host, port=port, workers=1)
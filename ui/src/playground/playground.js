@@ -11,6 +11,7 @@ import '@spectrum-web-components/split-button/sp-split-button.js';
 import '@spectrum-web-components/progress-circle/sp-progress-circle.js';
 import '@spectrum-web-components/combobox/sp-combobox.js';
 import '@spectrum-web-components/textfield/sp-textfield.js';
+import '@spectrum-web-components/checkbox/sp-checkbox.js';
 
 import './webgl-overlay.js';
 
@@ -143,6 +144,7 @@ export class MystiquePlayground extends LitElement {
   
   @state() accessor selectedElement = null;
   @state() accessor prompt = '';
+  @state() accessor pageEdited = false;
   
   @state() accessor busy = false;
   @state() accessor statusMessage = 'Ready!';
@@ -218,6 +220,10 @@ export class MystiquePlayground extends LitElement {
     this.prompt = event.target.value;
   }
   
+  setPageEdited(event) {
+    this.pageEdited = event.target.checked;
+  }
+  
   async selectBlock() {
     this.style.display = 'none';
     this.selectedElement = await selectBlock();
@@ -245,7 +251,8 @@ export class MystiquePlayground extends LitElement {
       '?url=' + encodeURIComponent(window.location.href) +
       '&prompt=' + encodeURIComponent(this.prompt) +
       '&selector=' + encodeURIComponent(generateCssSelector(this.selectedElement)) +
-      '&strategy=' + selectedStrategyId;
+      '&strategy=' + selectedStrategyId +
+      '&bypassCache=' + this.pageEdited;
     
     const eventSource = new EventSource(url);
     
@@ -329,6 +336,9 @@ export class MystiquePlayground extends LitElement {
                         .value=${this.prompt}
                     ></sp-textfield>
                   </div>
+                  <sp-checkbox ?checked=${this.pageEdited} @change=${this.setPageEdited}>
+                    The page was edited since the last generation (scrape it again)
+                  </sp-checkbox>
                 </div>
               </div>
             </div>